@@ -4,22 +4,135 @@ AI-powered tool to simplify complex legal documents
 """
 import streamlit as st
 import os
+import hashlib
 import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
+from typing import Optional
 from datetime import datetime
 
 # Add src directory to path for imports
 sys.path.append(str(Path(__file__).parent / "src"))
 
 from src.utils.document_processor import DocumentProcessor
-from src.utils.ai_analyzer import LegalDocumentAnalyzer
+from src.utils.ai_analyzer import LegalDocumentAnalyzer, get_default_cache
+from src.utils.risk_scanner import scan_red_flags
+from src.utils.template_index import get_default_template_index
+from src.utils.token_budget import new_token_budget
+from src.utils.tracing import get_tracer, start_metrics_server
 from src.components.ui_components import (
     render_document_upload, render_document_info, render_analysis_tabs,
     render_chat_interface, render_document_stats, render_sidebar,
     render_loading_spinner, render_error_message, render_success_message,
-    render_info_message
+    render_info_message, render_quota_status, render_report_download,
+    render_extraction_progress, render_token_usage, render_admin_panel, render_revision_changes,
+    render_risk_flags
 )
 
+# Analyzed versions kept per session as candidates for revision analysis
+SESSION_VERSIONS = 5
+
+
+@st.cache_resource
+def get_document_processor() -> DocumentProcessor:
+    """One document processor shared by every session"""
+    return DocumentProcessor()
+
+
+@st.cache_resource
+def get_ai_analyzer(api_key: str) -> LegalDocumentAnalyzer:
+    """One analyzer (and model client) per API key, shared by every session"""
+    return LegalDocumentAnalyzer(api_key)
+
+
+@st.cache_resource
+def start_metrics_export():
+    """Serve Prometheus metrics on METRICS_PORT, once per process, when it is set"""
+    port = os.getenv('METRICS_PORT')
+    return start_metrics_server(int(port)) if port else None
+
+
+class ExtractedDocumentCache:
+    """
+    Extracted documents keyed by content hash, shared by every session
+
+    Extraction streams pages into the UI, so it runs outside st.cache_data (which
+    cannot replay writes to placeholders) and finished results are kept here.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str, file_name: str):
+        with self._lock:
+            doc_info = self._documents.get((content_hash, file_name))
+            if doc_info is not None:
+                self._documents.move_to_end((content_hash, file_name))
+            return doc_info
+
+    def put(self, content_hash: str, file_name: str, doc_info: dict):
+        with self._lock:
+            self._documents[(content_hash, file_name)] = doc_info
+            self._documents.move_to_end((content_hash, file_name))
+            while len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+
+
+@st.cache_resource
+def get_extracted_documents() -> ExtractedDocumentCache:
+    return ExtractedDocumentCache()
+
+
+def uploaded_file_hash(uploaded_file) -> str:
+    """SHA-256 of an uploaded file, computed once per upload rather than on every rerun"""
+    if st.session_state.get('upload_file_id') != uploaded_file.file_id:
+        # getvalue() returns the upload's own buffer without copying it
+        st.session_state.upload_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        st.session_state.upload_file_id = uploaded_file.file_id
+    return st.session_state.upload_hash
+
+
+def complete_analysis(content_hash: str, file_name: str, document_text: str, doc_type: str, analysis_results: dict):
+    """Store a finished analysis, remembering the analyzed version for later revisions"""
+    st.session_state.analysis_results = analysis_results
+    st.session_state.doc_type = doc_type
+    st.session_state.analyzed_at = datetime.now()
+    st.session_state.analysis_complete = True
+    st.session_state.analyzed_version = {
+        'hash': content_hash, 'file_name': file_name, 'text': document_text,
+        'doc_type': doc_type, 'results': analysis_results
+    }
+    # Later uploads in this session may be revisions of any recent version, newest first
+    versions = [version for version in st.session_state.get('analyzed_versions', []) if version['hash'] != content_hash]
+    st.session_state.analyzed_versions = [st.session_state.analyzed_version] + versions[:SESSION_VERSIONS - 1]
+
+
+def find_previous_version(ai_analyzer: LegalDocumentAnalyzer, content_hash: str,
+                          document_text: str) -> Optional[dict]:
+    """
+    Earlier analyzed version of an upload, when the upload looks like a revision of it
+    
+    Only versions analyzed in this session are candidates, newest first, so the
+    "What Changed" view never shows text from anyone else's documents. Looked up
+    once per upload.
+    """
+    if st.session_state.get('previous_version_hash') != content_hash:
+        previous = None
+        for candidate in st.session_state.get('analyzed_versions', []):
+            if candidate['hash'] == content_hash:
+                continue
+            # Identical text needs no revision, and a mostly different one is not a revision
+            changes = ai_analyzer.patchable_changes(candidate['text'], document_text)
+            if changes:
+                previous = dict(candidate, changes=len(changes))
+                break
+        st.session_state.previous_version = previous
+        st.session_state.previous_version_hash = content_hash
+    return st.session_state.previous_version
+
 
 def main():
     """Main application function"""
@@ -85,13 +198,17 @@ def main():
     """, unsafe_allow_html=True)
     
     # Render sidebar
-    render_sidebar()
+    render_sidebar(response_cache=get_default_cache() is not None,
+                   template_reuse=get_default_template_index() is not None)
+    start_metrics_export()
     
     # Initialize session state
     if 'document_processed' not in st.session_state:
         st.session_state.document_processed = False
     if 'analysis_complete' not in st.session_state:
         st.session_state.analysis_complete = False
+    if 'token_budget' not in st.session_state:
+        st.session_state.token_budget = new_token_budget(session=True)
     
     # Check for API key (Streamlit Cloud or local .env)
     api_key = None
@@ -122,21 +239,43 @@ def main():
         st.stop()
     
     try:
-        # Initialize processors
-        doc_processor = DocumentProcessor()
-        ai_analyzer = LegalDocumentAnalyzer(api_key)
+        # Initialize processors (created once per process, not on every rerun);
+        # each session's model calls are charged to its own token budget
+        ai_analyzer = get_ai_analyzer(api_key).with_budget(st.session_state.token_budget)
+        if ai_analyzer.rate_limiter is not None:
+            render_quota_status(ai_analyzer.rate_limiter.metrics())
+        render_token_usage(st.session_state.token_budget.metrics())
         
         # Step 1: Document Upload
         uploaded_file = render_document_upload()
         
         if uploaded_file is not None:
             try:
-                # Process the uploaded document
-                with render_loading_spinner("Processing document..."):
-                    file_content = uploaded_file.read()
-                    doc_info = doc_processor.process_document(file_content, uploaded_file.name)
-                    st.session_state.doc_info = doc_info
-                    st.session_state.document_processed = True
+                # Process the uploaded document (reruns reuse the extracted text)
+                content_hash = uploaded_file_hash(uploaded_file)
+                doc_info = get_extracted_documents().get(content_hash, uploaded_file.name)
+                early_doc_type = None
+                if doc_info is None:
+                    # Pages are shown and the type detected while the rest is still parsing
+                    doc_info, early_doc_type = render_extraction_progress(
+                        get_document_processor(), uploaded_file, uploaded_file.name,
+                        ai_analyzer.get_document_type
+                    )
+                    get_extracted_documents().put(content_hash, uploaded_file.name, doc_info)
+                if st.session_state.get('doc_type_hash') != content_hash:
+                    st.session_state.doc_type = early_doc_type or ai_analyzer.get_document_type(doc_info['prompt_text'])
+                    st.session_state.doc_type_hash = content_hash
+                if st.session_state.get('red_flags_hash') != content_hash:
+                    # Scans the original text, so excerpts quote the document as written
+                    st.session_state.red_flags = scan_red_flags(doc_info['text'])
+                    st.session_state.red_flags_hash = content_hash
+                red_flags = st.session_state.red_flags
+                previous_info = st.session_state.get('doc_info')
+                if previous_info is not None and previous_info['prompt_text'] != doc_info['prompt_text']:
+                    # The session moved on to another document, so its pinned copy can go
+                    ai_analyzer.release_document(previous_info['prompt_text'])
+                st.session_state.doc_info = doc_info
+                st.session_state.document_processed = True
                 
                 render_success_message("Document processed successfully!")
                 
@@ -145,90 +284,130 @@ def main():
                 render_document_stats(doc_info)
                 
                 # Step 2: AI Analysis
+                stream_analysis = False
                 if st.session_state.document_processed:
                     st.markdown("---")
                     
+                    # Check the analysis against the session's token budget before anything is sent
+                    if st.session_state.get('token_estimate_hash') != content_hash:
+                        st.session_state.token_estimate = ai_analyzer.estimate_analysis_tokens(doc_info['prompt_text'])
+                        st.session_state.token_estimate_hash = content_hash
+                    token_estimate = st.session_state.token_estimate
+                    remaining_tokens = st.session_state.token_budget.remaining()
+                    over_budget = remaining_tokens is not None and token_estimate > remaining_tokens
+                    
+                    # A revision of an analyzed document can be re-analyzed from its changes alone
+                    analyzed_version = st.session_state.get('analyzed_version')
+                    analyzed = analyzed_version is not None and analyzed_version['hash'] == content_hash
+                    previous_version = None if analyzed else find_previous_version(
+                        ai_analyzer, content_hash, doc_info['prompt_text']
+                    )
+                    
+                    # Red flags from the local scan are shown at once, before any AI call
+                    quick_scan = st.empty()
+                    if not analyzed:
+                        with quick_scan.container():
+                            st.subheader("⚡ Quick Red-Flag Scan")
+                            render_risk_flags(red_flags)
+                    
                     # Show document type detection
                     with st.container():
                         col1, col2 = st.columns([2, 1])
                         with col1:
-                            if st.button("🚀 Start AI Analysis", type="primary", use_container_width=True):
-                                with render_loading_spinner("Analyzing document with AI... This may take a moment."):
-                                    try:
-                                        # Get document type
-                                        doc_type = ai_analyzer.get_document_type(doc_info['text'])
-                                        
-                                        # Perform comprehensive analysis
-                                        analysis_results = ai_analyzer.comprehensive_analysis(doc_info['text'])
+                            st.caption(f"🔢 Estimated cost: about {token_estimate:,} tokens")
+                            if ai_analyzer.analysis_mode != 'sections':
+                                # The combined JSON response can't be split into tabs in order while it streams
+                                st.caption("⏳ All tabs are generated in one request and appear together "
+                                           "once it finishes.")
+                            if over_budget:
+                                st.warning(f"This analysis needs about {token_estimate:,} tokens, but only "
+                                           f"{remaining_tokens:,} are left in this session's budget.")
+                            if st.button("🚀 Start AI Analysis", type="primary", use_container_width=True,
+                                         disabled=over_budget):
+                                if ai_analyzer.analysis_mode == 'sections':
+                                    # Per-section prompts are streamed straight into the tabs below
+                                    stream_analysis = True
+                                else:
+                                    with render_loading_spinner("Analyzing document with AI... Results appear once the whole analysis is ready."):
+                                        try:
+                                            # Get document type and perform comprehensive analysis concurrently
+                                            doc_type, analysis_results = ai_analyzer.analyze_with_document_type(doc_info['prompt_text'])
+                                            complete_analysis(content_hash, uploaded_file.name, doc_info['prompt_text'],
+                                                              doc_type, analysis_results)
                                         
-                                        st.session_state.analysis_results = analysis_results
-                                        st.session_state.doc_type = doc_type
-                                        st.session_state.analysis_complete = True
+                                            render_success_message("Analysis completed!")
                                         
-                                        render_success_message("Analysis completed!")
+                                        except Exception as e:
+                                            render_error_message(f"Analysis failed: {str(e)}")
+                            
+                            if previous_version is not None:
+                                changed = previous_version['changes']
+                                st.caption(f"🔄 This looks like a revision of {previous_version['file_name']} "
+                                           f"({changed:,} changed passage{'s' if changed != 1 else ''})")
+                                if st.button("🔄 Re-analyze Changes Only", use_container_width=True):
+                                    with render_loading_spinner("Analyzing what changed..."):
+                                        try:
+                                            revision = ai_analyzer.revision_analysis(
+                                                previous_version['text'], previous_version['doc_type'],
+                                                previous_version['results'], doc_info['prompt_text']
+                                            )
+                                            complete_analysis(content_hash, uploaded_file.name, doc_info['prompt_text'],
+                                                              revision.doc_type, revision.results)
+                                            st.session_state.revision = {
+                                                'hash': content_hash, 'analysis': revision,
+                                                'previous_name': previous_version['file_name']
+                                            }
+                                            
+                                            render_success_message("Changes analyzed!")
                                         
-                                    except Exception as e:
-                                        render_error_message(f"Analysis failed: {str(e)}")
+                                        except Exception as e:
+                                            render_error_message(f"Analysis failed: {str(e)}")
                         
                         with col2:
                             if st.session_state.get('doc_type'):
                                 st.info(f"📄 **Document Type**: {st.session_state.doc_type}")
                 
                 # Step 3: Display Analysis Results
-                if st.session_state.analysis_complete:
+                if stream_analysis:
+                    st.markdown("---")
+                    doc_type_stream, section_streams = ai_analyzer.stream_analysis_with_document_type(doc_info['prompt_text'])
+                    analysis_results = render_analysis_tabs(section_streams, red_flags)
+                    doc_type = ''.join(doc_type_stream)
+                    ai_analyzer.index_analysis(doc_info['prompt_text'], doc_type, analysis_results)
+                    complete_analysis(content_hash, uploaded_file.name, doc_info['prompt_text'], doc_type,
+                                      analysis_results)
+                    # Rerun so the document type, chat and report render from session state
+                    st.rerun()
+                
+                # Results are only shown for the document they were produced for
+                analyzed_version = st.session_state.get('analyzed_version')
+                if st.session_state.analysis_complete and analyzed_version and analyzed_version['hash'] == content_hash:
+                    # The risks tab shows the red flags from here on
+                    quick_scan.empty()
+                    revision = st.session_state.get('revision')
+                    if revision is not None and revision['hash'] == content_hash:
+                        st.markdown("---")
+                        render_revision_changes(revision['analysis'], revision['previous_name'])
+                    
                     st.markdown("---")
-                    render_analysis_tabs(st.session_state.analysis_results)
+                    render_analysis_tabs(st.session_state.analysis_results, red_flags)
                     
                     # Step 4: Q&A Chat Interface
                     st.markdown("---")
-                    render_chat_interface(doc_info['text'], ai_analyzer)
+                    # Build the clause retrieval index once per document
+                    text_hash = hashlib.sha256(doc_info['prompt_text'].encode('utf-8')).hexdigest()
+                    if st.session_state.get('clause_index_hash') != text_hash:
+                        st.session_state.clause_index = ai_analyzer.build_clause_index(doc_info['prompt_text'])
+                        st.session_state.clause_index_hash = text_hash
+                    render_chat_interface(doc_info['prompt_text'], ai_analyzer, st.session_state.clause_index)
                     
                     # Download analysis report
                     st.markdown("---")
-                    st.subheader("📄 Download Analysis Report")
-                    
-                    # Create a text report
-                    report = f"""
-LEGAL DOCUMENT ANALYSIS REPORT
-==============================
-
-Document: {doc_info['file_name']}
-Type: {st.session_state.get('doc_type', 'Unknown')}
-Word Count: {doc_info['word_count']:,}
-Analysis Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-SUMMARY
--------
-{st.session_state.analysis_results.get('summary', 'Not available')}
-
-KEY TERMS & CLAUSES
--------------------
-{st.session_state.analysis_results.get('key_terms', 'Not available')}
-
-RISKS & RED FLAGS
------------------
-{st.session_state.analysis_results.get('risks', 'Not available')}
-
-PLAIN ENGLISH EXPLANATION
---------------------------
-{st.session_state.analysis_results.get('plain_english', 'Not available')}
-
-RECOMMENDED ACTIONS
--------------------
-{st.session_state.analysis_results.get('action_items', 'Not available')}
-
-DISCLAIMER
-----------
-This analysis is provided for informational purposes only and should not replace 
-professional legal advice. Always consult with a qualified attorney for important legal matters.
-                    """
-                    
-                    st.download_button(
-                        label="📥 Download Analysis Report",
-                        data=report,
-                        file_name=f"legal_analysis_{doc_info['file_name'].split('.')[0]}.txt",
-                        mime="text/plain",
-                        use_container_width=True
+                    render_report_download(
+                        doc_info,
+                        st.session_state.get('doc_type', 'Unknown'),
+                        st.session_state.analysis_results,
+                        st.session_state.get('analyzed_at', datetime.now())
                     )
             
             except Exception as e:
@@ -278,6 +457,10 @@ professional legal advice. Always consult with a qualified attorney for importan
     except Exception as e:
         render_error_message(f"Application error: {str(e)}")
         st.write("Please check your API key and try refreshing the page.")
+    
+    # Rendered last so it includes the stages of this run
+    if os.getenv('ADMIN_PANEL', 'off').lower() in ('on', '1', 'true'):
+        render_admin_panel(get_tracer())
 
 
 if __name__ == "__main__":
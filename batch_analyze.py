@@ -0,0 +1,277 @@
+"""
+Headless batch analysis for Legal Reader
+
+Walks a directory of legal documents, extracts each one and runs the full
+analysis through a bounded worker pool. Model calls share the quota-aware rate
+limiter, so throughput is set by the API quota rather than by document order.
+Each result is appended to a JSONL file as soon as its document completes, which
+doubles as the checkpoint for --resume: documents without a successful record
+are analyzed again and the newer record is appended.
+
+Usage:
+    python batch_analyze.py contracts/ --output results.jsonl
+    python batch_analyze.py contracts/ --output results.parquet --workers 8
+    python batch_analyze.py contracts/ --output results.jsonl --resume
+    python batch_analyze.py contracts/ --output results.jsonl --mock
+"""
+import argparse
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+# Add src directory to path for imports
+sys.path.append(str(Path(__file__).parent / "src"))
+
+from src.utils.document_processor import DocumentProcessor
+from src.utils.ai_analyzer import LegalDocumentAnalyzer, is_analysis_error
+
+SECTIONS = ['summary', 'key_terms', 'risks', 'plain_english', 'action_items']
+PARQUET_BATCH_ROWS = 500
+
+
+def find_documents(input_dir: Path, extensions: Set[str], recursive: bool = True) -> List[Path]:
+    """Supported documents under input_dir, in a stable order"""
+    pattern = '**/*' if recursive else '*'
+    return sorted(path for path in input_dir.glob(pattern) if path.is_file() and path.suffix.lower() in extensions)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_checkpoint(jsonl_path: Path) -> Set[Tuple[str, str]]:
+    """(path, sha256) of documents already analyzed successfully; a torn last line is ignored"""
+    completed = set()
+    if not jsonl_path.exists():
+        return completed
+    with open(jsonl_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok':
+                completed.add((record['path'], record['sha256']))
+    return completed
+
+
+def analyze_file(path: Path, input_dir: Path, processor: DocumentProcessor,
+                 analyzer: LegalDocumentAnalyzer) -> Dict[str, Any]:
+    """
+    Extract and analyze one document
+
+    Failures are recorded in the result instead of raised, so one bad file never
+    stops the batch. Records always have the same fields (for Parquet output).
+    """
+    start = time.perf_counter()
+    record: Dict[str, Any] = {
+        'path': path.relative_to(input_dir).as_posix(),
+        'sha256': file_sha256(path),
+        'file_type': path.suffix.lower(),
+        'word_count': None,
+        'estimated_tokens': None,
+        'prompt_tokens': None,
+        'document_type': None,
+        **{section: None for section in SECTIONS},
+        'status': 'ok',
+        'error': None,
+    }
+
+    try:
+        doc_info = processor.process_document(path)
+        record['word_count'] = doc_info['word_count']
+        record['estimated_tokens'] = doc_info['estimated_tokens']
+        record['prompt_tokens'] = doc_info['prompt_tokens']
+        if not doc_info['text']:
+            raise ValueError("No text could be extracted from the document")
+
+        doc_type, results = analyzer.analyze_with_document_type(doc_info['prompt_text'])
+        record['document_type'] = doc_type
+        record.update({section: results.get(section) for section in SECTIONS})
+
+        errors = [results.get(section) or f"No {section} result was returned" for section in SECTIONS
+                  if not results.get(section) or is_analysis_error(results[section])]
+        if errors:
+            # Partial results are kept, but the document is retried on --resume
+            record['status'] = 'error'
+            record['error'] = errors[0]
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+
+    record['elapsed_s'] = round(time.perf_counter() - start, 3)
+    record['analyzed_at'] = datetime.now().isoformat(timespec='seconds')
+    return record
+
+
+def run_pool(paths: List[Path], workers: int, task) -> Iterator[Dict[str, Any]]:
+    """
+    Run task over paths with at most workers documents in flight, yielding results as they finish
+
+    Documents are submitted as slots free up, so a large batch never holds more
+    than a handful of extracted texts in memory.
+    """
+    remaining = iter(paths)
+    pending: Set[Future] = set()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            while len(pending) < workers:
+                path = next(remaining, None)
+                if path is None:
+                    break
+                pending.add(executor.submit(task, path))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # Don't wait for queued documents when interrupted; they are picked up on --resume
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def write_parquet(jsonl_path: Path, parquet_path: Path):
+    """Convert the JSONL results to Parquet in batches"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+
+    schema = pa.schema(
+        [('path', pa.string()), ('sha256', pa.string()), ('file_type', pa.string()),
+         ('word_count', pa.int64()), ('estimated_tokens', pa.int64()), ('prompt_tokens', pa.int64()),
+         ('document_type', pa.string())]
+        + [(section, pa.string()) for section in SECTIONS]
+        + [('status', pa.string()), ('error', pa.string()), ('elapsed_s', pa.float64()), ('analyzed_at', pa.string())]
+    )
+
+    # Keep the latest record per document (a resumed run appends retries)
+    latest: Dict[str, int] = {}
+    with open(jsonl_path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file):
+            try:
+                latest[json.loads(line)['path']] = number
+            except ValueError:
+                continue
+    keep = set(latest.values())
+
+    batch: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(str(parquet_path), schema) as writer:
+        with open(jsonl_path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file):
+                if number in keep:
+                    batch.append(json.loads(line))
+                if len(batch) >= PARQUET_BATCH_ROWS:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def build_analyzer(args: argparse.Namespace) -> LegalDocumentAnalyzer:
+    if not args.mock:
+        return LegalDocumentAnalyzer(max_concurrency=args.max_concurrency, analysis_mode=args.analysis_mode)
+
+    from src.utils.ai_analyzer import ResponseCache
+    from src.utils.llm_backends import MockBackend, LatencyDistribution
+    from src.utils.rate_limiter import QuotaRateLimiter
+    from src.utils.template_index import TemplateIndex
+    backend = MockBackend(latency=LatencyDistribution.lognormal(args.mock_latency, 0.3) if args.mock_latency > 0 else None)
+    # No API quota applies to the mock backend
+    unlimited = QuotaRateLimiter(requests_per_minute=None, requests_per_day=None, tokens_per_minute=None)
+    # Mock responses are kept in memory for this run only, so they never reach the
+    # on-disk caches that real Gemini analyses are served from
+    return LegalDocumentAnalyzer(backend=backend, max_concurrency=args.max_concurrency,
+                                 analysis_mode=args.analysis_mode, rate_limiter=unlimited,
+                                 response_cache=ResponseCache(':memory:'),
+                                 template_index=TemplateIndex(':memory:'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory of legal documents")
+    parser.add_argument("input_dir", help="Directory containing PDF, DOCX and TXT documents")
+    parser.add_argument("--output", required=True, help="Results file (.jsonl or .parquet)")
+    parser.add_argument("--workers", type=int, default=4, help="Documents analyzed at once")
+    parser.add_argument("--max-concurrency", type=int, help="Model calls in flight per document")
+    parser.add_argument("--analysis-mode", choices=['combined', 'sections'])
+    parser.add_argument("--no-recursive", action="store_true", help="Only analyze the top-level directory")
+    parser.add_argument("--resume", action="store_true", help="Skip documents already analyzed successfully")
+    parser.add_argument("--overwrite", action="store_true", help="Replace existing results")
+    parser.add_argument("--mock", action="store_true", help="Use the local mock backend (no API key needed; nothing is written to the response cache or template index)")
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="Median mock model latency in seconds")
+    args = parser.parse_args()
+
+    input_dir = Path(args.input_dir).resolve()
+    if not input_dir.is_dir():
+        parser.error(f"Not a directory: {args.input_dir}")
+
+    output = Path(args.output)
+    if output.suffix.lower() not in ('.jsonl', '.parquet'):
+        parser.error("--output must end in .jsonl or .parquet")
+    # Results always stream to JSONL first; Parquet is written from it at the end
+    jsonl_path = output if output.suffix.lower() == '.jsonl' else output.with_suffix('.jsonl')
+    if jsonl_path.exists() and not (args.resume or args.overwrite):
+        parser.error(f"{jsonl_path} already exists; pass --resume to continue it or --overwrite to replace it")
+
+    processor = DocumentProcessor()
+    analyzer = build_analyzer(args)
+
+    paths = find_documents(input_dir, processor.supported_formats, recursive=not args.no_recursive)
+    completed = load_checkpoint(jsonl_path) if args.resume else set()
+    if completed:
+        paths = [path for path in paths
+                 if (path.relative_to(input_dir).as_posix(), file_sha256(path)) not in completed]
+
+    total = len(paths)
+    print(f"📁 {total} documents to analyze ({len(completed)} already done) with {args.workers} workers",
+          file=sys.stderr)
+
+    start = time.perf_counter()
+    failures = 0
+    mode = 'a' if args.resume else 'w'
+    try:
+        with open(jsonl_path, mode, encoding='utf-8') as results_file:
+            task = lambda path: analyze_file(path, input_dir, processor, analyzer)
+            for done, record in enumerate(run_pool(paths, args.workers, task), start=1):
+                results_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                results_file.flush()
+
+                failures += record['status'] != 'ok'
+                elapsed = time.perf_counter() - start
+                rate = done / elapsed if elapsed else 0.0
+                eta = (total - done) / rate if rate else 0.0
+                icon = "✅" if record['status'] == 'ok' else "❌"
+                print(f"[{done}/{total}] {icon} {record['path']} ({record['elapsed_s']:.1f}s) "
+                      f"· {rate * 60:.1f} docs/min · ETA {eta:.0f}s", file=sys.stderr)
+                if record['error']:
+                    print(f"    {record['error']}", file=sys.stderr)
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted; run again with --resume to continue", file=sys.stderr)
+        sys.exit(130)
+
+    if output.suffix.lower() == '.parquet':
+        write_parquet(jsonl_path, output)
+        print(f"📦 Wrote {output}", file=sys.stderr)
+
+    if analyzer.rate_limiter is not None:
+        metrics = analyzer.rate_limiter.metrics()
+        print(f"📶 {metrics['requests']} model requests, {metrics['retries']} retries", file=sys.stderr)
+    print(f"🏁 {total - failures} succeeded, {failures} failed in {time.perf_counter() - start:.1f}s",
+          file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
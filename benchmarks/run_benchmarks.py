@@ -0,0 +1,301 @@
+"""
+End-to-end performance benchmarks for Legal Reader
+
+Times document extraction per format, the local red-flag scan and document-type
+classifier, prompt assembly and the full comprehensive analysis against the mock
+AI backend over a synthetic corpus, and writes p50/p95/p99 latency, throughput
+and peak memory as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py --pages 1 10 100 500 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Add the project root to the path for imports
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Benchmarks must measure real work, not hits in the on-disk response cache or template index
+os.environ['RESPONSE_CACHE'] = 'off'
+os.environ['TEMPLATE_REUSE'] = 'off'
+
+from benchmarks.synthetic_corpus import build_document, generate_pages
+from src.utils.document_processor import DocumentProcessor
+from src.utils.ai_analyzer import LegalDocumentAnalyzer, LOCAL_DOCUMENT_TYPE_TOKENS
+from src.utils.document_classifier import DocumentClassifier
+from src.utils.llm_backends import MockBackend, LatencyDistribution
+from src.utils.rate_limiter import QuotaRateLimiter
+from src.utils.risk_scanner import scan_red_flags
+from src.utils.template_index import TemplateIndex
+from src.utils.token_budget import truncate_to_tokens
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Linearly interpolated percentile (q in [0, 100])"""
+    ordered = sorted(samples)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    Time a function and measure its peak Python memory
+
+    Latency is taken from untraced runs; peak memory comes from one extra run
+    under tracemalloc, whose overhead would otherwise distort the timings.
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'peak_memory_mb': peak / (1024 * 1024),
+    }
+
+
+def unlimited_rate_limiter() -> QuotaRateLimiter:
+    """Keep retries for injected errors but never throttle against the real API quotas"""
+    return QuotaRateLimiter(requests_per_minute=None, requests_per_day=None, tokens_per_minute=None, base_delay=0.1)
+
+
+def bench_extraction(corpus_dir: Path, kind: str, pages: int, file_format: str, iterations: int,
+                     pdf_workers: Optional[int] = None) -> Dict[str, Any]:
+    path = build_document(kind, pages, file_format, corpus_dir)
+    file_content = path.read_bytes()
+    processor = DocumentProcessor(pdf_workers=pdf_workers)
+
+    result = measure(lambda: processor.process_document(file_content, path.name), iterations)
+    compaction = processor.process_document(file_content, path.name)['compacted'].stats
+    result.update({
+        'benchmark': 'extraction',
+        'format': file_format,
+        'file_bytes': len(file_content),
+        'prompt_token_reduction': compaction.reduction,
+        'throughput_pages_per_s': pages / (result['p50_ms'] / 1000),
+        'throughput_mb_per_s': len(file_content) / (1024 * 1024) / (result['p50_ms'] / 1000),
+    })
+    return result
+
+
+def bench_risk_scan(document_text: str, pages: int, iterations: int) -> Dict[str, Any]:
+    result = measure(lambda: scan_red_flags(document_text), iterations)
+    result.update({
+        'benchmark': 'risk_scan',
+        'red_flags': len(scan_red_flags(document_text)),
+        'throughput_pages_per_s': pages / (result['p50_ms'] / 1000),
+        'throughput_mb_per_s': len(document_text) / (1024 * 1024) / (result['p50_ms'] / 1000),
+    })
+    return result
+
+
+def bench_document_type(classifier: DocumentClassifier, document_text: str, iterations: int) -> Dict[str, Any]:
+    opening = truncate_to_tokens(document_text, LOCAL_DOCUMENT_TYPE_TOKENS)
+    result = measure(lambda: classifier.predict(opening), iterations)
+    prediction = classifier.predict(opening)
+    result.update({
+        'benchmark': 'document_type_local',
+        'document_type': prediction.label,
+        'confidence': prediction.confidence,
+    })
+    return result
+
+
+def bench_prompt_assembly(analyzer: LegalDocumentAnalyzer, document_text: str, pages: int,
+                          iterations: int) -> Dict[str, Any]:
+    def assemble():
+        if analyzer.is_long_document(document_text):
+            chunks = analyzer.chunker.chunk(document_text)
+            return [template.format(document_text=chunk.text) for chunk in chunks
+                    for template in analyzer.prompts.values()]
+        return [template.format(document_text=document_text) for template in analyzer.prompts.values()]
+
+    result = measure(assemble, iterations)
+    result.update({
+        'benchmark': 'prompt_assembly',
+        'throughput_pages_per_s': pages / (result['p50_ms'] / 1000),
+    })
+    return result
+
+
+def bench_analysis(backend: MockBackend, document_text: str, pages: int, iterations: int,
+                   analysis_mode: str) -> Dict[str, Any]:
+    analyzer = LegalDocumentAnalyzer(backend=backend, analysis_mode=analysis_mode, rate_limiter=unlimited_rate_limiter())
+    calls_before = len(backend.calls)
+
+    result = measure(lambda: analyzer.analyze_with_document_type(document_text), iterations)
+    runs = iterations + 2  # warmup and traced run included
+    result.update({
+        'benchmark': f'analysis_{analysis_mode}',
+        'model_calls_per_run': (len(backend.calls) - calls_before) / runs,
+        'throughput_pages_per_s': pages / (result['p50_ms'] / 1000),
+    })
+    return result
+
+
+def template_variant(document_text: str, seed: int = 1, fields: int = 12) -> str:
+    """The same document with its first few dollar amounts changed, like a reused contract template"""
+    rng = random.Random(seed)
+    return re.sub(r'\$[\d,]+', lambda match: f"${rng.randint(1000, 99999):,}", document_text, count=fields)
+
+
+def bench_template_reuse(backend: MockBackend, document_text: str, pages: int, iterations: int) -> Dict[str, Any]:
+    analyzer = LegalDocumentAnalyzer(backend=backend, analysis_mode='sections', rate_limiter=unlimited_rate_limiter(),
+                                     template_index=TemplateIndex(':memory:'))
+    analyzer.analyze_with_document_type(document_text)
+    variant = template_variant(document_text)
+    calls_before = len(backend.calls)
+
+    result = measure(lambda: analyzer.analyze_with_document_type(variant), iterations)
+    runs = iterations + 2  # warmup and traced run included
+    result.update({
+        'benchmark': 'analysis_template_reuse',
+        'model_calls_per_run': (len(backend.calls) - calls_before) / runs,
+        'throughput_pages_per_s': pages / (result['p50_ms'] / 1000),
+    })
+    return result
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus_dir = Path(args.corpus_dir) if args.corpus_dir else Path(tempfile.mkdtemp(prefix="legal_reader_corpus_"))
+    backend = MockBackend(
+        latency=LatencyDistribution.lognormal(args.mock_latency, 0.3) if args.mock_latency > 0 else None,
+        tokens_per_second=args.mock_tokens_per_second,
+        seed=args.seed
+    )
+    analyzer = LegalDocumentAnalyzer(backend=backend, rate_limiter=unlimited_rate_limiter())
+    classifier = DocumentClassifier()
+    results = []
+
+    for kind in args.kinds:
+        for pages in args.pages:
+            print(f"📄 {kind}, {pages} pages", file=sys.stderr)
+            document_text = "\n\n".join(generate_pages(kind, pages))
+            base = {'kind': kind, 'pages': pages, 'characters': len(document_text)}
+
+            for file_format in args.formats:
+                results.append({**base, **bench_extraction(corpus_dir, kind, pages, file_format, args.iterations,
+                                                           args.pdf_workers)})
+
+            results.append({**base, **bench_risk_scan(document_text, pages, args.iterations)})
+            results.append({**base, **bench_document_type(classifier, document_text, args.iterations)})
+            results.append({**base, **bench_prompt_assembly(analyzer, document_text, pages, args.iterations)})
+
+            for analysis_mode in args.analysis_modes:
+                results.append({**base, **bench_analysis(backend, document_text, pages, args.iterations, analysis_mode)})
+
+            results.append({**base, **bench_template_reuse(backend, document_text, pages, args.iterations)})
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'iterations': args.iterations,
+            'pdf_workers': args.pdf_workers,
+            'mock_latency_s': args.mock_latency,
+            'mock_tokens_per_second': args.mock_tokens_per_second,
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """Print p50 changes against a baseline run; returns the number of regressions"""
+    def key(result):
+        return (result['benchmark'], result['kind'], result['pages'], result.get('format'))
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = 0
+    for result in current['results']:
+        previous = baseline_results.get(key(result))
+        if previous is None or previous['p50_ms'] == 0:
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100
+        flag = ""
+        if change > threshold:
+            flag = "  ⚠️ regression"
+            regressions += 1
+        name = " ".join(str(part) for part in key(result) if part is not None)
+        print(f"{name:<45} {previous['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} ms ({change:+.1f}%){flag}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legal Reader performance benchmarks")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--kinds", nargs="+", default=['lease', 'loan'])
+    parser.add_argument("--formats", nargs="+", default=['.txt', '.docx', '.pdf'])
+    parser.add_argument("--analysis-modes", nargs="+", default=['combined', 'sections'])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--pdf-workers", type=int, help="PDF extraction processes (1 = serial; default PDF_WORKERS)")
+    parser.add_argument("--mock-latency", type=float, default=0.0,
+                        help="Median simulated model latency in seconds (0 measures app overhead only)")
+    parser.add_argument("--mock-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="Reuse generated documents from this directory")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON results to compare p50 latencies against")
+    parser.add_argument("--regression-threshold", type=float, default=10.0,
+                        help="Percent p50 slowdown reported as a regression")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        if compare(report, baseline, args.regression_threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
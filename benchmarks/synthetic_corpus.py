@@ -0,0 +1,221 @@
+"""
+Synthetic legal corpus generator for benchmarks
+
+Builds lease and loan agreements of any page count from the sample documents in
+data/sample_documents and writes them as TXT, DOCX or PDF.
+"""
+import random
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import docx
+
+SAMPLE_DIR = Path(__file__).parent.parent / "data" / "sample_documents"
+TEMPLATES = {
+    'lease': SAMPLE_DIR / "sample_lease_agreement.txt",
+    'loan': SAMPLE_DIR / "sample_loan_agreement.txt",
+}
+
+# Roughly one printed page of contract text
+CHARS_PER_PAGE = 3000
+LINE_WIDTH = 90
+LINES_PER_PDF_PAGE = 60
+
+HEADING_PATTERN = re.compile(r'^[A-Z][A-Z0-9 ,&/\'()\-]{2,80}:?$')
+
+FILLERS = {
+    'AMOUNT': lambda rng: f"{rng.randint(500, 250000):,}",
+    'PAYMENT_AMOUNT': lambda rng: f"{rng.randint(100, 5000):,}",
+    'RATE': lambda rng: f"{rng.uniform(2, 24):.2f}",
+    'MONTHS': lambda rng: str(rng.choice([12, 24, 36, 48, 60])),
+    'NUMBER': lambda rng: str(rng.randint(1, 8)),
+    'DAY': lambda rng: f"{rng.randint(1, 28)}th",
+    'DATE': lambda rng: f"{rng.choice(['January', 'March', 'June', 'September'])} {rng.randint(1, 28)}, 20{rng.randint(24, 30)}",
+    'STATE': lambda rng: rng.choice(['California', 'New York', 'Texas', 'Illinois']),
+}
+NAMES = ['Jordan Lee', 'Avery Patel', 'Morgan Chen', 'Riley Garcia', 'Casey Okafor', 'Taylor Novak']
+
+BOILERPLATE = [
+    "Each party shall perform its obligations under this Section in good faith and within a reasonable time.",
+    "Any notice required under this Section shall be given in writing to the addresses listed above.",
+    "Failure to enforce any provision of this Section shall not constitute a waiver of that provision.",
+    "The obligations in this Section survive termination or expiration of this Agreement.",
+    "If any part of this Section is held unenforceable, the remainder shall continue in full force and effect.",
+]
+
+
+def _template_sections(kind: str) -> List[Tuple[str, str]]:
+    """Split a sample template into (heading, body) pairs"""
+    sections, heading, body = [], None, []
+    for line in TEMPLATES[kind].read_text(encoding='utf-8').splitlines():
+        if HEADING_PATTERN.match(line.strip()):
+            if heading is not None:
+                sections.append((heading, "\n".join(body).strip()))
+            heading, body = line.strip().rstrip(':'), []
+        elif heading is not None:
+            body.append(line)
+    if heading is not None:
+        sections.append((heading, "\n".join(body).strip()))
+    return sections
+
+
+def _fill_placeholders(text: str, rng: random.Random) -> str:
+    def replace(match):
+        key = match.group(1)
+        if key in FILLERS:
+            return FILLERS[key](rng)
+        if 'NAME' in key:
+            return rng.choice(NAMES)
+        return key.replace('_', ' ').title()
+    return re.sub(r'\[([A-Z_/]+)\]', replace, text)
+
+
+def generate_pages(kind: str, pages: int, seed: int = 0) -> List[str]:
+    """
+    Generate the text of a synthetic agreement, one string per page
+
+    Args:
+        kind: 'lease' or 'loan'
+        pages: Number of pages to generate
+        seed: Seed so the same arguments always produce the same document
+
+    Returns:
+        List of page texts
+    """
+    if kind not in TEMPLATES:
+        raise ValueError(f"Unknown document kind: {kind}")
+
+    rng = random.Random(f"{kind}-{pages}-{seed}")
+    sections = _template_sections(kind)
+    title = sections[0][0]
+    result, section_number = [], 0
+
+    for page in range(pages):
+        parts = [title] if page == 0 else []
+        while sum(len(part) for part in parts) < CHARS_PER_PAGE:
+            heading, body = sections[1 + section_number % (len(sections) - 1)]
+            section_number += 1
+            extra = " ".join(rng.sample(BOILERPLATE, k=rng.randint(1, 3)))
+            parts.append(f"SECTION {section_number}. {heading}\n{_fill_placeholders(body, rng)}\n{extra}")
+        result.append("\n\n".join(parts))
+
+    return result
+
+
+def write_txt(page_texts: List[str], path: Path):
+    path.write_text("\n\n".join(page_texts), encoding='utf-8')
+
+
+def write_docx(page_texts: List[str], path: Path):
+    document = docx.Document()
+    for i, page_text in enumerate(page_texts):
+        if i:
+            document.add_page_break()
+        for paragraph in page_text.split("\n"):
+            document.add_paragraph(paragraph)
+    document.save(str(path))
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _wrap(text: str) -> List[str]:
+    lines = []
+    for paragraph in text.split("\n"):
+        words, current = paragraph.split(), ""
+        for word in words:
+            if current and len(current) + 1 + len(word) > LINE_WIDTH:
+                lines.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        lines.append(current)
+    return lines
+
+
+def write_pdf(page_texts: List[str], path: Path):
+    """Write a plain Helvetica PDF with a text layer (no external PDF library needed)"""
+    page_lines = []
+    for page_text in page_texts:
+        lines = _wrap(page_text)
+        # Overflowing text continues on extra physical pages
+        for start in range(0, len(lines), LINES_PER_PDF_PAGE):
+            page_lines.append(lines[start:start + LINES_PER_PDF_PAGE])
+
+    objects: Dict[int, bytes] = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i, lines in enumerate(page_lines):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_id} 0 R")
+        text_ops = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 760 Td {text_ops} ET".encode('latin-1', 'replace')
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode('ascii')
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode('ascii')
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+
+    xref_offset = len(output)
+    size = max(objects) + 1
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for object_id in range(1, size):
+        output += b"%010d 00000 n \n" % offsets[object_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset)
+    path.write_bytes(bytes(output))
+
+
+WRITERS = {'.txt': write_txt, '.docx': write_docx, '.pdf': write_pdf}
+
+
+def build_document(kind: str, pages: int, file_format: str, output_dir: Path, seed: int = 0) -> Path:
+    """
+    Generate a synthetic agreement and write it to output_dir
+
+    Files are reused if they already exist, so repeated benchmark runs skip generation.
+
+    Args:
+        kind: 'lease' or 'loan'
+        pages: Number of pages
+        file_format: '.txt', '.docx' or '.pdf'
+        output_dir: Directory for the generated file
+        seed: Generation seed
+
+    Returns:
+        Path of the generated file
+    """
+    if file_format not in WRITERS:
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"{kind}_{pages}p_seed{seed}{file_format}"
+    if not path.exists():
+        WRITERS[file_format](generate_pages(kind, pages, seed), path)
+    return path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic legal corpus")
+    parser.add_argument("--output-dir", default="benchmarks/corpus")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--kinds", nargs="+", default=list(TEMPLATES))
+    parser.add_argument("--formats", nargs="+", default=list(WRITERS))
+    args = parser.parse_args()
+
+    for kind in args.kinds:
+        for pages in args.pages:
+            for file_format in args.formats:
+                print(build_document(kind, pages, file_format, Path(args.output_dir)))
@@ -4,9 +4,22 @@ Streamlit components for the Legal Document Analyzer
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple, Union
 
+from src.utils.ai_analyzer import document_type_excerpt
+from src.utils.document_processor import source_size
+from src.utils.risk_scanner import RiskFlag
+from src.utils.tracing import span, traced
 
+PREVIEW_CHARS = 1000
+# Changed passages listed in the "What Changed" view
+MAX_SHOWN_CHANGES = 50
+SEVERITY_ICONS = {'high': '🔴', 'medium': '🟠', 'low': '🟡'}
+
+
+@traced()
 def render_document_upload() -> Any:
     """Render document upload component"""
     st.header("📄 Upload Legal Document")
@@ -21,6 +34,7 @@ def render_document_upload() -> Any:
     return uploaded_file
 
 
+@traced()
 def render_document_info(doc_info: Dict[str, Any]):
     """Render document information"""
     st.subheader("📊 Document Information")
@@ -36,14 +50,107 @@ def render_document_info(doc_info: Dict[str, Any]):
     with col3:
         st.metric("File Type", doc_info['file_type'].upper())
     
+    if 'estimated_tokens' in doc_info:
+        details = (f"{doc_info['line_count']:,} lines · {doc_info['sentence_count']:,} sentences · "
+                   f"{doc_info['clause_count']:,} clauses · ~{doc_info['estimated_tokens']:,} tokens")
+        if doc_info.get('encoding'):
+            details += f" · {doc_info['encoding']} encoding"
+        compacted = doc_info.get('compacted')
+        if compacted is not None and compacted.stats.reduction > 0:
+            stats = compacted.stats
+            details += (f" · ~{stats.compact_tokens:,} tokens sent after compaction "
+                        f"({stats.reduction:.0%} smaller: {stats.boilerplate_lines:,} header/footer lines, "
+                        f"{stats.duplicate_passages:,} repeated passages)")
+        st.caption(details)
+    
     # Show document preview
     with st.expander("📖 Document Preview"):
         preview_text = doc_info['text'][:1000] + "..." if len(doc_info['text']) > 1000 else doc_info['text']
         st.text_area("First 1000 characters:", preview_text, height=200, disabled=True)
 
 
-def render_analysis_tabs(analysis_results: Dict[str, str]):
-    """Render analysis results in tabs"""
+def render_extraction_progress(doc_processor, source: Any, file_name: str,
+                               detect_document_type: Optional[Callable[[str], str]] = None
+                               ) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Extract a document page by page, showing progress, an early preview and the
+    document type as soon as the opening pages are available
+    
+    Args:
+        doc_processor: DocumentProcessor used for extraction
+        source: File path, file-like object (such as the upload) or raw bytes
+        file_name: Name of the uploaded file
+        detect_document_type: Called with the document_type_excerpt of the prompt text to
+            identify the document type
+    
+    Returns:
+        Tuple of (document info, detected document type or None)
+    """
+    progress = st.progress(0.0, text="Processing document...")
+    preview = st.empty()
+    type_box = st.empty()
+    
+    with span('render_extraction_progress', file_type=doc_processor.get_file_extension(file_name),
+              bytes=source_size(source)) as current:
+        pages, opening, excerpt = [], "", None
+        doc_type, doc_type_future = None, None
+        executor = ThreadPoolExecutor(max_workers=1) if detect_document_type else None
+        try:
+            for page in doc_processor.iter_document_pages(source, file_name):
+                pages.append(page)
+                progress.progress(page.page_number / page.total_pages,
+                                  text=f"Extracting page {page.page_number} of {page.total_pages}...")
+                
+                if len(opening) < PREVIEW_CHARS:
+                    opening = doc_processor.join_pages(pages)[:PREVIEW_CHARS]
+                    if len(opening) == PREVIEW_CHARS:
+                        preview.text_area("Preview (first 1000 characters):", opening + "...", height=200, disabled=True)
+                
+                if executor is not None and doc_type_future is None:
+                    # Detect from the compacted opening, as the analysis will once extraction ends
+                    prompt_text = doc_processor.compact(doc_processor.join_pages(pages),
+                                                        [page.start for page in pages]).text
+                    if len(document_type_excerpt(prompt_text)) < len(prompt_text):
+                        excerpt = document_type_excerpt(prompt_text)
+                        doc_type_future = executor.submit(detect_document_type, excerpt)
+                
+                if doc_type_future is not None and doc_type is None and doc_type_future.done():
+                    doc_type = doc_type_future.result()
+                    type_box.info(f"📄 **Document Type**: {doc_type}")
+            
+            doc_info = doc_processor.build_document_info(doc_processor.join_pages(pages), file_name,
+                                                         encoding=pages[0].encoding if pages else None,
+                                                         page_starts=[page.start for page in pages])
+            current.set_attributes(pages=len(pages), characters=doc_info['character_count'],
+                                   words=doc_info['word_count'], tokens=doc_info['estimated_tokens'],
+                                   prompt_tokens=doc_info['prompt_tokens'])
+            if executor is not None:
+                final_excerpt = document_type_excerpt(doc_info['prompt_text'])
+                if excerpt != final_excerpt:
+                    # Later pages changed the compacted opening (e.g. a running header was
+                    # found), so detect again from what the analysis will send
+                    doc_type_future = executor.submit(detect_document_type, final_excerpt)
+                doc_type = doc_type_future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            progress.empty()
+            preview.empty()
+            type_box.empty()
+    
+    return doc_info, doc_type
+
+
+@traced()
+def render_analysis_tabs(analysis_results: Dict[str, Union[str, Iterable[str]]],
+                         red_flags: Optional[List[RiskFlag]] = None) -> Dict[str, str]:
+    """
+    Render analysis results in tabs
+    
+    Each result may be a finished string or a stream of text chunks; streams are
+    written incrementally as they arrive. Red flags from the local scan are shown
+    in the risks tab ahead of the AI's answer. Returns the final text of every section.
+    """
     st.header("🔍 AI Analysis Results")
     
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -54,32 +161,98 @@ def render_analysis_tabs(analysis_results: Dict[str, str]):
         "✅ Action Items"
     ])
     
+    final_results = {}
+    
     with tab1:
         st.subheader("Document Summary")
-        st.write(analysis_results.get('summary', 'Analysis not available'))
+        final_results['summary'] = _render_analysis_text(analysis_results.get('summary'))
     
     with tab2:
         st.subheader("Key Terms & Clauses")
-        st.write(analysis_results.get('key_terms', 'Analysis not available'))
+        final_results['key_terms'] = _render_analysis_text(analysis_results.get('key_terms'))
     
     with tab3:
         st.subheader("Potential Risks & Red Flags")
+        if red_flags is not None:
+            render_risk_flags(red_flags)
         st.warning("⚠️ Please review these potential concerns carefully:")
-        st.write(analysis_results.get('risks', 'Analysis not available'))
+        final_results['risks'] = _render_analysis_text(analysis_results.get('risks'))
     
     with tab4:
         st.subheader("Plain English Translation")
         st.info("📝 Here's the document explained in simple terms:")
-        st.write(analysis_results.get('plain_english', 'Analysis not available'))
+        final_results['plain_english'] = _render_analysis_text(analysis_results.get('plain_english'))
     
     with tab5:
         st.subheader("Recommended Actions")
         st.success("✅ Here's what you should do before signing:")
-        st.write(analysis_results.get('action_items', 'Analysis not available'))
+        final_results['action_items'] = _render_analysis_text(analysis_results.get('action_items'))
+    
+    return final_results
 
 
-def render_chat_interface(document_text: str, ai_analyzer):
-    """Render chat interface for Q&A"""
+@traced()
+def render_revision_changes(revision, previous_name: str):
+    """Render what changed since the earlier version and why it matters"""
+    st.header("🔄 What Changed")
+    changes = revision.changes
+    if not changes:
+        st.info(f"No changes found since {previous_name}; the earlier analysis still applies.")
+        return
+    
+    mode = "only the changes were re-analyzed" if revision.incremental else "the document was re-analyzed in full"
+    st.caption(f"Compared with {previous_name}: {len(changes):,} changed passage{'s' if len(changes) != 1 else ''}, {mode}")
+    if revision.what_changed:
+        st.markdown(revision.what_changed)
+    
+    with st.expander(f"📝 Changed text ({len(changes):,} passages)"):
+        for change in changes[:MAX_SHOWN_CHANGES]:
+            st.markdown(f"**{change.section}**")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.caption("Before")
+                st.text(change.before or "(not present)")
+            with col2:
+                st.caption("Now")
+                st.text(change.after or "(removed)")
+        if len(changes) > MAX_SHOWN_CHANGES:
+            st.caption(f"... and {len(changes) - MAX_SHOWN_CHANGES:,} more")
+
+
+@traced()
+def render_risk_flags(red_flags: List[RiskFlag]):
+    """Render the red flags found by the local scan, most severe first"""
+    if not red_flags:
+        st.caption("⚡ Quick scan: none of the common red-flag clauses were found")
+        return
+    
+    st.caption(f"⚡ Quick scan: {len(red_flags)} kind{'s' if len(red_flags) != 1 else ''} of red-flag clause "
+               "found instantly, without the AI")
+    for flag in red_flags:
+        with st.expander(f"{SEVERITY_ICONS[flag.severity]} {flag.label} ({flag.count:,}×)"):
+            st.write(flag.explanation)
+            for excerpt in flag.excerpts:
+                # Escaped so dollar amounts are not rendered as math
+                escaped = excerpt.replace('$', r'\$')
+                st.markdown(f"> {escaped}")
+
+
+def _render_analysis_text(result: Union[str, Iterable[str], None]) -> str:
+    """Write a finished analysis string, or stream it chunk by chunk"""
+    if result is None:
+        result = 'Analysis not available'
+    
+    if isinstance(result, str):
+        st.write(result)
+        return result
+    
+    streamed = st.write_stream(result)
+    return streamed if isinstance(streamed, str) else ''.join(str(part) for part in streamed)
+
+
+@traced()
+def render_chat_interface(document_text: str, ai_analyzer, clause_index=None):
+    """Render chat interface for Q&A, answering from the clause index when one is given"""
     st.header("💬 Ask Questions About Your Document")
     st.write("Have specific questions about your document? Ask our AI assistant!")
     
@@ -99,19 +272,45 @@ def render_chat_interface(document_text: str, ai_analyzer):
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Generate AI response
+        # Stream the AI response as it is generated
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    response = ai_analyzer.answer_question(document_text, prompt)
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                except Exception as e:
-                    error_msg = f"Sorry, I encountered an error: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            try:
+                response = st.write_stream(ai_analyzer.answer_question_stream(document_text, prompt, clause_index))
+                st.session_state.messages.append({"role": "assistant", "content": response})
+            except Exception as e:
+                error_msg = f"Sorry, I encountered an error: {str(e)}"
+                st.error(error_msg)
+                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+
+@st.cache_resource(max_entries=64)
+def _count_gauge(title: str, value: int, scale: int, color: str, step_colors: tuple) -> go.Figure:
+    """Build a count gauge; figures are reused across reruns for the same values"""
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number",
+        value = value,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': title},
+        gauge = {
+            'axis': {'range': [None, max(scale, value)]},
+            'bar': {'color': color},
+            'steps': [
+                {'range': [0, scale // 5], 'color': step_colors[0]},
+                {'range': [scale // 5, scale * 3 // 5], 'color': step_colors[1]},
+                {'range': [scale * 3 // 5, scale], 'color': step_colors[2]}
+            ],
+            'threshold': {
+                'line': {'color': "red", 'width': 4},
+                'thickness': 0.75,
+                'value': value
+            }
+        }
+    ))
+    fig.update_layout(height=300)
+    return fig
 
 
+@traced()
 def render_document_stats(doc_info: Dict[str, Any]):
     """Render document statistics visualization"""
     st.subheader("📈 Document Statistics")
@@ -121,57 +320,85 @@ def render_document_stats(doc_info: Dict[str, Any]):
     
     with col1:
         # Word count visualization
-        fig_words = go.Figure(go.Indicator(
-            mode = "gauge+number",
-            value = doc_info['word_count'],
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': "Word Count"},
-            gauge = {
-                'axis': {'range': [None, max(5000, doc_info['word_count'])]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, 1000], 'color': "lightgray"},
-                    {'range': [1000, 3000], 'color': "gray"},
-                    {'range': [3000, 5000], 'color': "lightblue"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': doc_info['word_count']
-                }
-            }
-        ))
-        fig_words.update_layout(height=300)
+        fig_words = _count_gauge("Word Count", doc_info['word_count'], 5000, "darkblue",
+                                 ("lightgray", "gray", "lightblue"))
         st.plotly_chart(fig_words, use_container_width=True)
     
     with col2:
         # Character count visualization
-        fig_chars = go.Figure(go.Indicator(
-            mode = "gauge+number",
-            value = doc_info['character_count'],
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': "Character Count"},
-            gauge = {
-                'axis': {'range': [None, max(25000, doc_info['character_count'])]},
-                'bar': {'color': "darkgreen"},
-                'steps': [
-                    {'range': [0, 5000], 'color': "lightgray"},
-                    {'range': [5000, 15000], 'color': "gray"},
-                    {'range': [15000, 25000], 'color': "lightgreen"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': doc_info['character_count']
-                }
-            }
-        ))
-        fig_chars.update_layout(height=300)
+        fig_chars = _count_gauge("Character Count", doc_info['character_count'], 25000, "darkgreen",
+                                 ("lightgray", "gray", "lightgreen"))
         st.plotly_chart(fig_chars, use_container_width=True)
 
 
-def render_sidebar():
-    """Render sidebar with app information"""
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_analysis_report(file_name: str, doc_type: str, word_count: int,
+                          analysis_results: Dict[str, str], analyzed_at: datetime) -> str:
+    """Build the plain-text analysis report (memoized on its inputs)"""
+    return f"""
+LEGAL DOCUMENT ANALYSIS REPORT
+==============================
+
+Document: {file_name}
+Type: {doc_type}
+Word Count: {word_count:,}
+Analysis Date: {analyzed_at.strftime('%Y-%m-%d %H:%M:%S')}
+
+SUMMARY
+-------
+{analysis_results.get('summary', 'Not available')}
+
+KEY TERMS & CLAUSES
+-------------------
+{analysis_results.get('key_terms', 'Not available')}
+
+RISKS & RED FLAGS
+-----------------
+{analysis_results.get('risks', 'Not available')}
+
+PLAIN ENGLISH EXPLANATION
+--------------------------
+{analysis_results.get('plain_english', 'Not available')}
+
+RECOMMENDED ACTIONS
+-------------------
+{analysis_results.get('action_items', 'Not available')}
+
+DISCLAIMER
+----------
+This analysis is provided for informational purposes only and should not replace 
+professional legal advice. Always consult with a qualified attorney for important legal matters.
+                    """
+
+
+@traced()
+def render_report_download(doc_info: Dict[str, Any], doc_type: str, analysis_results: Dict[str, str],
+                           analyzed_at: datetime):
+    """Render the analysis report download button"""
+    st.subheader("📄 Download Analysis Report")
+    
+    # Create a text report
+    report = build_analysis_report(doc_info['file_name'], doc_type, doc_info['word_count'],
+                                   analysis_results, analyzed_at)
+    
+    st.download_button(
+        label="📥 Download Analysis Report",
+        data=report,
+        file_name=f"legal_analysis_{doc_info['file_name'].split('.')[0]}.txt",
+        mime="text/plain",
+        use_container_width=True
+    )
+
+
+@traced()
+def render_sidebar(response_cache: bool = True, template_reuse: bool = False):
+    """
+    Render sidebar with app information
+    
+    Args:
+        response_cache: Whether AI responses are cached on disk
+        template_reuse: Whether near-duplicate documents reuse earlier analyses
+    """
     with st.sidebar:
         st.title("🏛️ Legal Reader")
         st.markdown("---")
@@ -204,10 +431,90 @@ def render_sidebar():
         st.markdown("---")
         
         st.subheader("🔒 Privacy")
-        st.info("""
-        Your documents are processed securely and are not stored or shared. 
-        Each session is independent and private.
-        """)
+        storage = [
+            "Your document is sent to Google Gemini for analysis. While its text is extracted, "
+            "large uploads are briefly written to temporary files on the server, which are "
+            "deleted as soon as extraction finishes."
+        ]
+        if response_cache:
+            storage.append("AI responses, which can quote clauses of your document, are cached on "
+                           "the server's disk under a fingerprint of the document so an identical "
+                           "upload is answered instantly.")
+        if template_reuse:
+            storage.append("Sentence fingerprints and analyses of each document are also kept on "
+                           "disk so near-identical documents can reuse them.")
+        storage.append("Revisions are only compared with documents from your own session.")
+        st.info(" ".join(storage))
+
+
+@traced()
+def render_quota_status(metrics: Dict[str, Any]):
+    """Render the remaining API budget in the sidebar"""
+    with st.sidebar:
+        st.markdown("---")
+        st.subheader("📶 API Budget")
+        if 'limit_requests_per_day' in metrics:
+            remaining = metrics['remaining_requests_per_day']
+            limit = metrics['limit_requests_per_day']
+            st.progress(remaining / limit if limit else 0.0, text=f"{remaining:,} of {limit:,} requests left today")
+        if 'limit_requests_per_minute' in metrics:
+            st.caption(f"{metrics['remaining_requests_per_minute']} of {metrics['limit_requests_per_minute']} "
+                       f"requests available this minute")
+        if metrics['retries']:
+            st.caption(f"🔁 {metrics['retries']} rate-limited requests retried automatically")
+
+
+@traced()
+def render_token_usage(metrics: Dict[str, Any]):
+    """Render the tokens this session has used, and its budget if it has one"""
+    with st.sidebar:
+        used = metrics['used_tokens']
+        if 'limit_total_tokens' in metrics:
+            limit = metrics['limit_total_tokens']
+            st.progress(min(1.0, used / limit) if limit else 1.0, text=f"{used:,} of {limit:,} session tokens used")
+        elif used:
+            st.caption(f"🔢 {used:,} tokens used this session")
+        if 'estimate_ratio' in metrics:
+            st.caption(f"Token estimates are {abs(metrics['estimate_ratio'] - 1):.0%} "
+                       f"{'under' if metrics['estimate_ratio'] > 1 else 'over'} the reported counts")
+        if metrics['rejected']:
+            st.caption(f"🛑 {metrics['rejected']} requests held back by the token budget")
+
+
+def render_admin_panel(tracer):
+    """Render per-stage latency percentiles and histograms from a Tracer in the sidebar"""
+    with st.sidebar:
+        st.markdown("---")
+        with st.expander("🛠️ Latency by Stage"):
+            summary = tracer.summary()
+            if not summary:
+                st.caption("No stages recorded yet")
+                return
+            
+            st.dataframe([
+                {
+                    'Stage': name,
+                    'Calls': stats['count'],
+                    'Errors': stats['errors'],
+                    'p50 (s)': round(stats['p50'], 3),
+                    'p95 (s)': round(stats['p95'], 3),
+                    'p99 (s)': round(stats['p99'], 3),
+                }
+                for name, stats in summary.items()
+            ], hide_index=True, use_container_width=True)
+            
+            stage = st.selectbox("Stage", list(summary.keys()), key='admin_stage')
+            fig = px.histogram(x=tracer.recent_durations(stage), nbins=30, labels={'x': 'Seconds'})
+            fig.update_layout(height=220, margin=dict(l=0, r=0, t=10, b=0), yaxis_title='Calls')
+            st.plotly_chart(fig, use_container_width=True)
+            
+            # Attributes of the latest spans help explain outliers
+            for recent in reversed([s for s in tracer.recent_spans() if s.name == stage][-5:]):
+                attributes = ", ".join(f"{key}={value}" for key, value in recent.attributes.items())
+                st.caption(f"{recent.duration:.3f}s" + (f" · {attributes}" if attributes else ""))
+            
+            st.download_button("📥 Prometheus Metrics", tracer.prometheus_text(),
+                               file_name="legal_reader_metrics.prom", mime="text/plain")
 
 
 def render_loading_spinner(message: str = "Analyzing document..."):
@@ -215,16 +522,19 @@ def render_loading_spinner(message: str = "Analyzing document..."):
     return st.spinner(message)
 
 
+@traced()
 def render_error_message(error: str):
     """Render error message"""
     st.error(f"❌ Error: {error}")
 
 
+@traced()
 def render_success_message(message: str):
     """Render success message"""
     st.success(f"✅ {message}")
 
 
+@traced()
 def render_info_message(message: str):
     """Render info message"""
     st.info(f"ℹ️ {message}")
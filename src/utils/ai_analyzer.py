@@ -2,7 +2,8 @@
 AI-powered legal document analyzer using Google Gemini
 """
 import google.generativeai as genai
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Tuple, Iterator
+from dataclasses import dataclass
 import os
 try:
     from dotenv import load_dotenv
@@ -10,21 +11,352 @@ try:
 except ImportError:
     # dotenv not available in cloud deployment
     pass
+import copy
 import json
 import re
+import hashlib
+import sqlite3
+import threading
+import time
+import queue
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .chunking import CHARS_PER_TOKEN, DocumentChunker, TextChunk, estimate_tokens
+from .document_classifier import DocumentClassifier, get_default_document_classifier
+from .retrieval import ClauseIndex
+from .llm_backends import LLMBackend, GeminiBackend, DocumentHandle, PINNED_DOCUMENT_REFERENCE
+from .rate_limiter import QuotaRateLimiter, get_default_rate_limiter
+from .single_flight import SingleFlight, get_default_single_flight
+from .template_index import (
+    ClauseChange, TemplateIndex, UNSTORED_WORDING, clause_changes, fingerprint_changes, format_clause_changes,
+    get_default_template_index
+)
+from .token_budget import TokenBudget, TokenBudgetExceeded, TokenUsage, new_token_budget, truncate_to_tokens
+from .tracing import span
+
+
+# Response schema for the single-call "combined" analysis mode
+COMBINED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "document_type": {"type": "string"},
+        "summary": {"type": "string"},
+        "key_terms": {"type": "string"},
+        "risks": {"type": "string"},
+        "plain_english": {"type": "string"},
+        "action_items": {"type": "string"},
+    },
+    "required": ["document_type", "summary", "key_terms", "risks", "plain_english", "action_items"],
+}
+
+# Response schema for patching an earlier analysis: only fields that change are returned
+PATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {**COMBINED_RESPONSE_SCHEMA["properties"], "what_changed": {"type": "string"}},
+    "required": ["what_changed"],
+}
+
+# Names used when merging per-chunk results of a long document
+ANALYSIS_TITLES = {
+    'summary': "document summary",
+    'key_terms': "key terms and clauses analysis",
+    'risks': "risks and red flags analysis",
+    'plain_english': "plain English explanation",
+    'action_items': "recommended actions checklist",
+}
+
+# Start of every error message returned in place of an analysis
+ANALYSIS_ERROR_PREFIXES = (
+    "Model error:", "API limit reached:", "API key error:", "Token budget exceeded:", "Error generating ", "Unable to ",
+    "Incomplete analysis:"
+)
+
+# Opening text sent for document type detection
+DOCUMENT_TYPE_TOKENS = 250
+# Opening text read by the local classifier, which costs nothing per token
+LOCAL_DOCUMENT_TYPE_TOKENS = 1000
+# Expected response sizes, reserved against the token budget while a call runs
+DOCUMENT_TYPE_OUTPUT_TOKENS = 16
+COMBINED_OUTPUT_TOKENS = 5 * 1024
+# Documents whose changed lines exceed this share of the document are analyzed in full
+MAX_PATCH_SHARE = 0.5
+
+
+def document_type_excerpt(document_text: str) -> str:
+    """
+    Opening text that document-type detection reads
+    
+    get_document_type gives the same answer, and sends the same prompt, for the
+    excerpt as for the full text, so it can run before the rest is extracted.
+    """
+    return truncate_to_tokens(document_text, max(DOCUMENT_TYPE_TOKENS, LOCAL_DOCUMENT_TYPE_TOKENS))
+
+
+def is_analysis_error(result: str) -> bool:
+    """Whether an analysis result is an error message rather than model output"""
+    return result.startswith(ANALYSIS_ERROR_PREFIXES)
+
+
+@dataclass
+class RevisionAnalysis:
+    """Analysis of a revised document and how it differs from the earlier version"""
+    doc_type: str
+    results: Dict[str, str]
+    changes: List[ClauseChange]
+    what_changed: str = ''
+    incremental: bool = True
+
+
+class ResponseCache:
+    """
+    Disk-backed cache of successful model responses
+    
+    Entries are keyed by a SHA-256 digest of the model name, prompt template,
+    document text and question, so identical requests are served locally even
+    across browser sessions. Least-recently-used entries are evicted once the
+    entry or size cap is exceeded, and entries older than the TTL expire.
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_entries: int = 5000,
+                 max_bytes: int = 200 * 1024 * 1024, ttl_seconds: float = 30 * 24 * 3600):
+        self.path = os.path.expanduser(
+            path or os.getenv('RESPONSE_CACHE_PATH', '~/.cache/legal_reader/responses.sqlite3')
+        )
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model_name: str, prompt_template: str, document_text: str, question: str = '') -> str:
+        """Build the content-addressed cache key for a request"""
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_template, document_text, question):
+            encoded = part.encode('utf-8')
+            # Length-prefix each part so different splits never collide
+            digest.update(len(encoded).to_bytes(8, 'big'))
+            digest.update(encoded)
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for a key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def put(self, key: str, value: str):
+        """Store a successful response and evict entries beyond the caps"""
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+    
+    def _evict(self, now: float):
+        """Drop expired entries, then least-recently-used ones until within the caps"""
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        
+        count, total_size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            count -= 1
+            total_size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+    
+    def delete(self, key: str):
+        """Remove a single cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+    
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current cache size"""
+        with self._lock:
+            count, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count,
+            'bytes': total_size
+        }
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    """Return the process-wide response cache, or None if disabled via RESPONSE_CACHE=off"""
+    global _default_cache
+    if os.getenv('RESPONSE_CACHE', 'on').lower() in ('off', '0', 'false'):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+class _BufferedStream:
+    """Iterator that drains a text stream produced on a background worker"""
+    
+    _DONE = object()
+    
+    def __init__(self, executor: ThreadPoolExecutor, producer: Callable[[], Iterator[str]]):
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        executor.submit(self._run, producer)
+    
+    def _run(self, producer: Callable[[], Iterator[str]]):
+        try:
+            for chunk in producer():
+                self._queue.put(chunk)
+        except Exception as e:
+            self._queue.put(f"Unable to complete analysis: {str(e)}")
+        finally:
+            self._queue.put(self._DONE)
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> str:
+        item = self._queue.get()
+        if item is self._DONE:
+            # Leave the sentinel in place so later calls keep raising StopIteration
+            self._queue.put(item)
+            raise StopIteration
+        return item
 
 
 class LegalDocumentAnalyzer:
-    """AI-powered analyzer for legal documents using Google Gemini"""
+    """
+    AI-powered analyzer for legal documents
     
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv('GOOGLE_API_KEY')
-        if not self.api_key:
-            raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
+    Uses Google Gemini by default; pass any LLMBackend (such as MockBackend) to run
+    the same pipeline without an API key.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, max_concurrency: Optional[int] = None,
+                 analysis_mode: Optional[str] = None, response_cache: Optional[ResponseCache] = None,
+                 chunk_tokens: Optional[int] = None, chunk_overlap_tokens: Optional[int] = None,
+                 long_document_tokens: Optional[int] = None, qa_top_k: Optional[int] = None,
+                 backend: Optional[LLMBackend] = None, rate_limiter: Optional[QuotaRateLimiter] = None,
+                 single_flight: Optional[SingleFlight] = None, token_budget: Optional[TokenBudget] = None,
+                 template_index: Optional[TemplateIndex] = None,
+                 document_classifier: Optional[DocumentClassifier] = None):
+        if backend is None:
+            self.api_key = api_key or os.getenv('GOOGLE_API_KEY')
+            if not self.api_key:
+                raise ValueError("Google API key not found. Please set GOOGLE_API_KEY environment variable.")
+            
+            backend = GeminiBackend(self.api_key)
+        else:
+            self.api_key = api_key
         
-        # Configure Gemini
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')  # Best balance: 1,000 RPD
+        self.backend = backend
+        self.model_name = backend.model_name
+        
+        # Documents are pinned in the backend's context once and referenced by later calls
+        self.pin_documents = os.getenv('PIN_DOCUMENTS', 'on').lower() not in ('off', '0', 'false')
+        self.pin_min_tokens = int(os.getenv('PIN_MIN_TOKENS', '4096'))
+        self.pin_ttl_seconds = int(os.getenv('PIN_TTL_SECONDS', '3600'))
+        self.pin_max_documents = int(os.getenv('PIN_MAX_DOCUMENTS', '32'))
+        self._handles: 'OrderedDict[str, Optional[DocumentHandle]]' = OrderedDict()
+        # Requests still using each pinned handle; evicted handles are released once unused
+        self._handles_in_use: Counter = Counter()
+        self._pending_release: Dict[str, DocumentHandle] = {}
+        self._pin_lock = threading.RLock()
+        
+        # Every model call is admitted by the shared quota limiter and retried on 429s
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_default_rate_limiter()
+        
+        # Identical analyses already running in another session are awaited instead of repeated
+        self.single_flight = single_flight if single_flight is not None else get_default_single_flight()
+        
+        # Every request is checked against the token budget before it is sent
+        self.token_budget = token_budget if token_budget is not None else new_token_budget()
+        
+        # Successful responses are reused across sessions; error text is never cached
+        self.response_cache = response_cache if response_cache is not None else get_default_cache()
+        
+        # Near-duplicates of analyzed documents reuse that analysis, patched for the lines that differ
+        self.template_index = template_index if template_index is not None else get_default_template_index()
+        
+        # Document types are classified locally; the model is only asked when the classifier is unsure
+        self.document_classifier = (document_classifier if document_classifier is not None
+                                    else get_default_document_classifier())
+        
+        # Number of model calls allowed in flight at once (1 = serial)
+        self.max_concurrency = max_concurrency or int(os.getenv('ANALYSIS_MAX_CONCURRENCY', '6'))
+        
+        # 'combined' sends the document once for all sections, 'sections' sends one prompt per section
+        self.analysis_mode = analysis_mode or os.getenv('ANALYSIS_MODE', 'combined')
+        if self.analysis_mode not in ('combined', 'sections'):
+            raise ValueError(f"Invalid analysis mode: {self.analysis_mode}")
+        
+        # Documents above this size are analyzed chunk by chunk and the partial results merged
+        self.long_document_tokens = long_document_tokens or int(os.getenv('LONG_DOCUMENT_TOKENS', '30000'))
+        chunk_tokens = chunk_tokens or int(os.getenv('CHUNK_TOKENS', '8000'))
+        overlap_tokens = (chunk_overlap_tokens if chunk_overlap_tokens is not None
+                          else int(os.getenv('CHUNK_OVERLAP_TOKENS', '200')))
+        
+        # Number of clauses retrieved for each chat question when a clause index is available
+        self.qa_top_k = qa_top_k or int(os.getenv('QA_TOP_K_CLAUSES', '8'))
         
         # Legal document analysis prompts
         self.prompts = {
@@ -34,6 +366,29 @@ class LegalDocumentAnalyzer:
             'plain_english': self._get_plain_english_prompt(),
             'action_items': self._get_action_items_prompt()
         }
+        
+        # Documents that would not fit in a single request are chunked, and chunks (with
+        # their overlap) sized to fit; the overlap shrinks with chunks the budget cuts down
+        if self.token_budget.max_prompt_tokens is not None:
+            template_tokens = max(estimate_tokens(template) for template in
+                                  list(self.prompts.values()) + [self._get_combined_prompt()])
+            fit_tokens = max(2, self.token_budget.max_prompt_tokens - template_tokens - 100)
+            self.long_document_tokens = min(self.long_document_tokens, fit_tokens)
+            if chunk_tokens + overlap_tokens > fit_tokens:
+                overlap_tokens = min(overlap_tokens, fit_tokens // 10)
+                chunk_tokens = min(chunk_tokens, fit_tokens - overlap_tokens)
+        self.chunker = DocumentChunker(max_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    
+    def with_budget(self, token_budget: TokenBudget) -> 'LegalDocumentAnalyzer':
+        """
+        Return a view of this analyzer that charges its calls to another token budget
+        
+        The view shares the backend, caches, rate limiter and pinned documents, so a
+        shared analyzer can give each user session its own budget.
+        """
+        view = copy.copy(self)
+        view.token_budget = token_budget
+        return view
     
     def _get_summary_prompt(self) -> str:
         return """
@@ -120,6 +475,397 @@ class LegalDocumentAnalyzer:
         Make your recommendations practical and actionable.
         """
     
+    def _get_combined_prompt(self) -> str:
+        return """
+        You are a legal expert helping everyday people understand complex legal documents.
+        Analyze the legal document below once and return a JSON object with these fields.
+        Write every field in simple terms that anyone can understand, using Markdown headings and lists.
+        
+        - document_type: A brief classification (e.g., "Rental Agreement", "Employment Contract",
+          "Terms of Service", "Loan Agreement", etc.)
+        - summary: A concise summary covering what type of document this is, the main purpose and key
+          parties involved, important dates and deadlines, and key obligations and rights.
+        - key_terms: The most important terms and clauses. For each one, quote the exact clause,
+          explain what it means in simple terms and explain why it's important.
+        - risks: Potential risks, unfavorable terms or red flags to be aware of before signing. For each
+          risk, describe it clearly, explain the possible consequences and suggest what questions to ask
+          or actions to take. Focus on practical financial and legal risks.
+        - plain_english: The most important sections rewritten in plain, everyday English that a middle
+          school student could understand: main obligations of each party, important rights and
+          restrictions, payment terms and penalties, and termination conditions.
+        - action_items: Practical, actionable recommendations before signing: a checklist of things to do,
+          questions to ask the other party, documents or information to gather, deadlines to be aware of,
+          and when to consult a lawyer.
+        
+        Document text:
+        {document_text}
+        """
+    
+    def _get_patch_prompt(self) -> str:
+        return f"""
+        You are a legal expert helping everyday people understand complex legal documents.
+        Below is a JSON analysis of a legal document, followed by the lines of a new version
+        (a revision, or the same template filled in for someone else) that differ from it;
+        the rest of the new version is identical. Return a JSON object that updates the
+        analysis for the new version.
+        
+        - Include only the fields whose text must change, each rewritten in full in the same
+          Markdown format; leave out fields the changes do not affect
+        - Change only what the differing lines affect: parties, amounts, dates, terms, and the
+          risks and actions that depend on them
+        - what_changed: A Markdown list of the changes, each with why it matters to the reader
+          (is it better or worse for them, and does it add a risk, cost or obligation)
+        - "(not present)" marks lines added in the new version; "(removed)" marks lines it no longer has
+        - "{UNSTORED_WORDING}" marks lines of the earlier document whose text was not kept;
+          infer what they said from the earlier analysis
+        
+        Earlier analysis and changed lines:
+        {{document_text}}
+        """
+    
+    def _get_reduce_prompt(self, analysis_type: str) -> str:
+        title = ANALYSIS_TITLES[analysis_type]
+        return f"""
+        You are a legal expert. A long legal document was analyzed in consecutive parts, and the
+        {title} of each part is given below. Merge them into a single {title} for the
+        whole document, in the same format as the parts.
+        
+        - Remove repeated points, but keep every distinct point
+        - Keep references to specific clauses, amounts, dates and parties
+        - Do not mention that the document was analyzed in parts
+        
+        Partial analyses:
+        {{document_text}}
+        """
+    
+    def _get_question_prompt(self) -> str:
+        return """
+        You are a legal expert helping someone understand a legal document. 
+        Based on the document provided, please answer the following question in simple, clear terms.
+        
+        If the answer isn't clearly stated in the document, say so and provide general guidance.
+        
+        Document text:
+        {document_text}
+        
+        Question: {question}
+        
+        Please provide a helpful, accurate answer in plain English.
+        """
+    
+    def _get_excerpt_question_prompt(self) -> str:
+        return """
+        You are a legal expert helping someone understand a legal document. 
+        Below are the clauses of the document most relevant to their question, each labelled with its section.
+        Based on these excerpts, please answer the following question in simple, clear terms.
+        
+        If the answer isn't clearly stated in the excerpts, say so and provide general guidance.
+        
+        Relevant document excerpts:
+        {document_text}
+        
+        Question: {question}
+        
+        Please provide a helpful, accurate answer in plain English.
+        """
+    
+    def _get_pinned_question_prompt(self) -> str:
+        return """
+        You are a legal expert helping someone understand a legal document. 
+        Below are the clauses of the document most relevant to their question, each labelled with its section.
+        The full document is also available to you for anything the excerpts leave out.
+        Based on the document, please answer the following question in simple, clear terms.
+        
+        If the answer isn't clearly stated in the document, say so and provide general guidance.
+        
+        Document text:
+        {document_text}
+        
+        Relevant document excerpts:
+        {excerpts}
+        
+        Question: {question}
+        
+        Please provide a helpful, accurate answer in plain English.
+        """
+    
+    def _get_document_type_prompt(self) -> str:
+        return f"""
+        Analyze this legal document and identify what type of document it is. 
+        Provide a brief classification (e.g., "Rental Agreement", "Employment Contract", 
+        "Terms of Service", "Loan Agreement", etc.)
+        
+        Document text (first {DOCUMENT_TYPE_TOKENS * CHARS_PER_TOKEN:,} characters):
+        {{document_text}}
+        
+        Document type:
+        """
+    
+    def pin_document(self, document_text: str) -> Optional[DocumentHandle]:
+        """
+        Pin a document in the backend's context so later calls reference it instead of resending it
+        
+        Documents below PIN_MIN_TOKENS are not pinned, since caching them costs more than
+        resending them. The handle is reused until it expires; if the backend cannot pin
+        the document, calls keep embedding the text. Expired handles, and the least
+        recently used ones beyond PIN_MAX_DOCUMENTS, are released in the backend.
+        
+        Args:
+            document_text: The extracted text from the legal document
+            
+        Returns:
+            Handle for the pinned document, or None if it is sent inline
+        """
+        document_tokens = estimate_tokens(document_text)
+        if not self.pin_documents or document_tokens < self.pin_min_tokens:
+            return None
+        
+        document_hash = hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+        with self._pin_lock:
+            self._evict_handles()
+            if document_hash in self._handles:
+                self._handles.move_to_end(document_hash)
+                return self._handles[document_hash]
+            
+            handle = None
+            try:
+                reserved = self.token_budget.reserve(document_tokens, output_tokens=0)
+                try:
+                    handle = self._call_backend(
+                        lambda: self.backend.pin_document(document_text, self.pin_ttl_seconds),
+                        document_tokens
+                    )
+                finally:
+                    usage = TokenUsage(handle.token_count, 0) if handle is not None else None
+                    self.token_budget.settle(reserved, document_tokens, usage)
+            except Exception:
+                # Pinning is an optimization; fall back to sending the text inline
+                handle = None
+            if handle is not None:
+                self._pending_release.pop(handle.name, None)
+            self._handles[document_hash] = handle
+            self._evict_handles()
+            return handle
+    
+    def release_document(self, document_text: str):
+        """Forget a document's pinned copy, freeing it in the backend once no request is using it"""
+        document_hash = hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+        with self._pin_lock:
+            handle = self._handles.pop(document_hash, None)
+            if handle is not None:
+                self._release_handle(handle)
+    
+    def _evict_handles(self):
+        """Drop expired handles and the least recently used ones beyond PIN_MAX_DOCUMENTS (lock held)"""
+        for document_hash, handle in list(self._handles.items()):
+            if handle is not None and handle.expired:
+                del self._handles[document_hash]
+                self._release_handle(handle)
+        while len(self._handles) > self.pin_max_documents:
+            _, handle = self._handles.popitem(last=False)
+            if handle is not None:
+                self._release_handle(handle)
+    
+    def _release_handle(self, handle: DocumentHandle):
+        """Release a handle in the backend, or once its last in-flight request finishes (lock held)"""
+        if self._handles_in_use[handle.name]:
+            self._pending_release[handle.name] = handle
+            return
+        try:
+            self.backend.release_document(handle)
+        except Exception:
+            # The backend frees it at expiry anyway
+            pass
+    
+    def _return_handle(self, handle: Optional[DocumentHandle]):
+        """End a request's use of a pinned handle"""
+        if handle is None:
+            return
+        with self._pin_lock:
+            self._handles_in_use[handle.name] -= 1
+            if self._handles_in_use[handle.name] <= 0:
+                del self._handles_in_use[handle.name]
+                pending = self._pending_release.pop(handle.name, None)
+                if pending is not None:
+                    self._release_handle(pending)
+    
+    def _build_request(self, prompt_template: str, document_text: str, question: str,
+                       pinned_document: Optional[str]) -> Tuple[str, Optional[DocumentHandle]]:
+        """
+        Format a prompt, referencing the pinned copy of the document when there is one
+        
+        A returned handle stays in use, and is not released, until _return_handle is called.
+        """
+        handle = None
+        if pinned_document is not None:
+            with self._pin_lock:
+                handle = self.pin_document(pinned_document)
+                if handle is not None:
+                    self._handles_in_use[handle.name] += 1
+        context = PINNED_DOCUMENT_REFERENCE if handle is not None else document_text
+        return prompt_template.format(document_text=context, question=question), handle
+    
+    def _coalesce(self, operation: str, document_text: str, func: Callable[[], Any]) -> Any:
+        """Run func once for concurrent identical requests (same model, operation and document)"""
+        if self.single_flight is None:
+            return func()
+        document_hash = hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+        return self.single_flight.do((self.model_name, operation, document_hash), func)
+    
+    def _prompt_tokens(self, prompt: str, handle: Optional[DocumentHandle]) -> int:
+        """Input tokens of a request, counted by the backend when the estimate is close to the limit"""
+        tokens = estimate_tokens(prompt) + (handle.token_count if handle is not None else 0)
+        if self.token_budget.needs_exact_count(tokens):
+            try:
+                counted = self.backend.count_tokens(prompt, handle)
+            except Exception:
+                counted = None
+            if counted is not None:
+                return counted
+        return tokens
+    
+    def _call_backend(self, func: Callable[[], Any], tokens: int) -> Any:
+        """Run a backend call through the rate limiter, if one is configured"""
+        if self.rate_limiter is None:
+            return func()
+        return self.rate_limiter.call(func, tokens)
+    
+    def _generate(self, prompt_template: str, document_text: str, question: str = '',
+                  pinned_document: Optional[str] = None, output_tokens: Optional[int] = None, **kwargs) -> str:
+        """
+        Send a prompt to the model, serving repeated requests from the response cache
+        
+        Exceptions from the model are propagated so callers can turn them into
+        user-facing messages; only non-empty responses are cached. Requests over
+        the token budget raise TokenBudgetExceeded before anything is sent.
+        
+        Args:
+            prompt_template: Template with {document_text} (and optionally {question}) placeholders
+            document_text: Text substituted into the template
+            question: Optional user question substituted into the template
+            pinned_document: Full document that may be referenced through a pinned handle
+                instead of substituting document_text into the prompt
+            output_tokens: Expected response tokens (defaults to the budget's per-call figure)
+            **kwargs: Extra arguments for the backend (e.g. generation_config)
+            
+        Returns:
+            Response text, or an empty string if the model returned nothing
+        """
+        with span('model_call', streamed=False) as current:
+            key = None
+            if self.response_cache is not None:
+                key = ResponseCache.make_key(self.model_name, prompt_template, document_text, question)
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    current.set_attribute('cache_hit', True)
+                    return cached
+            
+            prompt, handle = self._build_request(prompt_template, document_text, question, pinned_document)
+            try:
+                prompt_tokens = self._prompt_tokens(prompt, handle)
+                current.set_attributes(cache_hit=False, pinned=handle is not None, input_tokens=prompt_tokens)
+                reserved = self.token_budget.reserve(prompt_tokens, output_tokens)
+                usage = None
+                try:
+                    text, usage = self._call_backend(
+                        lambda: self.backend.generate_with_usage(prompt, handle=handle, **kwargs),
+                        estimate_tokens(prompt)
+                    )
+                    if usage is None:
+                        usage = TokenUsage(prompt_tokens, estimate_tokens(text or ''), exact=False)
+                finally:
+                    self.token_budget.settle(reserved, prompt_tokens, usage)
+            finally:
+                self._return_handle(handle)
+            current.set_attribute('output_tokens', usage.output_tokens)
+            
+            if text and key is not None:
+                self.response_cache.put(key, text)
+            return text or ''
+    
+    def _generate_stream(self, prompt_template: str, document_text: str, question: str = '',
+                         pinned_document: Optional[str] = None) -> Iterator[str]:
+        """
+        Streaming variant of _generate that yields response text as it arrives
+        
+        A cache hit is yielded as a single chunk. The assembled response is cached
+        only if the stream completes without error and is non-empty.
+        """
+        with span('model_call', streamed=True) as current:
+            key = None
+            if self.response_cache is not None:
+                key = ResponseCache.make_key(self.model_name, prompt_template, document_text, question)
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    current.set_attribute('cache_hit', True)
+                    yield cached
+                    return
+            
+            prompt, handle = self._build_request(prompt_template, document_text, question, pinned_document)
+            try:
+                prompt_tokens = self._prompt_tokens(prompt, handle)
+                current.set_attributes(cache_hit=False, pinned=handle is not None, input_tokens=prompt_tokens)
+                reserved = self.token_budget.reserve(prompt_tokens)
+                chunks = []
+                try:
+                    yield from self._stream_with_retries(prompt, handle, chunks)
+                finally:
+                    # Streams don't report usage; the output is estimated from what arrived
+                    usage = (TokenUsage(prompt_tokens, estimate_tokens(''.join(chunks)), exact=False)
+                             if chunks else None)
+                    self.token_budget.settle(reserved, prompt_tokens, usage)
+                    current.set_attribute('output_tokens', usage.output_tokens if usage else 0)
+            finally:
+                self._return_handle(handle)
+            
+            if chunks and key is not None:
+                self.response_cache.put(key, ''.join(chunks))
+    
+    def _stream_with_retries(self, prompt: str, handle: Optional[DocumentHandle], chunks: List[str]) -> Iterator[str]:
+        """Stream a response through the rate limiter, collecting it in chunks"""
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimate_tokens(prompt))
+            try:
+                for text in self.backend.generate_stream(prompt, handle=handle):
+                    if text:
+                        chunks.append(text)
+                        yield text
+                break
+            except Exception as e:
+                # Only retry failures that happened before anything reached the user
+                if chunks or self.rate_limiter is None or not self.rate_limiter.should_retry(attempt, e):
+                    raise
+                self.rate_limiter.wait_before_retry(attempt, e)
+                attempt += 1
+    
+    def _analysis_error_message(self, analysis_type: str, error: Exception) -> str:
+        """Turn a model error into a user-facing analysis message"""
+        error_msg = str(error)
+        if isinstance(error, TokenBudgetExceeded):
+            return f"Token budget exceeded: {error_msg[:1].upper()}{error_msg[1:]}."
+        elif "404" in error_msg or "not found" in error_msg.lower():
+            return f"Model error: The AI model is currently unavailable. Please try again later."
+        elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
+            return f"API limit reached: Please check your API quota or try again later."
+        elif "api key" in error_msg.lower():
+            return f"API key error: Please check your Google API key configuration."
+        else:
+            return f"Error generating {analysis_type} analysis: {error_msg}"
+    
+    def _question_error_message(self, error: Exception) -> str:
+        """Turn a model error into a user-facing chat message"""
+        error_msg = str(error)
+        if isinstance(error, TokenBudgetExceeded):
+            return f"This question was not sent because {error_msg}."
+        elif "404" in error_msg or "not found" in error_msg.lower():
+            return "The AI service is currently unavailable. Please try again later."
+        elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
+            return "API usage limit reached. Please try again later."
+        else:
+            return f"I encountered an error while processing your question: {error_msg}"
+    
     def analyze_document(self, document_text: str, analysis_type: str = 'summary') -> str:
         """
         Analyze a legal document using AI
@@ -134,110 +880,721 @@ class LegalDocumentAnalyzer:
         if analysis_type not in self.prompts:
             raise ValueError(f"Invalid analysis type: {analysis_type}")
         
-        prompt = self.prompts[analysis_type].format(document_text=document_text)
+        with span(f'analyze_document.{analysis_type}', document_tokens=estimate_tokens(document_text)) as current:
+            result = self._coalesce(analysis_type, document_text,
+                                    lambda: self._analyze_document(document_text, analysis_type))
+            current.set_attribute('failed', is_analysis_error(result))
+            return result
+    
+    def _analyze_document(self, document_text: str, analysis_type: str) -> str:
+        if self.is_long_document(document_text):
+            return self.long_document_analysis(document_text, [analysis_type])[analysis_type]
         
         try:
-            response = self.model.generate_content(prompt)
-            if response.text:
-                return response.text
+            text = self._generate(self.prompts[analysis_type], document_text, pinned_document=document_text)
+            if text:
+                return text
             else:
                 return f"Unable to generate {analysis_type} analysis. The response was empty."
         except Exception as e:
-            error_msg = str(e)
-            if "404" in error_msg or "not found" in error_msg.lower():
-                return f"Model error: The AI model is currently unavailable. Please try again later."
-            elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
-                return f"API limit reached: Please check your API quota or try again later."
-            elif "api key" in error_msg.lower():
-                return f"API key error: Please check your Google API key configuration."
+            return self._analysis_error_message(analysis_type, e)
+    
+    def analyze_document_stream(self, document_text: str, analysis_type: str = 'summary') -> Iterator[str]:
+        """
+        Analyze a legal document using AI, yielding the response as it is generated
+        
+        Args:
+            document_text: The extracted text from the legal document
+            analysis_type: Type of analysis ('summary', 'key_terms', 'risks', 'plain_english', 'action_items')
+            
+        Returns:
+            Iterator over chunks of the AI-generated analysis
+        """
+        if analysis_type not in self.prompts:
+            raise ValueError(f"Invalid analysis type: {analysis_type}")
+        
+        with span(f'analyze_document.{analysis_type}', streamed=True, document_tokens=estimate_tokens(document_text)):
+            yield from self._analyze_document_stream(document_text, analysis_type)
+    
+    def _analyze_document_stream(self, document_text: str, analysis_type: str) -> Iterator[str]:
+        produced = False
+        try:
+            if self.is_long_document(document_text):
+                # Map over the chunks first, then stream the merged result
+                chunks = self.chunker.chunk(document_text)
+                partials, failures = self._map_chunks(chunks, [analysis_type])
+                partials, failed = partials[analysis_type], failures[analysis_type]
+                if not partials:
+                    raise RuntimeError("every part of the document failed to analyze")
+                if failed:
+                    produced = True
+                    yield self._incomplete_notice(analysis_type, failed, len(chunks))
+                stream = self._reduce_partials_stream(analysis_type, partials)
             else:
-                return f"Error generating {analysis_type} analysis: {error_msg}"
+                stream = self._generate_stream(self.prompts[analysis_type], document_text,
+                                               pinned_document=document_text)
+            
+            for chunk in stream:
+                produced = True
+                yield chunk
+            if not produced:
+                yield f"Unable to generate {analysis_type} analysis. The response was empty."
+        except Exception as e:
+            # Keep any partial output on screen and append the error after it
+            yield ("\n\n" if produced else "") + self._analysis_error_message(analysis_type, e)
+    
+    def stream_analysis_with_document_type(self, document_text: str, max_concurrency: Optional[int] = None
+                                           ) -> Tuple[Iterator[str], Dict[str, Iterator[str]]]:
+        """
+        Start streaming every section (and the document-type check) at once
+        
+        Each section is generated on a bounded thread pool and buffered, so sections
+        further down the page are usually complete by the time they are consumed.
+        
+        Args:
+            document_text: The extracted text from the legal document
+            max_concurrency: Maximum number of model calls in flight at once
+            
+        Returns:
+            Tuple of (document type stream, dictionary of section streams)
+        """
+        reused = self._reused_analysis_streams(document_text)
+        if reused is not None:
+            return reused
+        
+        producers = {
+            analysis_type: (lambda analysis_type=analysis_type: self.analyze_document_stream(document_text, analysis_type))
+            for analysis_type in self.prompts.keys()
+        }
+        producers['document_type'] = lambda: iter([self.get_document_type(document_text)])
+        
+        workers = max(1, min(max_concurrency or self.max_concurrency, len(producers)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legal-analysis-stream")
+        streams = {name: _BufferedStream(executor, producer) for name, producer in producers.items()}
+        executor.shutdown(wait=False)
+        
+        doc_type_stream = streams.pop('document_type')
+        return doc_type_stream, streams
+    
+    def _reused_analysis_streams(self, document_text: str
+                                 ) -> Optional[Tuple[Iterator[str], Dict[str, Iterator[str]]]]:
+        reused = self.template_analysis(document_text)
+        if reused is None:
+            return None
+        doc_type, results = reused
+        return iter([doc_type]), {analysis_type: iter([result]) for analysis_type, result in results.items()}
     
-    def comprehensive_analysis(self, document_text: str) -> Dict[str, str]:
+    def comprehensive_analysis(self, document_text: str, max_concurrency: Optional[int] = None) -> Dict[str, str]:
         """
         Perform a comprehensive analysis of the legal document
         
+        The section prompts are independent, so they are sent concurrently and the
+        total latency is set by the slowest section rather than the sum of all of them.
+        
         Args:
             document_text: The extracted text from the legal document
+            max_concurrency: Maximum number of sections analyzed at once (defaults to self.max_concurrency)
             
         Returns:
             Dictionary with all types of analysis
         """
-        results = {}
+        def analyze() -> Dict[str, str]:
+            if self.is_long_document(document_text):
+                return self.long_document_analysis(document_text, max_concurrency=max_concurrency)
+            return self._run_concurrently(self._section_tasks(document_text), max_concurrency)
+        
+        # Callers that shared the result each get their own dictionary
+        return dict(self._coalesce('comprehensive', document_text, analyze))
+    
+    def analyze_with_document_type(self, document_text: str, max_concurrency: Optional[int] = None,
+                                   analysis_mode: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+        """
+        Identify the document type and run the comprehensive analysis
+        
+        A near-duplicate of an earlier analyzed document (such as the same lease
+        template with other names and amounts) reuses that analysis, patched by one
+        call for the lines that differ. Otherwise, in 'combined' mode the document is
+        sent once and all sections come back in a single JSON response; in 'sections'
+        mode (or when the combined response cannot be parsed) the section prompts and
+        the document-type prompt run in one fan-out. Complete analyses are added to
+        the template index.
         
+        Args:
+            document_text: The extracted text from the legal document
+            max_concurrency: Maximum number of model calls in flight at once
+            analysis_mode: 'combined' or 'sections' (defaults to self.analysis_mode)
+            
+        Returns:
+            Tuple of (document type, dictionary with all types of analysis)
+        """
+        reused = self.template_analysis(document_text)
+        if reused is not None:
+            return reused
+        
+        doc_type, results = self._analyze_with_document_type(document_text, max_concurrency, analysis_mode)
+        self.index_analysis(document_text, doc_type, results)
+        return doc_type, results
+    
+    def _analyze_with_document_type(self, document_text: str, max_concurrency: Optional[int],
+                                    analysis_mode: Optional[str]) -> Tuple[str, Dict[str, str]]:
+        if self.is_long_document(document_text):
+            # The whole document never goes into one prompt; the type check only needs the opening text
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                doc_type_future = executor.submit(self.get_document_type, document_text)
+                results = self.long_document_analysis(document_text, max_concurrency=max_concurrency)
+                return doc_type_future.result(), results
+        
+        if (analysis_mode or self.analysis_mode) == 'combined':
+            combined = self.combined_analysis(document_text)
+            if combined is not None:
+                return combined
+        
+        tasks = self._section_tasks(document_text)
+        tasks['document_type'] = lambda: self.get_document_type(document_text)
+        
+        results = self._run_concurrently(tasks, max_concurrency)
+        doc_type = results.pop('document_type')
+        if doc_type.startswith("Unable to perform"):
+            doc_type = "Unknown Document Type"
+        return doc_type, results
+    
+    def index_analysis(self, document_text: str, doc_type: str, results: Dict[str, str]):
+        """Add a complete analysis to the template index so near-duplicates can reuse it"""
+        if self.template_index is None or any(is_analysis_error(result) for result in results.values()):
+            return
+        self.template_index.add(document_text, self.model_name, doc_type, results)
+    
+    def patchable_changes(self, previous_text: str, document_text: str) -> Optional[List[ClauseChange]]:
+        """
+        Lines that differ between an earlier analyzed document and a new one
+        
+        Returns:
+            The changes (empty for identical documents), or None if they exceed
+            MAX_PATCH_SHARE of the document and it should be analyzed in full
+        """
+        return self._within_patch_budget(clause_changes(previous_text, document_text), document_text)
+    
+    def _within_patch_budget(self, changes: List[ClauseChange], document_text: str) -> Optional[List[ClauseChange]]:
+        """The changes, or None if they exceed MAX_PATCH_SHARE of the document"""
+        if estimate_tokens(format_clause_changes(changes)) > MAX_PATCH_SHARE * estimate_tokens(document_text):
+            return None
+        return changes
+    
+    def _patch_analysis(self, doc_type: str, results: Dict[str, str], changes: List[ClauseChange]
+                        ) -> Optional[Tuple[str, Dict[str, str], str]]:
+        """
+        Update an earlier analysis for changed lines with one call
+        
+        Only the fields the changes affect come back from the model, so the call
+        grows with the size of the edit rather than the size of the document.
+        
+        Returns:
+            Tuple of (document type, dictionary with all types of analysis, Markdown
+            explanation of the changes), or None if the call failed
+        """
+        previous = json.dumps({'document_type': doc_type, **results}, indent=2)
+        patch_text = f"{previous}\n\nChanged lines:\n{format_clause_changes(changes)}"
+        generation_config = genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=PATCH_RESPONSE_SCHEMA
+        )
+        try:
+            response_text = self._generate(self._get_patch_prompt(), patch_text,
+                                           output_tokens=COMBINED_OUTPUT_TOKENS,
+                                           generation_config=generation_config)
+        except Exception:
+            return None
+        
+        data = self._parse_json_object(response_text)
+        if data is None:
+            if response_text and self.response_cache is not None:
+                self.response_cache.delete(ResponseCache.make_key(self.model_name, self._get_patch_prompt(), patch_text))
+            return None
+        
+        patched = dict(results)
         for analysis_type in self.prompts.keys():
-            try:
-                results[analysis_type] = self.analyze_document(document_text, analysis_type)
-            except Exception as e:
-                results[analysis_type] = f"Unable to perform {analysis_type} analysis: {str(e)}"
+            value = data.get(analysis_type)
+            if isinstance(value, str) and value.strip():
+                patched[analysis_type] = value.strip()
+        new_doc_type = data.get('document_type')
+        if isinstance(new_doc_type, str) and new_doc_type.strip():
+            doc_type = new_doc_type.strip()
+        what_changed = data.get('what_changed')
+        return doc_type, patched, what_changed.strip() if isinstance(what_changed, str) else ''
+    
+    def template_analysis(self, document_text: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Reuse the analysis of an indexed near-duplicate, patched for the lines that differ
         
-        return results
+        Args:
+            document_text: The extracted text from the legal document
+            
+        Returns:
+            Tuple of (document type, dictionary with all types of analysis), or None if
+            there is no similar document, too much differs, or the patch call failed
+        """
+        if self.template_index is None:
+            return None
+        
+        with span('template_analysis', document_tokens=estimate_tokens(document_text)) as current:
+            match = self.template_index.find(document_text, self.model_name)
+            current.set_attribute('matched', match is not None)
+            if match is None:
+                return None
+            
+            current.set_attribute('similarity', round(match.similarity, 3))
+            changes = self._within_patch_budget(fingerprint_changes(match.fingerprints, document_text), document_text)
+            current.set_attribute('changes', len(changes) if changes is not None else None)
+            if not changes:
+                # Identical text reuses the analysis as is; too many changes need a full analysis
+                return (match.document_type, dict(match.results)) if changes is not None else None
+            
+            patched = self._patch_analysis(match.document_type, match.results, changes)
+            current.set_attribute('patched', patched is not None)
+            if patched is None:
+                return None
+            doc_type, results, _ = patched
+            return doc_type, results
     
-    def answer_question(self, document_text: str, question: str) -> str:
+    def revision_analysis(self, previous_text: str, previous_doc_type: str, previous_results: Dict[str, str],
+                          document_text: str, max_concurrency: Optional[int] = None) -> RevisionAnalysis:
         """
-        Answer a specific question about the legal document
+        Analyze a revised version of an analyzed document, re-running only what changed
+        
+        The versions are diffed line by line; the earlier analysis is kept for the
+        unchanged text and one call updates it for the changed lines and explains
+        what changed. When most of the document changed (or the update fails) the
+        revision is analyzed in full.
+        
+        Args:
+            previous_text: Text of the earlier version
+            previous_doc_type: Document type found for the earlier version
+            previous_results: Analysis of the earlier version
+            document_text: Text of the revised version
+            max_concurrency: Maximum number of model calls in flight for a full analysis
+            
+        Returns:
+            RevisionAnalysis with the updated analysis and the changed lines
+        """
+        with span('revision_analysis', document_tokens=estimate_tokens(document_text)) as current:
+            changes = self.patchable_changes(previous_text, document_text)
+            current.set_attribute('changes', len(changes) if changes is not None else None)
+            if changes == []:
+                return RevisionAnalysis(previous_doc_type, dict(previous_results), [])
+            
+            if changes is not None:
+                patched = self._patch_analysis(previous_doc_type, previous_results, changes)
+                if patched is not None:
+                    current.set_attribute('incremental', True)
+                    doc_type, results, what_changed = patched
+                    return RevisionAnalysis(doc_type, results, changes, what_changed)
+            
+            current.set_attribute('incremental', False)
+            doc_type, results = self._analyze_with_document_type(document_text, max_concurrency, None)
+            self.index_analysis(document_text, doc_type, results)
+            return RevisionAnalysis(doc_type, results, changes or clause_changes(previous_text, document_text),
+                                    incremental=False)
+    
+    def combined_analysis(self, document_text: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Analyze the document with a single schema-constrained model call
         
         Args:
             document_text: The extracted text from the legal document
-            question: User's question about the document
             
         Returns:
-            AI-generated answer to the question
+            Tuple of (document type, dictionary with all types of analysis), or None
+            if the call failed or the response could not be split into sections
         """
-        prompt = f"""
-        You are a legal expert helping someone understand a legal document. 
-        Based on the document provided, please answer the following question in simple, clear terms.
+        with span('combined_analysis', document_tokens=estimate_tokens(document_text)) as current:
+            combined = self._coalesce('combined', document_text, lambda: self._combined_analysis(document_text))
+            current.set_attribute('failed', combined is None)
+        if combined is None:
+            return None
+        doc_type, results = combined
+        return doc_type, dict(results)
+    
+    def _combined_analysis(self, document_text: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        generation_config = genai.GenerationConfig(
+            response_mime_type="application/json",
+            response_schema=COMBINED_RESPONSE_SCHEMA
+        )
         
-        If the answer isn't clearly stated in the document, say so and provide general guidance.
+        try:
+            response_text = self._generate(
+                self._get_combined_prompt(), document_text,
+                output_tokens=COMBINED_OUTPUT_TOKENS, generation_config=generation_config
+            )
+        except Exception:
+            return None
         
-        Document text:
-        {document_text}
+        parsed = self._parse_combined_response(response_text)
+        if parsed is None and self.response_cache is not None:
+            # Don't keep serving a response that could not be split into sections
+            self.response_cache.delete(
+                ResponseCache.make_key(self.model_name, self._get_combined_prompt(), document_text)
+            )
+        return parsed
+    
+    def _parse_json_object(self, response_text: str) -> Optional[Dict[str, Any]]:
+        """Parse a JSON object response, or return None if it is not one"""
+        if not response_text:
+            return None
         
-        Question: {question}
+        # Tolerate a Markdown code fence around the JSON payload
+        payload = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', response_text)
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    
+    def _parse_combined_response(self, response_text: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """Split a combined JSON response into (document type, section results)"""
+        data = self._parse_json_object(response_text)
+        if data is None:
+            return None
         
-        Please provide a helpful, accurate answer in plain English.
+        results = {}
+        for analysis_type in self.prompts.keys():
+            value = data.get(analysis_type)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            results[analysis_type] = value.strip()
+        
+        doc_type = data.get('document_type')
+        if not isinstance(doc_type, str) or not doc_type.strip():
+            doc_type = "Unknown Document Type"
+        
+        return doc_type.strip(), results
+    
+    def is_long_document(self, document_text: str) -> bool:
+        """Whether the document is analyzed chunk by chunk rather than in a single prompt"""
+        return estimate_tokens(document_text) > self.long_document_tokens
+    
+    def estimate_analysis_tokens(self, document_text: str, analysis_mode: Optional[str] = None) -> int:
+        """
+        Estimate the input and output tokens of a full analysis before running it
+    
+        Follows the same path as analyze_with_document_type: a chunked map-reduce for
+        long documents, otherwise one combined call or one call per section. The
+        document-type call is left out when the local classifier can type the document.
+        Cached responses are not subtracted, so repeat analyses cost less than estimated.
+    
+        Args:
+            document_text: The extracted text from the legal document
+            analysis_mode: 'combined' or 'sections' (defaults to self.analysis_mode)
+    
+        Returns:
+            Estimated tokens over every model call of the analysis
+        """
+        output_tokens = self.token_budget.output_tokens
+        section_templates = sum(estimate_tokens(template) for template in self.prompts.values())
+        document_type = 0
+        if self._local_document_type(document_text) is None:
+            document_type = (estimate_tokens(self._get_document_type_prompt()) + DOCUMENT_TYPE_TOKENS
+                             + DOCUMENT_TYPE_OUTPUT_TOKENS)
+    
+        if self.is_long_document(document_text):
+            chunks = self.chunker.chunk(document_text)
+            mapped = sum(section_templates + len(self.prompts) * (estimate_tokens(chunk.text) + output_tokens)
+                         for chunk in chunks)
+            reduced = 0
+            if len(chunks) > 1:
+                reduced = sum(estimate_tokens(self._get_reduce_prompt(analysis_type)) + (len(chunks) + 1) * output_tokens
+                              for analysis_type in self.prompts.keys())
+            return document_type + mapped + reduced
+    
+        document_tokens = estimate_tokens(document_text)
+        if (analysis_mode or self.analysis_mode) == 'combined':
+            return estimate_tokens(self._get_combined_prompt()) + document_tokens + COMBINED_OUTPUT_TOKENS
+        return document_type + section_templates + len(self.prompts) * (document_tokens + output_tokens)
+    
+    def long_document_analysis(self, document_text: str, analysis_types: Optional[List[str]] = None,
+                               max_concurrency: Optional[int] = None) -> Dict[str, str]:
         """
+        Analyze a long document with a chunked map-reduce
+        
+        The document is split on section boundaries into token-budgeted chunks, every
+        section prompt runs over every chunk in parallel (map), and the partial results
+        for each analysis type are merged with a reduce prompt.
+        
+        Args:
+            document_text: The extracted text from the legal document
+            analysis_types: Analysis types to run (defaults to all of them)
+            max_concurrency: Maximum number of model calls in flight at once
+            
+        Returns:
+            Dictionary with the requested types of analysis
+        """
+        analysis_types = analysis_types or list(self.prompts.keys())
+        for analysis_type in analysis_types:
+            if analysis_type not in self.prompts:
+                raise ValueError(f"Invalid analysis type: {analysis_type}")
+        
+        with span('long_document_analysis', document_tokens=estimate_tokens(document_text),
+                  analysis_types=len(analysis_types)) as current:
+            chunks = self.chunker.chunk(document_text)
+            current.set_attribute('chunks', len(chunks))
+            partials, failures = self._map_chunks(chunks, analysis_types, max_concurrency)
+            
+            reduce_tasks = {
+                analysis_type: (lambda analysis_type=analysis_type: self._reduce_partials(analysis_type, partials[analysis_type]))
+                for analysis_type in analysis_types
+            }
+            results = self._run_concurrently(reduce_tasks, max_concurrency)
+            for analysis_type, failed in failures.items():
+                if failed and partials[analysis_type]:
+                    notice = self._incomplete_notice(analysis_type, failed, len(chunks))
+                    results[analysis_type] = notice + results[analysis_type]
+            return results
+    
+    def _map_chunks(self, chunks: List[TextChunk], analysis_types: List[str],
+                    max_concurrency: Optional[int] = None
+                    ) -> Tuple[Dict[str, List[str]], Dict[str, List[Exception]]]:
+        """
+        Run each section prompt over each chunk
+        
+        Returns:
+            Tuple of (successful partial results in chunk order, errors of the chunks
+            that failed), each keyed by analysis type
+        """
+        def analyze_chunk(analysis_type: str, chunk: TextChunk) -> str:
+            labelled_text = (
+                f"[Part {chunk.index + 1} of {len(chunks)} of a longer document, "
+                f"beginning in section: {chunk.section}]\n\n{chunk.text}"
+            )
+            return self._generate(self.prompts[analysis_type], labelled_text)
+        
+        jobs = [(analysis_type, chunk) for analysis_type in analysis_types for chunk in chunks]
+        workers = max(1, min(max_concurrency or self.max_concurrency, len(jobs) or 1))
+        partials = {analysis_type: [] for analysis_type in analysis_types}
+        failures = {analysis_type: [] for analysis_type in analysis_types}
+        
+        with span('map_chunks', chunks=len(chunks), analysis_types=len(analysis_types)) as current:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legal-analysis-map") as executor:
+                futures = [(analysis_type, executor.submit(analyze_chunk, analysis_type, chunk))
+                           for analysis_type, chunk in jobs]
+                for analysis_type, future in futures:
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        # A failed chunk is left out of the merge and reported with the result
+                        failures[analysis_type].append(e)
+                        continue
+                    if text:
+                        partials[analysis_type].append(text)
+            current.set_attribute('failed_chunks', sum(len(failed) for failed in failures.values()))
+        
+        return partials, failures
+    
+    def _incomplete_notice(self, analysis_type: str, failed: List[Exception], total: int) -> str:
+        """Heading that marks a merged result as missing the parts of the document that failed"""
+        reason = self._analysis_error_message(analysis_type, failed[0])
+        return (f"Incomplete analysis: {len(failed)} of {total} parts of the document could not be analyzed "
+                f"({reason}), so this analysis does not cover them.\n\n")
+    
+    def _group_partials(self, partials: List[str]) -> List[str]:
+        """
+        Label the partial results and group them into reduce inputs that fit the chunk budget
+        
+        Each partial is cut to half the budget, so any two fit in one group and every
+        round of reduces at least halves the number of groups.
+        """
+        half_budget = self.chunker.max_tokens // 2
+        groups, current, current_tokens = [], [], 0
+        for i, partial in enumerate(partials):
+            label = f"--- Part {i + 1} ---\n"
+            labelled = label + truncate_to_tokens(partial.strip(), max(1, half_budget - estimate_tokens(label) - 1))
+            tokens = estimate_tokens(labelled)
+            if current and current_tokens + tokens > self.chunker.max_tokens:
+                groups.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(labelled)
+            current_tokens += tokens
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+    
+    def _collapse_partials(self, analysis_type: str, partials: List[str]) -> str:
+        """Reduce partial results level by level until they fit in a single reduce prompt"""
+        groups = self._group_partials(partials)
+        while len(groups) > 1:
+            merged = [self._generate(self._get_reduce_prompt(analysis_type), group) for group in groups]
+            next_groups = self._group_partials([text for text in merged if text])
+            if len(next_groups) >= len(groups):
+                raise RuntimeError(f"merging {len(groups)} partial results did not reduce them")
+            groups = next_groups
+        return groups[0] if groups else ''
+    
+    def _reduce_partials(self, analysis_type: str, partials: List[str]) -> str:
+        """Merge the per-chunk results of one analysis type into a single result"""
+        if not partials:
+            return f"Unable to generate {analysis_type} analysis. Every part of the document failed to analyze."
+        if len(partials) == 1:
+            return partials[0]
         
         try:
-            response = self.model.generate_content(prompt)
-            if response.text:
-                return response.text
-            else:
-                return "I wasn't able to generate a response to your question. Please try rephrasing it."
+            text = self._generate(self._get_reduce_prompt(analysis_type), self._collapse_partials(analysis_type, partials))
+            return text or f"Unable to generate {analysis_type} analysis. The response was empty."
         except Exception as e:
-            error_msg = str(e)
-            if "404" in error_msg or "not found" in error_msg.lower():
-                return "The AI service is currently unavailable. Please try again later."
-            elif "quota" in error_msg.lower() or "limit" in error_msg.lower():
-                return "API usage limit reached. Please try again later."
-            else:
-                return f"I encountered an error while processing your question: {error_msg}"
+            return self._analysis_error_message(analysis_type, e)
     
-    def get_document_type(self, document_text: str) -> str:
+    def _reduce_partials_stream(self, analysis_type: str, partials: List[str]) -> Iterator[str]:
+        """Streaming variant of _reduce_partials; model errors propagate to the caller"""
+        if len(partials) == 1:
+            return iter(partials)
+        return self._generate_stream(self._get_reduce_prompt(analysis_type), self._collapse_partials(analysis_type, partials))
+    
+    def _section_tasks(self, document_text: str) -> Dict[str, Callable[[], str]]:
+        """Build one callable per section prompt"""
+        return {
+            analysis_type: (lambda analysis_type=analysis_type: self.analyze_document(document_text, analysis_type))
+            for analysis_type in self.prompts.keys()
+        }
+    
+    def _run_concurrently(self, tasks: Dict[str, Callable[[], str]],
+                          max_concurrency: Optional[int] = None) -> Dict[str, str]:
         """
-        Identify the type of legal document
+        Run independent analysis tasks on a bounded thread pool
+        
+        A failure in one task is reported in that task's result only; the other
+        tasks still complete. Results keep the order of the task dictionary.
+        """
+        workers = max(1, min(max_concurrency or self.max_concurrency, len(tasks)))
+        results = {}
+        
+        if workers == 1:
+            for name, task in tasks.items():
+                try:
+                    results[name] = task()
+                except Exception as e:
+                    results[name] = f"Unable to perform {name} analysis: {str(e)}"
+            return results
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legal-analysis") as executor:
+            futures = {name: executor.submit(task) for name, task in tasks.items()}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    results[name] = f"Unable to perform {name} analysis: {str(e)}"
+        
+        return results
+    
+    def build_clause_index(self, document_text: str) -> ClauseIndex:
+        """
+        Build the clause retrieval index for a document
+        
+        Build it once per document and pass it to answer_question so each question
+        only sends the most relevant clauses instead of the whole document.
+        """
+        return ClauseIndex(document_text)
+    
+    def _question_prompt(self, document_text: str, question: str,
+                         clause_index: Optional[ClauseIndex]) -> Tuple[str, str, Optional[str]]:
+        """
+        Return the (template, document context, pinned document) for a question
+        
+        The clause index narrows the context to the most relevant excerpts. Since a
+        chat usually asks several questions, a large document is also pinned and the
+        excerpts are quoted alongside a reference to the full document.
+        """
+        if clause_index is None:
+            return self._get_question_prompt(), document_text, document_text
+        excerpts = clause_index.build_context(question, self.qa_top_k)
+        if self.pin_document(document_text) is None:
+            return self._get_excerpt_question_prompt(), excerpts, None
+        # The excerpts are fixed in the template; {document_text} becomes the pinned reference
+        escaped = excerpts.replace('{', '{{').replace('}', '}}')
+        return self._get_pinned_question_prompt().replace('{excerpts}', escaped), document_text, document_text
+    
+    def answer_question(self, document_text: str, question: str,
+                        clause_index: Optional[ClauseIndex] = None) -> str:
+        """
+        Answer a specific question about the legal document
         
         Args:
             document_text: The extracted text from the legal document
+            question: User's question about the document
+            clause_index: Optional index from build_clause_index; when given, only the
+                top-ranked clauses are sent with the question
             
         Returns:
-            Identified document type
+            AI-generated answer to the question
         """
-        prompt = f"""
-        Analyze this legal document and identify what type of document it is. 
-        Provide a brief classification (e.g., "Rental Agreement", "Employment Contract", 
-        "Terms of Service", "Loan Agreement", etc.)
-        
-        Document text (first 1000 characters):
-        {document_text[:1000]}
+        with span('answer_question', question_tokens=estimate_tokens(question),
+                  retrieval=clause_index is not None):
+            try:
+                template, context, pinned_document = self._question_prompt(document_text, question, clause_index)
+                text = self._generate(template, context, question, pinned_document=pinned_document)
+                if text:
+                    return text
+                else:
+                    return "I wasn't able to generate a response to your question. Please try rephrasing it."
+            except Exception as e:
+                return self._question_error_message(e)
+    
+    def answer_question_stream(self, document_text: str, question: str,
+                               clause_index: Optional[ClauseIndex] = None) -> Iterator[str]:
+        """
+        Answer a specific question about the legal document, yielding the answer as it is generated
         
-        Document type:
+        Args:
+            document_text: The extracted text from the legal document
+            question: User's question about the document
+            clause_index: Optional index from build_clause_index (see answer_question)
+            
+        Returns:
+            Iterator over chunks of the AI-generated answer
         """
+        with span('answer_question', streamed=True, question_tokens=estimate_tokens(question),
+                  retrieval=clause_index is not None):
+            produced = False
+            try:
+                template, context, pinned_document = self._question_prompt(document_text, question, clause_index)
+                for chunk in self._generate_stream(template, context, question, pinned_document=pinned_document):
+                    produced = True
+                    yield chunk
+                if not produced:
+                    yield "I wasn't able to generate a response to your question. Please try rephrasing it."
+            except Exception as e:
+                yield ("\n\n" if produced else "") + self._question_error_message(e)
+    
+    def get_document_type(self, document_text: str) -> str:
+        """
+        Identify the type of legal document
+        
+        The local classifier answers when it is confident, which saves a model call;
+        otherwise the model is asked.
         
+        Args:
+            document_text: The extracted text from the legal document
+            
+        Returns:
+            Identified document type
+        """
+        # Only the opening text is sent, so documents that start the same share one call
+        opening = truncate_to_tokens(document_text, DOCUMENT_TYPE_TOKENS)
+        with span('get_document_type', document_tokens=estimate_tokens(opening)) as current:
+            local_type = self._local_document_type(document_text)
+            current.set_attribute('local', local_type is not None)
+            if local_type is not None:
+                return local_type
+            return self._coalesce('document_type', opening, lambda: self._get_document_type(opening))
+    
+    def _local_document_type(self, document_text: str) -> Optional[str]:
+        """The document type from the local classifier, or None if it is unsure or disabled"""
+        if self.document_classifier is None:
+            return None
+        return self.document_classifier.classify(truncate_to_tokens(document_text, LOCAL_DOCUMENT_TYPE_TOKENS))
+    
+    def _get_document_type(self, opening: str) -> str:
         try:
-            response = self.model.generate_content(prompt)
-            if response.text:
-                return response.text.strip()
+            text = self._generate(self._get_document_type_prompt(), opening,
+                                  output_tokens=DOCUMENT_TYPE_OUTPUT_TOKENS)
+            if text:
+                return text.strip()
             else:
                 return "Unknown Document Type"
         except Exception as e:
@@ -0,0 +1,153 @@
+"""
+Section-aware splitting of long legal documents into token-budgeted chunks
+"""
+import re
+from dataclasses import dataclass
+from typing import List
+
+
+# Headings such as "ARTICLE IV", "Section 12.3", "7. TERMINATION" or an all-caps line like "LATE PAYMENT PENALTIES"
+HEADING_PATTERN = re.compile(
+    r'^[ \t]*(?:'
+    r'(?:ARTICLE|Article|SECTION|Section|EXHIBIT|Exhibit|SCHEDULE|Schedule)\s+[\dIVXLC]+[.:]?.*'
+    r'|\d+(?:\.\d+)*\.?[ \t]+[A-Z][^\n]{0,80}'
+    r'|[A-Z][A-Z0-9 ,&/\'()\-]{2,80}:?'
+    r')[ \t]*$',
+    re.MULTILINE
+)
+
+# Rough characters-per-token ratio for English legal prose
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of model tokens in a piece of text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@dataclass
+class Section:
+    """A headed section of a document, as character offsets into the original text"""
+    heading: str
+    start: int
+    end: int
+
+
+@dataclass
+class TextChunk:
+    """A token-budgeted slice of a document"""
+    index: int
+    text: str
+    start: int
+    end: int
+    section: str
+
+    @property
+    def token_estimate(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def split_sections(text: str) -> List[Section]:
+    """
+    Split a document on its section headings
+
+    Text before the first heading becomes a "Preamble" section. A document without
+    recognizable headings is returned as a single section.
+    """
+    headings = list(HEADING_PATTERN.finditer(text))
+    sections = []
+
+    first_start = headings[0].start() if headings else len(text)
+    if text[:first_start].strip():
+        sections.append(Section("Preamble", 0, first_start))
+
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        sections.append(Section(match.group(0).strip().rstrip(':'), match.start(), end))
+
+    if not sections and text.strip():
+        sections.append(Section("Document", 0, len(text)))
+
+    return sections
+
+
+class DocumentChunker:
+    """Packs document sections into chunks that fit a token budget"""
+
+    def __init__(self, max_tokens: int = 8000, overlap_tokens: int = 200):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        if overlap_tokens < 0 or overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be between 0 and max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def chunk(self, text: str) -> List[TextChunk]:
+        """
+        Split text into chunks of at most max_tokens (plus overlap)
+
+        Whole sections are kept together where possible; sections larger than the
+        budget are split on paragraph, then sentence, then whitespace boundaries.
+        Each chunk after the first starts with up to overlap_tokens of the previous
+        chunk so clauses that straddle a boundary are seen in full at least once.
+
+        Args:
+            text: The full document text
+
+        Returns:
+            List of chunks in document order
+        """
+        max_chars = self.max_tokens * CHARS_PER_TOKEN
+        overlap_chars = self.overlap_tokens * CHARS_PER_TOKEN
+
+        # Break every section into pieces that individually fit the budget
+        pieces = []
+        for section in split_sections(text):
+            for start, end in self._split_span(text, section.start, section.end, max_chars):
+                pieces.append((start, end, section.heading))
+
+        # Greedily pack consecutive pieces into chunks
+        spans = []
+        for start, end, heading in pieces:
+            if spans and end - spans[-1][0] <= max_chars:
+                spans[-1][1] = end
+            else:
+                spans.append([start, end, heading])
+
+        chunks = []
+        for index, (start, end, heading) in enumerate(spans):
+            if index > 0 and overlap_chars:
+                start = self._snap_to_whitespace(text, max(spans[index - 1][0], start - overlap_chars), start)
+            chunk_text = text[start:end]
+            if chunk_text.strip():
+                chunks.append(TextChunk(len(chunks), chunk_text, start, end, heading))
+
+        return chunks
+
+    def _split_span(self, text: str, start: int, end: int, max_chars: int) -> List[tuple]:
+        """Split [start, end) into spans no longer than max_chars at the most natural boundary"""
+        if end - start <= max_chars:
+            return [(start, end)]
+
+        spans = []
+        while end - start > max_chars:
+            limit = start + max_chars
+            cut = -1
+            for boundary in ('\n\n', '. ', '\n', ' '):
+                cut = text.rfind(boundary, start + 1, limit)
+                if cut != -1:
+                    cut += len(boundary)
+                    break
+            if cut <= start:
+                cut = limit
+            spans.append((start, cut))
+            start = cut
+        spans.append((start, end))
+        return spans
+
+    def _snap_to_whitespace(self, text: str, position: int, limit: int) -> int:
+        """Move position forward to the next word boundary so overlap never starts mid-word"""
+        boundary = text.find(' ', position, limit)
+        newline = text.find('\n', position, limit)
+        candidates = [b + 1 for b in (boundary, newline) if b != -1]
+        return min(candidates) if candidates else position
@@ -0,0 +1,353 @@
+"""
+Prompt compaction: strip running headers and footers, repeated passages and extra whitespace
+"""
+import bisect
+import re
+import zlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from difflib import SequenceMatcher
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from .chunking import HEADING_PATTERN, estimate_tokens
+
+# Lines this close to the top or bottom of a page are header/footer candidates
+EDGE_LINES = 2
+# Longer lines are body text, never a header or footer
+MAX_EDGE_WORDS = 12
+# A normalized edge line on at least this share of pages (and MIN_REPEAT_PAGES pages) is a running header/footer
+REPEAT_PAGE_SHARE = 0.5
+MIN_REPEAT_PAGES = 3
+PAGE_NUMBER_LINE = re.compile(r'^(?:page\s*)?[-–—(\[]?\s*\d{1,4}\s*(?:(?:of|/)\s*\d{1,4})?\s*[-–—)\]]?$', re.IGNORECASE)
+
+# Passages shorter than this are never treated as duplicates
+MIN_PASSAGE_WORDS = 12
+SHINGLE_WORDS = 5
+# Smallest shingle hashes indexed per passage to find duplicate candidates
+SKETCH_SIZE = 4
+# Candidates compared in full per passage
+MAX_CANDIDATES = 32
+NEAR_DUPLICATE_SIMILARITY = 0.8
+# Near-duplicates whose edits span more words than this are kept in full
+MAX_DIFFERING_WORDS = 8
+# Surrounding words quoted with an edit, at most, to pin down where in the passage it falls
+MAX_CONTEXT_WORDS = 4
+# Opening words of the repeated passage quoted in a duplicate marker
+MARKER_OPENING_WORDS = 8
+
+HORIZONTAL_SPACE = re.compile(r'[ \t\u00a0\u2000-\u200b\u3000]+')
+WORD = re.compile(r'\w[\w.,/%$-]*\w|\w')
+
+
+@dataclass
+class CompactionStats:
+    """What compaction removed from a document"""
+    original_tokens: int
+    compact_tokens: int
+    boilerplate_lines: int = 0
+    duplicate_passages: int = 0
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of estimated tokens removed"""
+        return 1 - self.compact_tokens / self.original_tokens if self.original_tokens else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {**asdict(self), 'reduction': self.reduction}
+
+
+class CompactedText:
+    """
+    Compacted document text with a map back to offsets in the original
+
+    The text is built from verbatim pieces of the original plus a few inserted
+    separators and markers; each piece records where it came from.
+    """
+
+    def __init__(self, text: str, stats: CompactionStats, compact_starts: List[int],
+                 original_starts: List[int], verbatim: List[bool]):
+        self.text = text
+        self.stats = stats
+        self._compact_starts = compact_starts
+        self._original_starts = original_starts
+        self._verbatim = verbatim
+
+    @classmethod
+    def identity(cls, text: str) -> 'CompactedText':
+        """The text unchanged, for when compaction is turned off"""
+        tokens = estimate_tokens(text)
+        return cls(text, CompactionStats(tokens, tokens), [0], [0], [True])
+
+    def to_original(self, offset: int) -> int:
+        """
+        Map an offset in the compacted text to the corresponding offset in the original
+
+        Offsets inside an inserted marker map to the start of the passage it replaced.
+        """
+        i = max(0, bisect.bisect_right(self._compact_starts, offset) - 1)
+        if not self._verbatim[i]:
+            return self._original_starts[i]
+        return self._original_starts[i] + offset - self._compact_starts[i]
+
+    def original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """Map a [start, end) range of the compacted text to the original"""
+        if end <= start:
+            position = self.to_original(start)
+            return position, position
+        return self.to_original(start), self.to_original(end - 1) + 1
+
+
+class _Builder:
+    """Appends pieces of compacted text while recording their original offsets"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.length = 0
+        self.compact_starts: List[int] = []
+        self.original_starts: List[int] = []
+        self.verbatim: List[bool] = []
+        self._original_end = -1
+
+    def copy(self, piece: str, original_start: int):
+        """Append a piece taken verbatim from the original at original_start"""
+        if not piece:
+            return
+        # Extend the previous piece when this one continues it in the original
+        if not (self.verbatim and self.verbatim[-1] and self._original_end == original_start):
+            self.compact_starts.append(self.length)
+            self.original_starts.append(original_start)
+            self.verbatim.append(True)
+        self.parts.append(piece)
+        self.length += len(piece)
+        self._original_end = original_start + len(piece)
+
+    def insert(self, piece: str, original_position: int):
+        """Append text that does not exist in the original, anchored at original_position"""
+        if not piece:
+            return
+        self.compact_starts.append(self.length)
+        self.original_starts.append(original_position)
+        self.verbatim.append(False)
+        self.parts.append(piece)
+        self.length += len(piece)
+        self._original_end = -1
+
+    def copy_normalized(self, line: str, original_start: int):
+        """Append a line with runs of horizontal whitespace collapsed to single spaces"""
+        position = 0
+        for match in HORIZONTAL_SPACE.finditer(line):
+            self.copy(line[position:match.start()], original_start + position)
+            if match.group() == ' ':
+                self.copy(' ', original_start + match.start())
+            else:
+                self.insert(' ', original_start + match.start())
+            position = match.end()
+        self.copy(line[position:], original_start + position)
+
+
+def _edge_key(line: str) -> str:
+    """Header/footer comparison key: case, spacing and numbers (such as page numbers) ignored"""
+    return re.sub(r'\d+', '#', HORIZONTAL_SPACE.sub(' ', line.strip().lower()))
+
+
+def _boilerplate_lines(lines: List[Tuple[int, str]], page_starts: Sequence[int]) -> FrozenSet[int]:
+    """Indexes of running header/footer and page-number lines"""
+    pages: List[List[int]] = [[] for _ in page_starts]
+    for index, (start, line) in enumerate(lines):
+        if line.strip():
+            pages[max(0, bisect.bisect_right(page_starts, start) - 1)].append(index)
+
+    edges = [[index for index in dict.fromkeys(page[:EDGE_LINES] + page[-EDGE_LINES:])
+              if len(lines[index][1].split()) <= MAX_EDGE_WORDS]
+             for page in pages]
+    counts = Counter(key for edge in edges for key in {_edge_key(lines[index][1]) for index in edge})
+    repeated_on = max(MIN_REPEAT_PAGES, REPEAT_PAGE_SHARE * len(pages))
+
+    boilerplate = set()
+    for edge in edges:
+        for index in edge:
+            line = lines[index][1].strip()
+            if PAGE_NUMBER_LINE.match(line) or counts[_edge_key(line)] >= repeated_on:
+                boilerplate.add(index)
+    return frozenset(boilerplate)
+
+
+def _passages(lines: List[Tuple[int, str]], skip: FrozenSet[int]) -> List[List[int]]:
+    """Group kept line indexes into passages separated by blank lines and headings"""
+    passages, current = [], []
+    for index, (_, line) in enumerate(lines):
+        if index in skip:
+            continue
+        if not line.strip() or HEADING_PATTERN.fullmatch(line):
+            if current:
+                passages.append(current)
+            current = []
+            if line.strip():
+                # Headings are passages of their own, so they always survive
+                passages.append([index])
+            continue
+        current.append(index)
+    if current:
+        passages.append(current)
+    return passages
+
+
+def _shingles(words: List[str]) -> FrozenSet[int]:
+    if len(words) < SHINGLE_WORDS:
+        return frozenset([zlib.crc32(' '.join(words).encode('utf-8'))])
+    return frozenset(zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode('utf-8'))
+                     for i in range(len(words) - SHINGLE_WORDS + 1))
+
+
+def word_shingles(text: str) -> FrozenSet[int]:
+    """crc32 hashes of the overlapping SHINGLE_WORDS-word runs of a text, ignoring case and spacing"""
+    return _shingles([word.lower() for word in WORD.findall(text)])
+
+
+class _PassageIndex:
+    """Finds earlier passages that a passage duplicates or nearly duplicates"""
+
+    def __init__(self):
+        self._shingles: List[FrozenSet[int]] = []
+        self._words: List[List[str]] = []
+        self._openings: List[str] = []
+        self._sketches: Dict[int, List[int]] = {}
+
+    def find(self, shingles: FrozenSet[int]) -> Optional[int]:
+        # Passages sharing the most sketch values are the likeliest duplicates
+        candidates = Counter(candidate for value in sorted(shingles)[:SKETCH_SIZE]
+                             for candidate in self._sketches.get(value, ()))
+        best, best_similarity = None, NEAR_DUPLICATE_SIMILARITY
+        for candidate, _ in candidates.most_common(MAX_CANDIDATES):
+            other = self._shingles[candidate]
+            # Jaccard similarity can never exceed the ratio of the set sizes
+            if min(len(shingles), len(other)) < best_similarity * max(len(shingles), len(other)):
+                continue
+            similarity = len(shingles & other) / len(shingles | other)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def add(self, original_words: List[str], shingles: FrozenSet[int]):
+        passage_id = len(self._shingles)
+        self._shingles.append(shingles)
+        self._words.append(original_words)
+        self._openings.append(' '.join(original_words[:MARKER_OPENING_WORDS]))
+        for value in sorted(shingles)[:SKETCH_SIZE]:
+            self._sketches.setdefault(value, []).append(passage_id)
+
+    def opening(self, passage_id: int) -> str:
+        """First words of an indexed passage, to quote in a marker"""
+        return self._openings[passage_id]
+
+    def differences(self, passage_id: int, words: List[str]) -> Optional[List[Tuple[str, str]]]:
+        """
+        The edits that turn an earlier passage into this one, each quoted in context
+
+        The word sequences are diffed in order, so swapped parties or a dropped
+        "not" show up even when the same words appear elsewhere in the passage.
+        Each edit is widened by the fewest surrounding words that make its earlier
+        wording unique within the earlier passage.
+
+        Returns:
+            List of (earlier wording, new wording) pairs, or None if the passages
+            differ in too many words or an edit cannot be placed unambiguously
+        """
+        earlier = self._words[passage_id]
+        earlier_lower = [word.lower() for word in earlier]
+        current_lower = [word.lower() for word in words]
+        opcodes = [opcode for opcode in SequenceMatcher(None, earlier_lower, current_lower, autojunk=False).get_opcodes()
+                   if opcode[0] != 'equal']
+        if sum(max(i2 - i1, j2 - j1) for _, i1, i2, j1, j2 in opcodes) > MAX_DIFFERING_WORDS:
+            return None
+
+        edits = []
+        for _, i1, i2, j1, j2 in opcodes:
+            for context in range(1, MAX_CONTEXT_WORDS + 1):
+                start, end = max(0, i1 - context), min(len(earlier), i2 + context)
+                quoted = earlier_lower[start:end]
+                occurrences = sum(earlier_lower[k:k + len(quoted)] == quoted
+                                  for k in range(len(earlier_lower) - len(quoted) + 1))
+                if occurrences == 1:
+                    new_start, new_end = max(0, j1 - (i1 - start)), min(len(words), j2 + (end - i2))
+                    edits.append((' '.join(earlier[start:end]), ' '.join(words[new_start:new_end])))
+                    break
+            else:
+                return None
+        return edits
+
+def compact_text(text: str, page_starts: Optional[Sequence[int]] = None) -> CompactedText:
+    """
+    Compact document text before it is sent to the model
+
+    - Running headers and footers (lines repeated at the top or bottom of most
+      pages, ignoring page numbers) and page-number lines are dropped; this needs
+      page_starts, so it only applies to paged formats such as PDF
+    - A passage that repeats an earlier one is replaced by a marker quoting the
+      start of that passage; near duplicates quote each edit with the words around
+      it, so facts such as a changed amount, swapped parties or a dropped "not"
+      survive. A near duplicate whose edits cannot all be quoted that way is kept
+      in full
+    - Runs of spaces and tabs are collapsed and consecutive blank lines merged
+
+    Args:
+        text: The extracted document text
+        page_starts: Offset in text at which each page begins, in order
+
+    Returns:
+        CompactedText with the compacted text, statistics and offset map
+    """
+    lines: List[Tuple[int, str]] = []
+    position = 0
+    for line in text.split('\n'):
+        lines.append((position, line))
+        position += len(line) + 1
+
+    boilerplate = _boilerplate_lines(lines, page_starts) if page_starts and len(page_starts) > 1 else frozenset()
+
+    index = _PassageIndex()
+    builder = _Builder()
+    duplicates = 0
+    previous = None
+    for passage in _passages(lines, boilerplate):
+        if previous is not None:
+            # Keep one blank line where the original had any between the passages
+            blank = any(not lines[i][1].strip() for i in range(previous + 1, passage[0]))
+            builder.insert('\n\n' if blank else '\n', lines[passage[0]][0])
+        previous = passage[-1]
+
+        passage_text = ' '.join(lines[i][1] for i in passage)
+        original_words = WORD.findall(passage_text)
+        words = [word.lower() for word in original_words]
+        if len(words) >= MIN_PASSAGE_WORDS:
+            shingles = _shingles(words)
+            earlier = index.find(shingles)
+            if earlier is not None:
+                edits = index.differences(earlier, original_words)
+                marker = f'[Repeats the passage beginning "{index.opening(earlier)}"'
+                if edits:
+                    marker += ", except " + " and ".join(f'"{old}" reads "{new}"' for old, new in edits)
+                marker += "]"
+                # A marker no shorter than the passage saves nothing
+                if edits is not None and len(marker) < len(passage_text):
+                    builder.insert(marker, lines[passage[0]][0])
+                    duplicates += 1
+                    continue
+            index.add(original_words, shingles)
+
+        for j, i in enumerate(passage):
+            if j:
+                builder.copy('\n', lines[i][0] - 1)
+            start, line = lines[i]
+            stripped = line.strip()
+            if stripped:
+                builder.copy_normalized(stripped, start + line.index(stripped[0]))
+
+    compacted = ''.join(builder.parts)
+    stats = CompactionStats(
+        original_tokens=estimate_tokens(text),
+        compact_tokens=estimate_tokens(compacted),
+        boilerplate_lines=len(boilerplate),
+        duplicate_passages=duplicates,
+    )
+    return CompactedText(compacted, stats, builder.compact_starts, builder.original_starts, builder.verbatim)
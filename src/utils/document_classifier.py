@@ -0,0 +1,179 @@
+"""
+Local TF-IDF document-type classifier, so most documents are typed without a model call
+
+The model is a small JSON artifact (document_type_model.json) built from the
+example texts in data/document_types/; rebuild it after editing them with:
+
+    python -m src.utils.document_classifier
+"""
+import json
+import math
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .retrieval import tokenize
+
+MODEL_PATH = Path(__file__).parent / "document_type_model.json"
+EXAMPLES_DIR = Path(__file__).parent.parent.parent / "data" / "document_types"
+EXAMPLE_SEPARATOR = "\n---\n"
+
+# Example file name (without .txt) -> label returned for the document type
+DOCUMENT_TYPES = {
+    'rental_agreement': "Rental Agreement",
+    'employment_contract': "Employment Contract",
+    'loan_agreement': "Loan Agreement",
+    'terms_of_service': "Terms of Service",
+    'privacy_policy': "Privacy Policy",
+    'purchase_agreement': "Purchase Agreement",
+    'service_contract': "Service Contract",
+    'nda': "Non-Disclosure Agreement",
+}
+
+# Highest-weighted terms kept per document type in the artifact
+MAX_TERMS_PER_TYPE = 150
+# Softmax temperature over cosine scores: lower makes confidence rise faster with the margin
+TEMPERATURE = 0.04
+
+
+@dataclass
+class DocumentTypePrediction:
+    """The likeliest document type and how sure the classifier is of it"""
+    label: str
+    confidence: float
+    scores: Dict[str, float]
+
+
+def _features(text: str) -> Counter:
+    """Word and two-word-phrase counts, stopwords removed"""
+    tokens = tokenize(text)
+    return Counter(tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])])
+
+
+def _weights(counts: Counter, idf: Dict[str, float], default_idf: float) -> Dict[str, float]:
+    """Sublinear TF-IDF weights, L2-normalized; unseen terms count towards the norm only"""
+    weights = {term: (1 + math.log(count)) * idf.get(term, default_idf) for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items() if term in idf} if norm else {}
+
+
+def build_model(examples: Dict[str, List[str]], max_terms: int = MAX_TERMS_PER_TYPE,
+                temperature: float = TEMPERATURE) -> Dict:
+    """
+    Build the classifier artifact from example texts
+
+    Each document type is represented by the centroid of its examples' TF-IDF
+    vectors, trimmed to its highest-weighted terms.
+
+    Args:
+        examples: Document type label -> example texts
+        max_terms: Terms kept per document type
+        temperature: Softmax temperature stored with the model
+
+    Returns:
+        JSON-serializable model
+    """
+    documents = [(label, _features(text)) for label, texts in examples.items() for text in texts]
+    document_frequency = Counter(term for _, counts in documents for term in counts)
+    idf = {term: math.log((1 + len(documents)) / (1 + frequency)) + 1 for term, frequency in document_frequency.items()}
+    default_idf = math.log(1 + len(documents)) + 1
+
+    centroids = {}
+    for label in examples:
+        vectors = [_weights(counts, idf, default_idf) for example_label, counts in documents if example_label == label]
+        centroid = Counter()
+        for vector in vectors:
+            centroid.update(vector)
+        top = centroid.most_common(max_terms)
+        norm = math.sqrt(sum(weight * weight for _, weight in top))
+        centroids[label] = {term: round(weight / norm, 4) for term, weight in top}
+
+    kept = {term for centroid in centroids.values() for term in centroid}
+    return {
+        'temperature': temperature,
+        'default_idf': round(default_idf, 4),
+        'idf': {term: round(idf[term], 4) for term in sorted(kept)},
+        'centroids': centroids,
+    }
+
+
+class DocumentClassifier:
+    """Classifies a document's opening text into one of the known document types"""
+
+    def __init__(self, model: Optional[Dict] = None, min_confidence: Optional[float] = None):
+        """
+        Args:
+            model: Model built by build_model (defaults to the shipped artifact)
+            min_confidence: Confidence below which classify returns None
+                (defaults to DOCUMENT_TYPE_MIN_CONFIDENCE or 0.6)
+        """
+        if model is None:
+            model = json.loads(MODEL_PATH.read_text(encoding='utf-8'))
+        self.min_confidence = (min_confidence if min_confidence is not None
+                               else float(os.getenv('DOCUMENT_TYPE_MIN_CONFIDENCE', '0.6')))
+        self.temperature = model['temperature']
+        self.default_idf = model['default_idf']
+        self.idf = model['idf']
+        self.centroids = model['centroids']
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.centroids)
+
+    def predict(self, text: str) -> DocumentTypePrediction:
+        """
+        Score the text against every document type
+
+        Confidence is the softmax probability of the best type over the cosine
+        similarities, so text that resembles no type (or two types equally) scores low.
+
+        Args:
+            text: Document text, usually its opening
+
+        Returns:
+            DocumentTypePrediction with the best label, its confidence and every cosine score
+        """
+        vector = _weights(_features(text), self.idf, self.default_idf)
+        scores = {label: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+                  for label, centroid in self.centroids.items()}
+        best = max(scores, key=scores.get)
+        total = sum(math.exp((score - scores[best]) / self.temperature) for score in scores.values())
+        return DocumentTypePrediction(best, 1 / total, scores)
+
+    def classify(self, text: str) -> Optional[str]:
+        """The document type, or None if the classifier is not confident enough to skip the model"""
+        prediction = self.predict(text)
+        return prediction.label if prediction.confidence >= self.min_confidence else None
+
+
+def load_examples(directory: Path = EXAMPLES_DIR) -> Dict[str, List[str]]:
+    """Read the example texts of every document type"""
+    examples = {}
+    for name, label in DOCUMENT_TYPES.items():
+        text = (directory / f"{name}.txt").read_text(encoding='utf-8')
+        examples[label] = [example.strip() for example in text.split(EXAMPLE_SEPARATOR) if example.strip()]
+    return examples
+
+
+_default_classifier: Optional[DocumentClassifier] = None
+_default_classifier_lock = threading.Lock()
+
+
+def get_default_document_classifier() -> Optional[DocumentClassifier]:
+    """Return the process-wide classifier, or None if disabled via LOCAL_DOCUMENT_TYPE=off"""
+    global _default_classifier
+    if os.getenv('LOCAL_DOCUMENT_TYPE', 'on').lower() in ('off', '0', 'false'):
+        return None
+    with _default_classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = DocumentClassifier()
+        return _default_classifier
+
+
+if __name__ == "__main__":
+    model = build_model(load_examples())
+    MODEL_PATH.write_text(json.dumps(model, indent=1, sort_keys=True) + "\n", encoding='utf-8')
+    print(f"Wrote {MODEL_PATH} ({len(model['idf']):,} terms, {len(model['centroids'])} document types)")
@@ -2,77 +2,405 @@
 Document processor for extracting text from various file formats
 """
 import PyPDF2
-import docx
 import io
-from typing import Optional, Dict, Any
+import logging
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Iterable, Iterator, List, BinaryIO, Tuple, Union
+
+from .compaction import CompactedText, compact_text
+from .docx_reader import extract_docx_text
+from .text_stats import compute_text_stats, decode_text
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Raw bytes, a path on disk, or a binary file-like object
+DocumentSource = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO]
+
+# Non-seekable streams are buffered in memory up to this size, then spill to disk
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+
+class _MappedFile(mmap.mmap):
+    """Read-only memory map with the file-object methods zipfile and PyPDF2 check for"""
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+
+
+@contextmanager
+def open_document(source: DocumentSource) -> Iterator[BinaryIO]:
+    """
+    Open a document source as a seekable binary stream without copying it
+    
+    Paths are memory-mapped, so the OS page cache is shared by every reader of the
+    same file. Seekable file-like objects (such as Streamlit uploads) are used in
+    place, non-seekable streams are spooled to a temporary file, and in-memory
+    bytes are wrapped without a copy.
+    
+    Args:
+        source: Raw bytes, a file path, or a binary file-like object
+        
+    Yields:
+        A seekable binary stream positioned at the start of the document
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # Empty files cannot be memory-mapped
+                yield io.BytesIO(b"")
+                return
+            with _MappedFile(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        # BytesIO shares an immutable bytes buffer until it is written to
+        yield io.BytesIO(source)
+    elif getattr(source, 'seekable', lambda: False)():
+        source.seek(0)
+        yield source
+    else:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spooled:
+            shutil.copyfileobj(source, spooled)
+            spooled.seek(0)
+            yield spooled
+
+
+def source_name(source: DocumentSource) -> Optional[str]:
+    """File name of a path or named file-like source, if it has one"""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.fspath(source))
+    name = getattr(source, 'name', None)
+    return os.path.basename(name) if isinstance(name, str) else None
+
+
+def source_size(source: DocumentSource) -> Optional[int]:
+    """Size of a source in bytes, when it is known without reading it"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    # Streamlit uploads report their size
+    size = getattr(source, 'size', None)
+    return size if isinstance(size, int) else None
+
+
+@dataclass
+class PageText:
+    """Text of one page with its character offsets in the joined document text"""
+    text: str
+    page_number: int
+    start: int
+    end: int
+    total_pages: int
+    # Detected encoding of a TXT file
+    encoding: Optional[str] = None
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) in a worker process with its own reader"""
+    with open(path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by every processor in this process, started on first use"""
+    with _pools_lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            # Workers are spawned rather than forked: the app process runs many threads
+            pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _pools[max_workers] = pool
+        return pool
+
+
+def _discard_pool(max_workers: int, pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next document starts a fresh one"""
+    with _pools_lock:
+        if _pools.get(max_workers) is pool:
+            del _pools[max_workers]
+    pool.shutdown(wait=False, cancel_futures=True)
 
 
 class DocumentProcessor:
-    """Handles document processing and text extraction"""
+    """
+    Handles document processing and text extraction
     
-    def __init__(self):
+    Args:
+        pdf_workers: Worker processes for PDF extraction (defaults to PDF_WORKERS or the CPU count)
+        parallel_min_pages: PDFs with fewer pages are extracted serially in-process
+        compact_prompts: Strip headers, footers and repeated passages from the text sent
+            to the model (defaults to COMPACT_PROMPTS, which is on)
+    """
+    
+    def __init__(self, pdf_workers: Optional[int] = None, parallel_min_pages: Optional[int] = None,
+                 compact_prompts: Optional[bool] = None):
         self.supported_formats = {'.pdf', '.docx', '.txt'}
+        self.pdf_workers = pdf_workers or int(os.getenv('PDF_WORKERS', '0')) or os.cpu_count() or 1
+        self.parallel_min_pages = parallel_min_pages or int(os.getenv('PDF_PARALLEL_MIN_PAGES', '64'))
+        if compact_prompts is None:
+            compact_prompts = os.getenv('COMPACT_PROMPTS', 'on').lower() not in ('off', '0', 'false')
+        self.compact_prompts = compact_prompts
     
-    def extract_text_from_pdf(self, file_content: bytes) -> str:
-        """Extract text from PDF file"""
-        try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            text = ""
+    def _pdf_page_texts(self, source: DocumentSource, stream: BinaryIO,
+                        pdf_reader: PyPDF2.PdfReader) -> Iterator[str]:
+        """
+        Yield raw page texts in order, sharding large PDFs across worker processes
+        
+        If the pool breaks (a worker crashed, or spawned workers cannot import the
+        main module) it is discarded and the remaining pages are extracted serially.
+        """
+        total_pages = len(pdf_reader.pages)
+        if self.pdf_workers <= 1 or total_pages < self.parallel_min_pages:
             for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+                yield page.extract_text() or ""
+            return
+        
+        # Workers open the PDF from disk instead of each receiving a pickled copy
+        if isinstance(source, (str, os.PathLike)):
+            path, temporary = os.fspath(source), False
+        else:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as file:
+                stream.seek(0)
+                shutil.copyfileobj(stream, file)
+            path, temporary = file.name, True
+        
+        # Two shards per worker balance uneven pages and let the first pages arrive early
+        shard_size = -(-total_pages // (self.pdf_workers * 2))
+        pool = _get_pool(self.pdf_workers)
+        futures = []
+        extracted = 0
+        try:
+            for start in range(0, total_pages, shard_size):
+                futures.append(pool.submit(_extract_page_range, path, start, min(start + shard_size, total_pages)))
+            for future in futures:
+                for page_text in future.result():
+                    yield page_text
+                    extracted += 1
+        except BrokenProcessPool as e:
+            logger.warning("PDF worker pool broke (%s); extracting the remaining pages serially", e)
+            _discard_pool(self.pdf_workers, pool)
+            for page in pdf_reader.pages[extracted:]:
+                yield page.extract_text() or ""
+        finally:
+            for future in futures:
+                future.cancel()
+            if temporary:
+                # Safe on POSIX even if a worker still has the file open
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+    
+    def iter_pdf_pages(self, file_content: DocumentSource) -> Iterator[PageText]:
+        """
+        Extract text from a PDF lazily, one page at a time
+        
+        Offsets refer to the text returned by extract_text_from_pdf, so callers can
+        start on the first pages while later ones are still being parsed. PDFs of at
+        least parallel_min_pages pages are split into page ranges extracted by a
+        process pool and reassembled in page order.
+        
+        Args:
+            file_content: PDF as bytes, a file path, or a binary file-like object
+            
+        Yields:
+            PageText for each page, in order
+        """
+        try:
+            with open_document(file_content) as stream:
+                pdf_reader = PyPDF2.PdfReader(stream)
+                total_pages = len(pdf_reader.pages)
+                offset = 0
+                page_texts = self._pdf_page_texts(file_content, stream, pdf_reader)
+                for page_number, page_text in enumerate(page_texts, start=1):
+                    if offset == 0:
+                        # Leading whitespace of the document is dropped, as strip() would
+                        page_text = page_text.lstrip()
+                    start = offset + 1 if offset else 0
+                    if offset or page_text:
+                        offset = start + len(page_text)
+                    yield PageText(page_text, page_number, start, start + len(page_text), total_pages)
         except Exception as e:
             raise Exception(f"Error reading PDF: {str(e)}")
     
-    def extract_text_from_docx(self, file_content: bytes) -> str:
-        """Extract text from DOCX file"""
+    def join_pages(self, pages: Iterable[PageText]) -> str:
+        """Join extracted pages into the document text (pages are separated by newlines)"""
+        parts = [page.text for page in pages]
+        # Skip the empty pages before the first text, matching the offsets of iter_pdf_pages
+        first = next((i for i, part in enumerate(parts) if part), len(parts))
+        return "\n".join(parts[first:]).rstrip()
+    
+    def extract_text_from_pdf(self, file_content: DocumentSource) -> str:
+        """Extract text from PDF file"""
+        return self.join_pages(self.iter_pdf_pages(file_content))
+    
+    def extract_text_from_docx(self, file_content: DocumentSource) -> str:
+        """
+        Extract text from DOCX file
+        
+        The package XML is streamed directly rather than loaded through python-docx,
+        and table rows, footnotes, headers and footers are included.
+        """
         try:
-            doc = docx.Document(io.BytesIO(file_content))
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
+            with open_document(file_content) as stream:
+                return extract_docx_text(stream)
         except Exception as e:
             raise Exception(f"Error reading DOCX: {str(e)}")
     
-    def extract_text_from_txt(self, file_content: bytes) -> str:
+    def extract_text_from_txt(self, file_content: DocumentSource) -> str:
         """Extract text from TXT file"""
+        return self.decode_txt(file_content)[0]
+    
+    def decode_txt(self, file_content: DocumentSource) -> Tuple[str, str]:
+        """
+        Decode a TXT file, detecting its encoding
+        
+        A byte order mark or UTF-16 byte pattern decides the encoding; otherwise
+        UTF-8 is tried first, then cp1252 and latin-1.
+        
+        Returns:
+            Tuple of (stripped text, encoding used)
+        """
         try:
-            return file_content.decode('utf-8').strip()
+            with open_document(file_content) as stream:
+                # Decode straight from the mapped or in-memory buffer when there is one
+                if isinstance(stream, mmap.mmap):
+                    buffer = stream
+                elif isinstance(stream, io.BytesIO):
+                    buffer = stream.getvalue()
+                else:
+                    buffer = stream.read()
+                text, encoding = decode_text(buffer)
+                return text.strip(), encoding
         except Exception as e:
             raise Exception(f"Error reading TXT: {str(e)}")
     
-    def process_document(self, file_content: bytes, file_name: str) -> Dict[str, Any]:
+    def iter_document_pages(self, file_content: DocumentSource, file_name: Optional[str] = None) -> Iterator[PageText]:
         """
-        Process uploaded document and extract text
+        Extract text page by page; PDFs are streamed, other formats yield one page
+        
+        Only the text is extracted (a TXT page carries its detected encoding); pass
+        the joined pages to build_document_info for statistics and compaction.
         
         Args:
-            file_content: Raw file content as bytes
-            file_name: Name of the uploaded file
+            file_content: Raw bytes, a file path, or a binary file-like object
+            file_name: Name of the uploaded file (defaults to the name of the path or file object)
             
-        Returns:
-            Dictionary with extracted text and metadata
+        Yields:
+            PageText for each page, in order
         """
-        # Get file extension
-        file_extension = '.' + file_name.split('.')[-1].lower()
-        
-        if file_extension not in self.supported_formats:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-        
-        # Extract text based on file type
+        file_name = file_name or source_name(file_content) or ''
+        file_extension = self.get_file_extension(file_name)
         if file_extension == '.pdf':
-            text = self.extract_text_from_pdf(file_content)
+            yield from self.iter_pdf_pages(file_content)
         elif file_extension == '.docx':
             text = self.extract_text_from_docx(file_content)
-        elif file_extension == '.txt':
-            text = self.extract_text_from_txt(file_content)
+            yield PageText(text, 1, 0, len(text), 1)
         else:
+            text, encoding = self.decode_txt(file_content)
+            yield PageText(text, 1, 0, len(text), 1, encoding)
+    
+    def get_file_extension(self, file_name: str) -> str:
+        """Return the lower-case extension of a supported file, or raise ValueError"""
+        file_extension = '.' + file_name.split('.')[-1].lower()
+        if file_extension not in self.supported_formats:
             raise ValueError(f"Unsupported file format: {file_extension}")
+        return file_extension
+    
+    def compact(self, text: str, page_starts: Optional[List[int]] = None) -> CompactedText:
+        """The text prompts are built from: compacted, unless COMPACT_PROMPTS=off"""
+        return compact_text(text, page_starts) if self.compact_prompts else CompactedText.identity(text)
+    
+    def build_document_info(self, text: str, file_name: str, encoding: Optional[str] = None,
+                            page_starts: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Build the document info dictionary for extracted text, counting it in a single pass
         
-        return {
+        'text' is the extracted text as shown to the user; 'prompt_text' is its compacted
+        form that analysis and chat prompts are built from, and 'compacted' maps offsets
+        in it back to 'text'.
+        
+        Args:
+            text: Extracted document text
+            file_name: Name of the uploaded file
+            encoding: Detected encoding of a text file
+            page_starts: Offset in text at which each page begins, for header/footer removal
+            
+        Returns:
+            Document info dictionary
+        """
+        stats = compute_text_stats(text)
+        compacted = self.compact(text, page_starts)
+        doc_info = {
             'text': text,
             'file_name': file_name,
-            'file_type': file_extension,
-            'word_count': len(text.split()),
-            'character_count': len(text)
+            'file_type': self.get_file_extension(file_name),
+            'word_count': stats.words,
+            'character_count': stats.characters,
+            'line_count': stats.lines,
+            'sentence_count': stats.sentences,
+            'clause_count': stats.clauses,
+            'estimated_tokens': stats.estimated_tokens,
+            'prompt_text': compacted.text,
+            'prompt_tokens': compacted.stats.compact_tokens,
+            'compacted': compacted
         }
+        if encoding is not None:
+            doc_info['encoding'] = encoding
+        return doc_info
+    
+    def process_document(self, file_content: DocumentSource, file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Process uploaded document and extract text
+        
+        Large files are best passed as a path or file object: they are read through a
+        memory map or the object itself instead of being copied into memory first.
+        
+        Args:
+            file_content: Raw bytes, a file path, or a binary file-like object
+            file_name: Name of the uploaded file (defaults to the name of the path or file object)
+            
+        Returns:
+            Dictionary with extracted text and metadata
+        """
+        file_name = file_name or source_name(file_content) or ''
+        
+        # Get file extension
+        file_extension = self.get_file_extension(file_name)
+        
+        with span('process_document', file_type=file_extension, bytes=source_size(file_content)) as current:
+            # Extract text based on file type
+            encoding, page_starts = None, None
+            if file_extension == '.pdf':
+                pages = list(self.iter_pdf_pages(file_content))
+                current.set_attribute('pages', pages[-1].total_pages if pages else 0)
+                text = self.join_pages(pages)
+                page_starts = [page.start for page in pages]
+            elif file_extension == '.docx':
+                text = self.extract_text_from_docx(file_content)
+            elif file_extension == '.txt':
+                text, encoding = self.decode_txt(file_content)
+            else:
+                raise ValueError(f"Unsupported file format: {file_extension}")
+            
+            doc_info = self.build_document_info(text, file_name, encoding, page_starts)
+            current.set_attributes(characters=doc_info['character_count'], words=doc_info['word_count'],
+                                   tokens=doc_info['estimated_tokens'], prompt_tokens=doc_info['prompt_tokens'])
+            return doc_info
@@ -0,0 +1,145 @@
+"""
+Streaming DOCX text extraction straight from the package XML
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import BinaryIO, Iterator, List, Tuple
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+PACKAGE_RELS = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+# Legacy copy of content (such as text boxes) that is already present in mc:Choice
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+OFFICE_DOCUMENT = 'officeDocument'
+# Secondary parts appended after the body, in this order
+EXTRA_PARTS = ('footnotes', 'endnotes', 'header', 'footer')
+
+# Inline run content and its text equivalent (matching python-docx)
+RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+CELL_SEPARATOR = ' | '
+
+
+def _relationships(package: zipfile.ZipFile, rels_path: str, base_dir: str) -> List[tuple]:
+    """(type, part path) pairs from a .rels part, in document order"""
+    try:
+        root = ET.fromstring(package.read(rels_path))
+    except KeyError:
+        return []
+    relationships = []
+    for relationship in root.iter(PACKAGE_RELS):
+        if relationship.get('TargetMode') == 'External':
+            continue
+        target = relationship.get('Target', '')
+        path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(base_dir, target))
+        relationships.append((relationship.get('Type', '').rsplit('/', 1)[-1], path))
+    return relationships
+
+
+def _iter_part_lines(stream: BinaryIO, keep_empty: bool) -> Iterator[str]:
+    """
+    Yield one line per paragraph, or per table row with cells joined by ' | '
+
+    Every element is detached from its parent as soon as it has been read, so
+    only the path from the root to the current element is ever held in memory.
+    """
+    stack = []
+    fallback_depth = 0
+    # Open paragraphs and table cells, innermost last; text boxes nest paragraphs in paragraphs
+    containers: List[Tuple[str, List[str]]] = []
+    # Cells of each open table row
+    rows: List[List[str]] = []
+
+    def emit(text: str) -> Iterator[str]:
+        """Hand finished text to the enclosing container, or yield it as a line"""
+        if not containers:
+            if text.strip(' |') or keep_empty:
+                yield text
+        elif containers[-1][0] == W + 'p':
+            # Text box content stays with the paragraph that anchors it
+            containers[-1][1].append(f" {text} " if text else '')
+        elif text:
+            containers[-1][1].append(text)
+
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            stack.append(element)
+            if tag == MC_FALLBACK:
+                fallback_depth += 1
+            elif fallback_depth:
+                pass
+            elif tag in (W + 'p', W + 'tc'):
+                containers.append((tag, []))
+            elif tag == W + 'tr':
+                rows.append([])
+            continue
+
+        stack.pop()
+        if tag == MC_FALLBACK:
+            fallback_depth -= 1
+        elif fallback_depth:
+            pass
+        elif tag == W + 'p':
+            yield from emit(''.join(containers.pop()[1]))
+        elif tag == W + 'tc':
+            cell = ' '.join(containers.pop()[1])
+            if rows:
+                rows[-1].append(cell)
+        elif tag == W + 'tr':
+            yield from emit(CELL_SEPARATOR.join(rows.pop()))
+        elif containers and containers[-1][0] == W + 'p':
+            if tag == W + 't':
+                containers[-1][1].append(element.text or '')
+            elif tag == W + 'br':
+                # Line breaks become newlines; page and column breaks add nothing
+                if element.get(W + 'type', 'textWrapping') == 'textWrapping':
+                    containers[-1][1].append('\n')
+            elif tag in RUN_TEXT:
+                containers[-1][1].append(RUN_TEXT[tag])
+
+        element.clear()
+        if stack:
+            stack[-1].remove(element)
+
+
+def iter_docx_lines(stream: BinaryIO) -> Iterator[str]:
+    """
+    Stream the text of a DOCX file line by line
+
+    The body comes first (paragraphs and table rows in document order), followed
+    by footnotes, endnotes, headers and footers. Headers and footers repeated
+    across sections are only included once.
+
+    Args:
+        stream: Seekable binary stream of the DOCX package
+
+    Yields:
+        One line per paragraph or table row
+    """
+    with zipfile.ZipFile(stream) as package:
+        main_parts = [path for kind, path in _relationships(package, '_rels/.rels', '') if kind == OFFICE_DOCUMENT]
+        main_part = main_parts[0] if main_parts else 'word/document.xml'
+        part_dir, part_name = posixpath.split(main_part)
+        related = _relationships(package, posixpath.join(part_dir, '_rels', part_name + '.rels'), part_dir)
+
+        with package.open(main_part) as part:
+            yield from _iter_part_lines(part, keep_empty=True)
+
+        seen_parts, seen_blocks = set(), set()
+        for kind in EXTRA_PARTS:
+            for path in (path for part_kind, path in related if part_kind == kind):
+                if path in seen_parts or path not in package.NameToInfo:
+                    continue
+                seen_parts.add(path)
+                with package.open(path) as part:
+                    lines = list(_iter_part_lines(part, keep_empty=False))
+                block = '\n'.join(lines)
+                if block and block not in seen_blocks:
+                    seen_blocks.add(block)
+                    yield from lines
+
+
+def extract_docx_text(stream: BinaryIO) -> str:
+    """Extract the full text of a DOCX file, including tables, notes, headers and footers"""
+    return '\n'.join(iter_docx_lines(stream)).strip()
@@ -0,0 +1,339 @@
+"""
+Model backends used by the legal document analyzer
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+from .chunking import estimate_tokens
+from .token_budget import TokenUsage
+
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.5-flash-lite'  # Best balance: 1,000 RPD
+
+# Stands in for the document text in prompts sent against a pinned document
+PINNED_DOCUMENT_REFERENCE = "(The full document is provided in your context above.)"
+
+SYSTEM_INSTRUCTION = (
+    "You are a legal expert helping everyday people understand complex legal documents. "
+    "The legal document to analyze is provided in your context."
+)
+
+
+@dataclass
+class DocumentHandle:
+    """Reference to a document pinned in a backend's context"""
+    name: str
+    document_hash: str
+    token_count: int
+    expires_at: float
+
+    @property
+    def expired(self) -> bool:
+        # Treat handles as expired slightly early so requests never race the server-side expiry
+        return time.time() > self.expires_at - 30
+
+
+class LLMBackend(ABC):
+    """
+    Interface between the analyzer and a text generation model
+
+    A backend may also support pinning a document: the document is sent once and
+    later prompts refer to it through a DocumentHandle instead of embedding it.
+    """
+
+    model_name: str
+
+    @abstractmethod
+    def generate(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        """Return the full response text for a prompt"""
+
+    def generate_with_usage(self, prompt: str, handle: Optional[DocumentHandle] = None,
+                            **kwargs) -> Tuple[str, Optional[TokenUsage]]:
+        """Return the response text and the tokens the call used, if the backend reports them"""
+        return self.generate(prompt, handle, **kwargs), None
+
+    def count_tokens(self, prompt: str, handle: Optional[DocumentHandle] = None) -> Optional[int]:
+        """Exact input tokens of a request (including a pinned document); None if the backend cannot count"""
+        return None
+
+    @abstractmethod
+    def generate_stream(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> Iterator[str]:
+        """Yield the response text for a prompt as it is generated"""
+
+    async def generate_async(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        """Return the full response text without blocking the event loop"""
+        return await asyncio.to_thread(self.generate, prompt, handle, **kwargs)
+
+    def pin_document(self, document_text: str, ttl_seconds: int = 3600) -> Optional[DocumentHandle]:
+        """Send a document once so later prompts can reference it; None if pinning is unsupported"""
+        return None
+
+    def release_document(self, handle: DocumentHandle):
+        """Free a pinned document before it expires"""
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini backend; pinned documents use Gemini context caching"""
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_GEMINI_MODEL):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.model_name = model_name
+        self._pinned_models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _model_for(self, handle: Optional[DocumentHandle]) -> Any:
+        if handle is None:
+            return self.model
+        with self._lock:
+            model = self._pinned_models.get(handle.name)
+        if model is None:
+            raise ValueError(f"Unknown or released document handle: {handle.name}")
+        return model
+
+    def generate(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        return self.generate_with_usage(prompt, handle, **kwargs)[0]
+
+    def generate_with_usage(self, prompt: str, handle: Optional[DocumentHandle] = None,
+                            **kwargs) -> Tuple[str, Optional[TokenUsage]]:
+        response = self._model_for(handle).generate_content(prompt, **kwargs)
+        metadata = getattr(response, 'usage_metadata', None)
+        usage = None
+        if metadata is not None:
+            usage = TokenUsage(metadata.prompt_token_count or 0, metadata.candidates_token_count or 0)
+        return response.text, usage
+
+    def count_tokens(self, prompt: str, handle: Optional[DocumentHandle] = None) -> Optional[int]:
+        # The pinned document was counted when it was cached
+        return self.model.count_tokens(prompt).total_tokens + (handle.token_count if handle else 0)
+
+    def generate_stream(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> Iterator[str]:
+        for chunk in self._model_for(handle).generate_content(prompt, stream=True, **kwargs):
+            if chunk.text:
+                yield chunk.text
+
+    async def generate_async(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        response = await self._model_for(handle).generate_content_async(prompt, **kwargs)
+        return response.text
+
+    def pin_document(self, document_text: str, ttl_seconds: int = 3600) -> Optional[DocumentHandle]:
+        try:
+            cached_content = caching.CachedContent.create(
+                model=f"models/{self.model_name}",
+                display_name="legal-reader-document",
+                system_instruction=SYSTEM_INSTRUCTION,
+                contents=[document_text],
+                ttl=datetime.timedelta(seconds=ttl_seconds)
+            )
+        except Exception:
+            # Context caching is unavailable for this model, key or document size
+            return None
+
+        handle = DocumentHandle(
+            name=cached_content.name,
+            document_hash=hashlib.sha256(document_text.encode('utf-8')).hexdigest(),
+            token_count=cached_content.usage_metadata.total_token_count,
+            expires_at=time.time() + ttl_seconds
+        )
+        with self._lock:
+            self._pinned_models[handle.name] = genai.GenerativeModel.from_cached_content(cached_content)
+        return handle
+
+    def release_document(self, handle: DocumentHandle):
+        with self._lock:
+            model = self._pinned_models.pop(handle.name, None)
+        if model is not None:
+            try:
+                caching.CachedContent.get(handle.name).delete()
+            except Exception:
+                # Already expired or deleted on the server
+                pass
+
+
+class LatencyDistribution:
+    """Samples simulated request latencies (in seconds) for the mock backend"""
+
+    def __init__(self, kind: str = 'fixed', **params: float):
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Invalid latency distribution: {kind}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def fixed(cls, seconds: float) -> 'LatencyDistribution':
+        return cls('fixed', seconds=seconds)
+
+    @classmethod
+    def uniform(cls, low: float, high: float) -> 'LatencyDistribution':
+        return cls('uniform', low=low, high=high)
+
+    @classmethod
+    def lognormal(cls, median: float, sigma: float = 0.5) -> 'LatencyDistribution':
+        """Long-tailed latencies typical of hosted model APIs"""
+        return cls('lognormal', median=median, sigma=sigma)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.params['seconds']
+        if self.kind == 'uniform':
+            return rng.uniform(self.params['low'], self.params['high'])
+        return rng.lognormvariate(math.log(self.params['median']), self.params['sigma'])
+
+
+class MockBackendError(Exception):
+    """Error injected by the mock backend, worded like the real API errors"""
+
+
+class MockBackend(LLMBackend):
+    """
+    Deterministic local backend for tests, benchmarks and offline runs
+
+    Response text is derived from a hash of the prompt (and pinned document), so
+    identical requests always get identical answers. Time to first token follows
+    the latency distribution, the rest of the response arrives at tokens_per_second,
+    and a seeded fraction of calls fails with an injected error. Every call is
+    recorded so tests can check exactly what would have been sent.
+
+    Args:
+        model_name: Name reported to the analyzer (part of response cache keys)
+        latency: Time-to-first-token distribution (defaults to no delay)
+        tokens_per_second: Output throughput; 0 returns the whole response at once
+        output_tokens: Approximate length of every response in tokens
+        error_rate: Fraction of calls that raise MockBackendError
+        error_messages: Messages to choose from for injected errors
+        seed: Seed for latency and error sampling
+    """
+
+    def __init__(self, model_name: str = "mock-model", latency: Optional[LatencyDistribution] = None,
+                 tokens_per_second: float = 0.0, output_tokens: int = 60, error_rate: float = 0.0,
+                 error_messages: Optional[List[str]] = None, seed: int = 0):
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.model_name = model_name
+        self.latency = latency or LatencyDistribution.fixed(0.0)
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.error_messages = error_messages or [
+            "429 Resource has been exhausted (e.g. check quota).",
+            "503 The model is overloaded. Please try again later."
+        ]
+        self.calls: List[Dict[str, Any]] = []
+        self._documents: Dict[str, str] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def input_characters(self) -> int:
+        """Total characters sent to the backend, including pinned documents"""
+        with self._lock:
+            return sum(call['input_characters'] for call in self.calls)
+
+    def _start_call(self, prompt: str, handle: Optional[DocumentHandle], kind: str) -> Dict[str, Any]:
+        """Record a call and sample its latency and outcome"""
+        with self._lock:
+            if handle is not None and handle.name not in self._documents:
+                raise ValueError(f"Unknown or released document handle: {handle.name}")
+            call = {
+                'kind': kind,
+                'input_characters': len(prompt),
+                'handle': handle.name if handle else None,
+                'latency': self.latency.sample(self._rng),
+                'error': self._rng.choice(self.error_messages) if self._rng.random() < self.error_rate else None,
+                'document_text': self._documents.get(handle.name, '') if handle else ''
+            }
+            self.calls.append({key: value for key, value in call.items() if key != 'document_text'})
+        return call
+
+    def _response_text(self, prompt: str, document_text: str, generation_config: Any = None) -> str:
+        """Build a deterministic response of roughly output_tokens tokens"""
+        digest = hashlib.sha256((document_text + prompt).encode('utf-8')).hexdigest()
+        words = [f"Mock response {digest[:12]} from {self.model_name}."]
+        filler = "This clause sets out the obligations of each party under the agreement."
+        while estimate_tokens(' '.join(words)) < self.output_tokens:
+            words.append(filler)
+        text = ' '.join(words)
+
+        # Honour JSON response schemas so structured-output callers can parse the reply
+        schema = getattr(generation_config, 'response_schema', None)
+        if isinstance(generation_config, dict):
+            schema = generation_config.get('response_schema')
+        if isinstance(schema, dict) and schema.get('properties'):
+            return json.dumps({name: f"{name}: {text}" for name in schema['properties']})
+        return text
+
+    def _stream_delays(self, text: str, call: Dict[str, Any]) -> Iterator[tuple]:
+        """Split text into chunks with the simulated delay before each one"""
+        chunks = [word + ' ' for word in text.split(' ')]
+        chunks[-1] = chunks[-1].rstrip(' ')
+        per_chunk = 0.0
+        if self.tokens_per_second > 0:
+            per_chunk = estimate_tokens(text) / self.tokens_per_second / len(chunks)
+        for i, chunk in enumerate(chunks):
+            yield (call['latency'] if i == 0 else 0.0) + per_chunk, chunk
+
+    def generate(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        call = self._start_call(prompt, handle, 'generate')
+        text = self._response_text(prompt, call['document_text'], kwargs.get('generation_config'))
+        time.sleep(sum(delay for delay, _ in self._stream_delays(text, call)))
+        if call['error']:
+            raise MockBackendError(call['error'])
+        return text
+
+    def generate_with_usage(self, prompt: str, handle: Optional[DocumentHandle] = None,
+                            **kwargs) -> Tuple[str, Optional[TokenUsage]]:
+        text = self.generate(prompt, handle, **kwargs)
+        return text, TokenUsage(self.count_tokens(prompt, handle), estimate_tokens(text))
+
+    def count_tokens(self, prompt: str, handle: Optional[DocumentHandle] = None) -> Optional[int]:
+        # The mock tokenizer is the analyzer's estimate
+        return estimate_tokens(prompt) + (handle.token_count if handle else 0)
+
+    def generate_stream(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> Iterator[str]:
+        call = self._start_call(prompt, handle, 'stream')
+        text = self._response_text(prompt, call['document_text'], kwargs.get('generation_config'))
+        chunks = list(self._stream_delays(text, call))
+        for i, (delay, chunk) in enumerate(chunks):
+            time.sleep(delay)
+            # Injected errors surface midway through the stream, as real disconnects do
+            if call['error'] and i == len(chunks) // 2:
+                raise MockBackendError(call['error'])
+            yield chunk
+
+    async def generate_async(self, prompt: str, handle: Optional[DocumentHandle] = None, **kwargs) -> str:
+        call = self._start_call(prompt, handle, 'generate_async')
+        text = self._response_text(prompt, call['document_text'], kwargs.get('generation_config'))
+        await asyncio.sleep(sum(delay for delay, _ in self._stream_delays(text, call)))
+        if call['error']:
+            raise MockBackendError(call['error'])
+        return text
+
+    def pin_document(self, document_text: str, ttl_seconds: int = 3600) -> Optional[DocumentHandle]:
+        document_hash = hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+        handle = DocumentHandle(
+            name=f"mock-documents/{document_hash[:16]}",
+            document_hash=document_hash,
+            token_count=estimate_tokens(document_text),
+            expires_at=time.time() + ttl_seconds
+        )
+        with self._lock:
+            self._documents[handle.name] = document_text
+            self.calls.append({'kind': 'pin', 'input_characters': len(document_text), 'handle': handle.name,
+                               'latency': 0.0, 'error': None})
+        return handle
+
+    def release_document(self, handle: DocumentHandle):
+        with self._lock:
+            self._documents.pop(handle.name, None)
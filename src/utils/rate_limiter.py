@@ -0,0 +1,223 @@
+"""
+Client-side quota-aware rate limiting with retry, backoff and jitter
+"""
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+RETRY_AFTER_PATTERN = re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE)
+
+
+class QuotaExhaustedError(Exception):
+    """Raised when a request cannot be admitted within the allowed wait (e.g. the daily quota is used up)"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously at capacity / period"""
+
+    def __init__(self, capacity: float, period_seconds: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / period_seconds
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if available now)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            amount = min(amount, self.capacity)
+            return max(0.0, (amount - self._tokens) / self.refill_rate)
+
+    def consume(self, amount: float):
+        """Take tokens unconditionally; the balance may go negative to account for overshoot"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= min(amount, self.capacity)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, self._tokens)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an error is a 429 / quota error worth retrying after a delay"""
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    message = str(error).lower()
+    return '429' in message or 'resource has been exhausted' in message or 'quota' in message
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an error is a temporary server-side failure worth retrying"""
+    if type(error).__name__ in ('ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded'):
+        return True
+    message = str(error).lower()
+    return '503' in message or '500 internal' in message or 'overloaded' in message
+
+
+class QuotaRateLimiter:
+    """
+    Shared limiter for requests per minute, requests per day and tokens per minute
+
+    Calls wait in line until every budget has room, so bursts are smoothed out
+    instead of failing against the API. Rate-limit and transient errors are
+    retried with exponential backoff and full jitter, honouring any retry delay
+    given in the error. A limit of None disables that budget.
+
+    Args:
+        requests_per_minute: Request budget per rolling minute
+        requests_per_day: Request budget per rolling day
+        tokens_per_minute: Input token budget per rolling minute
+        max_retries: Retries after a rate-limit or transient error
+        base_delay: First backoff delay in seconds
+        max_delay: Upper bound for a single backoff delay
+        max_wait: Longest a call may queue for budget before QuotaExhaustedError
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = 15, requests_per_day: Optional[int] = 1000,
+                 tokens_per_minute: Optional[int] = 250000, max_retries: int = 4, base_delay: float = 2.0,
+                 max_delay: float = 60.0, max_wait: float = 120.0):
+        self.buckets = {}
+        if requests_per_minute:
+            self.buckets['requests_per_minute'] = TokenBucket(requests_per_minute, 60)
+        if requests_per_day:
+            self.buckets['requests_per_day'] = TokenBucket(requests_per_day, 24 * 3600)
+        if tokens_per_minute:
+            self.buckets['tokens_per_minute'] = TokenBucket(tokens_per_minute, 60)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+        self._admission_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._rng = random.Random()
+        self.stats = {
+            'requests': 0,
+            'retries': 0,
+            'rate_limit_errors': 0,
+            'transient_errors': 0,
+            'rejected': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _count(self, name: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def acquire(self, tokens: int = 0):
+        """
+        Block until a request of the given input size fits every budget
+
+        Raises:
+            QuotaExhaustedError: If admission would take longer than max_wait
+        """
+        costs = {'requests_per_minute': 1, 'requests_per_day': 1, 'tokens_per_minute': tokens}
+        deadline = time.monotonic() + self.max_wait
+
+        # One caller at a time is admitted, so waiting callers are served in order
+        with self._admission_lock:
+            while True:
+                wait = max((bucket.wait_time(costs[name]) for name, bucket in self.buckets.items()), default=0.0)
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self._count('rejected')
+                    raise QuotaExhaustedError(
+                        f"API quota limit reached: no request budget for the next {wait:.0f}s. Please try again later."
+                    )
+                time.sleep(wait)
+                self._count('wait_seconds', wait)
+
+            for name, bucket in self.buckets.items():
+                bucket.consume(costs[name])
+        self._count('requests')
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, never shorter than a server-provided retry delay"""
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        match = RETRY_AFTER_PATTERN.search(str(error))
+        if match:
+            delay = max(delay, min(self.max_delay, float(match.group(1))))
+        return delay
+
+    def should_retry(self, attempt: int, error: Exception) -> bool:
+        """Record a failed attempt and decide whether it may be retried"""
+        if is_rate_limit_error(error):
+            self._count('rate_limit_errors')
+        elif is_transient_error(error):
+            self._count('transient_errors')
+        else:
+            return False
+        return attempt < self.max_retries
+
+    def wait_before_retry(self, attempt: int, error: Exception):
+        """Sleep for the backoff delay of a retry"""
+        self._count('retries')
+        time.sleep(self.backoff_delay(attempt, error))
+
+    def call(self, func: Callable[[], Any], tokens: int = 0) -> Any:
+        """
+        Run func within the budgets, retrying rate-limit and transient errors
+
+        Args:
+            func: The model call to make
+            tokens: Estimated input tokens of the call
+
+        Returns:
+            Whatever func returns
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                return func()
+            except Exception as e:
+                if not self.should_retry(attempt, e):
+                    raise
+                self.wait_before_retry(attempt, e)
+                attempt += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Remaining budget per limit plus request, retry and wait counters"""
+        with self._stats_lock:
+            metrics = dict(self.stats)
+        for name, bucket in self.buckets.items():
+            metrics[f'remaining_{name}'] = int(bucket.available)
+            metrics[f'limit_{name}'] = int(bucket.capacity)
+        return metrics
+
+
+_default_limiter: Optional[QuotaRateLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def _env_limit(name: str, default: str) -> Optional[int]:
+    value = os.getenv(name, default)
+    return int(value) if value and value != '0' else None
+
+
+def get_default_rate_limiter() -> Optional[QuotaRateLimiter]:
+    """Return the process-wide rate limiter, or None if disabled via RATE_LIMIT=off"""
+    global _default_limiter
+    if os.getenv('RATE_LIMIT', 'on').lower() in ('off', '0', 'false'):
+        return None
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = QuotaRateLimiter(
+                requests_per_minute=_env_limit('RATE_LIMIT_RPM', '15'),
+                requests_per_day=_env_limit('RATE_LIMIT_RPD', '1000'),
+                tokens_per_minute=_env_limit('RATE_LIMIT_TPM', '250000'),
+                max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', '120'))
+            )
+        return _default_limiter
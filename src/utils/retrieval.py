@@ -0,0 +1,149 @@
+"""
+Clause-level BM25 retrieval so questions only send the relevant parts of a document
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .chunking import split_sections
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n')
+SENTENCE_END = re.compile(r'(?<=[.;:!?])\s+')
+
+# Words that carry no signal for ranking clauses
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or shall that the their
+there these this to was were will with any all such may must what which who whom when where how
+do does can i my me we our you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+@dataclass
+class Clause:
+    """A clause of the document with its section label and character offsets"""
+    text: str
+    section: str
+    start: int
+    end: int
+
+
+def split_clauses(text: str, max_chars: int = 1200) -> List[Clause]:
+    """
+    Split a document into clauses
+
+    Each section is split into paragraphs, and paragraphs longer than max_chars
+    are split again on sentence boundaries.
+    """
+    clauses = []
+    for section in split_sections(text):
+        paragraph_start = section.start
+        for match in PARAGRAPH_BREAK.finditer(text, section.start, section.end):
+            clauses.extend(_split_paragraph(text, paragraph_start, match.start(), section.heading, max_chars))
+            paragraph_start = match.end()
+        clauses.extend(_split_paragraph(text, paragraph_start, section.end, section.heading, max_chars))
+    return clauses
+
+
+def _split_paragraph(text: str, start: int, end: int, section: str, max_chars: int) -> List[Clause]:
+    """Split one paragraph into clauses of at most max_chars, cutting only between sentences"""
+    pieces = []
+    piece_start = last_boundary = start
+    for boundary in [match.end() for match in SENTENCE_END.finditer(text, start, end)] + [end]:
+        if boundary - piece_start > max_chars and last_boundary > piece_start:
+            pieces.append((piece_start, last_boundary))
+            piece_start = last_boundary
+        last_boundary = boundary
+    pieces.append((piece_start, end))
+
+    return [Clause(text[s:e].strip(), section, s, e) for s, e in pieces if text[s:e].strip()]
+
+
+class ClauseIndex:
+    """
+    BM25 index over the clauses of one document
+
+    Postings are stored term-major in flat NumPy arrays (a CSC-style sparse
+    term/clause matrix) with the BM25 weight of every posting precomputed, so a
+    query is scored with one vectorized accumulation per query term.
+    """
+
+    def __init__(self, document_text: str, k1: float = 1.5, b: float = 0.75, max_clause_chars: int = 1200):
+        self.clauses = split_clauses(document_text, max_clause_chars)
+        self.vocabulary: Dict[str, int] = {}
+
+        term_ids, clause_ids, lengths = [], [], []
+        for clause_id, clause in enumerate(self.clauses):
+            tokens = tokenize(f"{clause.section} {clause.text}")
+            lengths.append(len(tokens))
+            for token in tokens:
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                clause_ids.append(clause_id)
+
+        clause_count = len(self.clauses)
+        term_count = len(self.vocabulary)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        average_length = float(lengths.mean()) if clause_count else 0.0
+        average_length = average_length or 1.0
+
+        # Collapse (term, clause) pairs into term frequencies, sorted term-major
+        pair_keys = np.asarray(term_ids, dtype=np.int64) * max(clause_count, 1) + np.asarray(clause_ids, dtype=np.int64)
+        unique_pairs, frequencies = np.unique(pair_keys, return_counts=True)
+        posting_terms = unique_pairs // max(clause_count, 1)
+        self.posting_clauses = (unique_pairs % max(clause_count, 1)).astype(np.int64)
+
+        document_frequency = np.bincount(posting_terms, minlength=term_count)
+        self.term_offsets = np.concatenate(([0], np.cumsum(document_frequency))).astype(np.int64)
+
+        idf = np.log1p((clause_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        length_norm = k1 * (1 - b + b * lengths[self.posting_clauses] / average_length)
+        self.posting_weights = idf[posting_terms] * frequencies * (k1 + 1) / (frequencies + length_norm)
+
+    def search(self, query: str, top_k: int = 8) -> List[Tuple[Clause, float]]:
+        """
+        Rank clauses against a query
+
+        Args:
+            query: The user's question
+            top_k: Maximum number of clauses to return
+
+        Returns:
+            List of (clause, score) pairs, best match first; clauses with no overlap are omitted
+        """
+        scores = np.zeros(len(self.clauses))
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            scores[self.posting_clauses[start:end]] += self.posting_weights[start:end]
+
+        if not len(scores) or top_k <= 0:
+            return []
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.clauses[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def build_context(self, query: str, top_k: int = 8) -> str:
+        """
+        Format the best-matching clauses for a prompt
+
+        Clauses are listed in document order with their section labels. If nothing
+        matches, the opening clauses are returned so the model still sees the parties
+        and purpose of the document.
+        """
+        matches = [clause for clause, _ in self.search(query, top_k)]
+        if not matches:
+            matches = self.clauses[:top_k]
+
+        matches.sort(key=lambda clause: clause.start)
+        return "\n\n".join(f"[Section: {clause.section}]\n{clause.text}" for clause in matches)
@@ -0,0 +1,243 @@
+"""
+Instant local red-flag scan over a curated lexicon of risky clauses
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from .tracing import span
+
+SEVERITIES = ('high', 'medium', 'low')
+# Characters of context kept on each side of a hit when no sentence boundary is closer
+EXCERPT_CONTEXT = 160
+# Excerpts kept per red flag
+MAX_EXCERPTS = 3
+
+_CHANGE = r"(?:change|modify|amend|revise|update|increase)"
+
+
+@dataclass(frozen=True)
+class RiskPattern:
+    """
+    A kind of risky clause and the phrases that reveal it
+
+    Phrases are lowercase regexes that each start with a literal word, so the
+    regex engine can jump straight between occurrences of that word instead of
+    trying the pattern at every character; gaps are bounded, so every phrase is
+    matched in time linear in the document length.
+    """
+    name: str
+    label: str
+    severity: str
+    explanation: str
+    phrases: Tuple[str, ...]
+
+
+RISK_PATTERNS = (
+    RiskPattern(
+        'automatic_renewal', "Automatic renewal", 'medium',
+        "The agreement renews on its own unless you cancel in time; note the cancellation deadline.",
+        (r"auto(?:matic(?:ally)?)?[- ]?renew(?:al|s|ed)?", r"renew(?:s|ed)? automatically",
+         r"evergreen (?:clause|term)")
+    ),
+    RiskPattern(
+        'late_fee', "Late fees", 'medium',
+        "Missing a due date costs extra; check the amount and any grace period.",
+        (r"late (?:fee|charge|payment (?:fee|charge|penalt(?:y|ies)))s?",)
+    ),
+    RiskPattern(
+        'default_interest', "Penalty or default interest", 'medium',
+        "A higher interest rate or compounding applies after a missed payment.",
+        (r"default (?:interest )?rate", r"penalty (?:interest|rate)", r"compound(?:ed|ing)? (?:daily|monthly)")
+    ),
+    RiskPattern(
+        'acceleration', "Acceleration", 'high',
+        "After a default the whole remaining balance can be demanded at once.",
+        (r"accelerat(?:e|es|ed|ion)\b", r"immediately (?:due|payable)")
+    ),
+    RiskPattern(
+        'indemnification', "Indemnification", 'high',
+        "You may have to pay the other party's losses, claims or legal costs.",
+        (r"indemnif(?:y|ies|ied|ying|ication)", r"hold (?:\w+ ){0,2}harmless")
+    ),
+    RiskPattern(
+        'jury_waiver', "Waiver of jury trial", 'high',
+        "You give up the right to have a dispute decided by a jury.",
+        (r"wai(?:ve|ves|ved|ver of)\b[^.]{0,60}?(?:trial by jury|jury trial)", r"jury (?:trial )?waiver")
+    ),
+    RiskPattern(
+        'arbitration', "Mandatory arbitration", 'medium',
+        "Disputes go to private arbitration instead of court, usually with limited appeal.",
+        (r"binding arbitration", r"mandatory arbitration", r"arbitration (?:clause|agreement)",
+         r"submit(?:ted)? to arbitration")
+    ),
+    RiskPattern(
+        'class_action_waiver', "Class action waiver", 'high',
+        "You cannot join with others to bring a claim, even for small repeated harms.",
+        (r"class[- ]action (?:waiver|lawsuit|proceeding)s?", r"wai(?:ve|ves|ved|ver of)\b[^.]{0,60}?class (?:action|claim)")
+    ),
+    RiskPattern(
+        'perpetual_confidentiality', "Confidentiality without end", 'medium',
+        "The confidentiality duty never expires.",
+        (r"confidential\w*[^.]{0,120}?(?:in perpetuity|perpetual(?:ly)?|indefinitely)",
+         r"perpetual (?:confidentiality|non-?disclosure)")
+    ),
+    RiskPattern(
+        'non_compete', "Non-compete", 'high',
+        "Limits where or for whom you can work or do business, possibly after the agreement ends.",
+        (r"non-?compet(?:e|ition)", r"not (?:to )?compete", r"non-?solicitation")
+    ),
+    RiskPattern(
+        'unilateral_changes', "One-sided changes", 'high',
+        "The other party can change the terms, fees or rates on its own.",
+        (rf"reserves? the right to {_CHANGE}", rf"may,? at any time,? {_CHANGE}",
+         rf"may,? (?:in|at) (?:its|their|our) (?:sole )?discretion,? {_CHANGE}")
+    ),
+    RiskPattern(
+        'termination_without_cause', "Termination without cause", 'medium',
+        "The other party can end the agreement without a reason.",
+        (r"terminat(?:e|ion)[^.]{0,40}?(?:for convenience|without cause|for any reason)",)
+    ),
+    RiskPattern(
+        'personal_guarantee', "Personal guarantee", 'high',
+        "You are personally liable for the debt, beyond any business or co-signer.",
+        (r"personal(?:ly)? guarant(?:ee|y|eed|ees)", r"jointly and severally")
+    ),
+    RiskPattern(
+        'confession_of_judgment', "Confession of judgment", 'high',
+        "You agree in advance to a court judgment against you without a chance to defend.",
+        (r"confess(?:ion of|es|ed)? judgm?ent", r"cognovit")
+    ),
+    RiskPattern(
+        'non_refundable', "Non-refundable payments", 'medium',
+        "Money paid is not returned, even if the agreement ends early.",
+        (r"non-?refundable",)
+    ),
+    RiskPattern(
+        'liability_limit', "Limited liability of the other party", 'medium',
+        "The other party caps or excludes what it owes you if something goes wrong.",
+        (r"limitation of liability", r"in no event shall[^.]{0,60}?be liable", r"shall not be (?:held )?liable")
+    ),
+    RiskPattern(
+        'liquidated_damages', "Liquidated damages", 'medium',
+        "A fixed amount is owed on a breach, whatever the actual loss.",
+        (r"liquidated damages",)
+    ),
+    RiskPattern(
+        'fee_shifting', "Paying the other side's legal costs", 'low',
+        "You may owe attorney's fees or collection costs in a dispute.",
+        (r"attorney(?:s'?|'s)? fees", r"legal fees", r"costs of collection")
+    ),
+)
+
+_PATTERNS_BY_NAME = {pattern.name: pattern for pattern in RISK_PATTERNS}
+_PHRASES = [(pattern, re.compile(phrase)) for pattern in RISK_PATTERNS for phrase in pattern.phrases]
+# Used on the rare text whose lowercase form has a different length, so offsets stay valid
+_PHRASES_IGNORECASE = [(pattern, re.compile(phrase, re.IGNORECASE))
+                       for pattern in RISK_PATTERNS for phrase in pattern.phrases]
+_SENTENCE_BREAK = re.compile(r'[.;!?]\s|\n\s*\n')
+
+
+@dataclass
+class RiskHit:
+    """One match of a risk pattern, as character offsets into the scanned text"""
+    name: str
+    severity: str
+    start: int
+    end: int
+
+
+@dataclass
+class RiskFlag:
+    """Every hit of one risk pattern, with a few excerpts to show"""
+    name: str
+    label: str
+    severity: str
+    explanation: str
+    count: int = 0
+    offsets: List[int] = field(default_factory=list)
+    excerpts: List[str] = field(default_factory=list)
+
+
+def scan_risks(text: str) -> List[RiskHit]:
+    """
+    Find every risky-clause phrase in the text
+
+    Runs in milliseconds and needs no model call, so red flags can be shown as
+    soon as a document is read.
+
+    Args:
+        text: Document text
+
+    Returns:
+        Hits in document order; overlapping hits of the same risk are merged
+    """
+    with span('risk_scan', characters=len(text)) as current:
+        lowered = text.lower()
+        phrases = _PHRASES
+        if len(lowered) != len(text):
+            lowered, phrases = text, _PHRASES_IGNORECASE
+
+        hits = []
+        for pattern, phrase in phrases:
+            for match in phrase.finditer(lowered):
+                start = match.start()
+                # Phrases start at a word, never inside one ("plate fee" is no late fee)
+                if start and lowered[start - 1].isalnum():
+                    continue
+                hits.append(RiskHit(pattern.name, pattern.severity, start, match.end()))
+        hits.sort(key=lambda hit: (hit.start, -hit.end))
+
+        merged: List[RiskHit] = []
+        ends: Dict[str, int] = {}
+        for hit in hits:
+            if hit.start < ends.get(hit.name, -1):
+                continue
+            ends[hit.name] = hit.end
+            merged.append(hit)
+        current.set_attribute('hits', len(merged))
+        return merged
+
+
+def _excerpt(text: str, start: int, end: int) -> str:
+    """The sentence around a hit, trimmed to EXCERPT_CONTEXT characters on each side"""
+    window_start = max(0, start - EXCERPT_CONTEXT)
+    breaks = list(_SENTENCE_BREAK.finditer(text, window_start, start))
+    sentence_start = breaks[-1].end() if breaks else window_start
+    following = _SENTENCE_BREAK.search(text, end, end + EXCERPT_CONTEXT)
+    sentence_end = following.start() + 1 if following else min(len(text), end + EXCERPT_CONTEXT)
+    excerpt = ' '.join(text[sentence_start:sentence_end].split())
+    prefix = '...' if not breaks and window_start > 0 else ''
+    suffix = '...' if following is None and sentence_end < len(text) else ''
+    return f"{prefix}{excerpt}{suffix}"
+
+
+def summarize_risks(text: str, hits: List[RiskHit]) -> List[RiskFlag]:
+    """
+    Group hits into one red flag per risk, most severe first
+
+    Args:
+        text: The text that was scanned
+        hits: Hits returned by scan_risks for that text
+
+    Returns:
+        Red flags ordered by severity, then by how often they occur
+    """
+    flags: Dict[str, RiskFlag] = {}
+    for hit in hits:
+        flag = flags.get(hit.name)
+        if flag is None:
+            pattern = _PATTERNS_BY_NAME[hit.name]
+            flag = flags[hit.name] = RiskFlag(pattern.name, pattern.label, pattern.severity, pattern.explanation)
+        flag.count += 1
+        flag.offsets.append(hit.start)
+        if len(flag.excerpts) < MAX_EXCERPTS:
+            excerpt = _excerpt(text, hit.start, hit.end)
+            if excerpt not in flag.excerpts:
+                flag.excerpts.append(excerpt)
+    return sorted(flags.values(), key=lambda flag: (SEVERITIES.index(flag.severity), -flag.count))
+
+
+def scan_red_flags(text: str) -> List[RiskFlag]:
+    """Scan a document and group the hits into red flags"""
+    return summarize_risks(text, scan_risks(text))
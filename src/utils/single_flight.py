@@ -0,0 +1,79 @@
+"""
+Single-flight coalescing of identical in-flight work across sessions
+"""
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time
+
+    The first caller for a key runs the work; callers arriving with the same key
+    while it is in flight wait for that result (or exception) instead of repeating
+    the work. Nothing is kept once the call finishes, so later callers start fresh
+    and rely on the response cache for reuse.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run func, or wait for the identical call already in flight
+
+        Args:
+            key: Identifies calls whose results are interchangeable
+            func: The work to run if no call with this key is in flight
+
+        Returns:
+            The result of func (shared by every caller with the same key)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+
+_default_single_flight: Optional[SingleFlight] = None
+_default_single_flight_lock = threading.Lock()
+
+
+def get_default_single_flight() -> Optional[SingleFlight]:
+    """Return the process-wide single-flight group, or None if disabled via SINGLE_FLIGHT=off"""
+    global _default_single_flight
+    if os.getenv('SINGLE_FLIGHT', 'on').lower() in ('off', '0', 'false'):
+        return None
+    with _default_single_flight_lock:
+        if _default_single_flight is None:
+            _default_single_flight = SingleFlight()
+        return _default_single_flight
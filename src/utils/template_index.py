@@ -0,0 +1,408 @@
+"""
+MinHash/LSH index of analyzed documents, so near-duplicate templates reuse an earlier analysis
+
+The index never stores document text: each document is kept as a MinHash
+signature, one hash per sentence and its analysis.
+"""
+import bisect
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .compaction import word_shingles
+from .retrieval import split_clauses
+
+NUM_PERMUTATIONS = 128
+# 32 bands of 4 rows: documents above ~0.6 similarity almost always share a band,
+# so they are compared in full against the TEMPLATE_SIMILARITY threshold
+LSH_BANDS = 32
+ROWS_PER_BAND = NUM_PERMUTATIONS // LSH_BANDS
+MERSENNE_PRIME = (1 << 31) - 1
+# Shingles hashed per block, bounding the size of the intermediate matrix
+HASH_BLOCK = 4096
+
+# Default minimum estimated Jaccard similarity of 5-word shingles for a template match.
+# Every changed word alters up to 5 shingles, so 0.8 allows about one changed word in 45:
+# the names, amounts and dates filled into a template (40 filled-in fields in a
+# 2,000-word lease estimate ~0.82). A different agreement sharing boilerplate, or a
+# rewritten clause, falls below it; 0.6 let through one changed word in 20. MinHash
+# with 128 permutations estimates similarity within about +-0.035.
+DEFAULT_SIMILARITY = 0.8
+
+# Unanchored diff ranges up to this many line pairs are aligned with difflib
+MAX_DIFFLIB_CELLS = 250_000
+
+# Sentence ends within a line; colons are kept so "Rent: $1,200" stays one unit
+LINE_SENTENCE_END = re.compile(r'(?<=[.;!?])\s+')
+
+# Hex digits kept of each sentence's SHA-256 fingerprint
+FINGERPRINT_DIGITS = 16
+# Stands in for the wording of an indexed document, which is never stored
+UNSTORED_WORDING = "(earlier wording not stored)"
+
+# Fixed seed: stored signatures are only comparable with ones made by the same permutations
+_rng = np.random.default_rng(20240611)
+_HASH_A = _rng.integers(1, MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, MERSENNE_PRIME, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash_signature(document_text: str) -> np.ndarray:
+    """MinHash signature of a document's word shingles (NUM_PERMUTATIONS uint32 values)"""
+    shingles = word_shingles(document_text)
+    values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % MERSENNE_PRIME
+    signature = np.full(NUM_PERMUTATIONS, MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(values), HASH_BLOCK):
+        block = values[start:start + HASH_BLOCK]
+        hashed = (_HASH_A[:, None] * block[None, :] + _HASH_B[:, None]) % MERSENNE_PRIME
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def signature_similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the documents behind two signatures"""
+    return float(np.mean(first == second))
+
+
+@dataclass
+class ClauseChange:
+    """A run of lines that differs between two versions of a document, with the section it is in"""
+    section: str
+    before: str
+    after: str
+
+
+def _sentences(document_text: str) -> List[Tuple[str, str]]:
+    """(section, sentence) pairs of a document's lines split at sentence ends, with whitespace normalized"""
+    return [(clause.section, sentence)
+            for clause in split_clauses(document_text)
+            for line in clause.text.split('\n')
+            for sentence in LINE_SENTENCE_END.split(' '.join(line.split())) if sentence]
+
+
+def _fingerprint(sentence: str) -> str:
+    return hashlib.sha256(sentence.encode('utf-8')).hexdigest()[:FINGERPRINT_DIGITS]
+
+
+def sentence_fingerprints(document_text: str) -> List[str]:
+    """Hash of every sentence of a document, in order, so it can be diffed without keeping its text"""
+    return [_fingerprint(sentence) for _, sentence in _sentences(document_text)]
+
+
+def _increasing_chain(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Longest chain of (old, new) pairs, sorted by old index, whose new indexes also increase"""
+    tails: List[int] = []
+    tail_pairs: List[int] = []
+    previous: List[Optional[int]] = []
+    for k, (_, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position == len(tails):
+            tails.append(j)
+            tail_pairs.append(k)
+        else:
+            tails[position] = j
+            tail_pairs[position] = k
+        previous.append(tail_pairs[position - 1] if position else None)
+
+    chain = []
+    k = tail_pairs[-1] if tail_pairs else None
+    while k is not None:
+        chain.append(pairs[k])
+        k = previous[k]
+    return chain[::-1]
+
+
+def _matching_lines(old: List[str], new: List[str]) -> List[Tuple[int, int]]:
+    """
+    Pairs of equal (old, new) line indexes, found with a patience diff
+
+    Lines that occur exactly once on both sides anchor the alignment and the
+    ranges between anchors are diffed recursively, so repeated boilerplate
+    lines cannot make the diff quadratic. Ranges without anchors fall back to
+    difflib when they are small and are otherwise treated as changed.
+    """
+    matches = []
+    ranges = [(0, len(old), 0, len(new))]
+    while ranges:
+        old_lo, old_hi, new_lo, new_hi = ranges.pop()
+        while old_lo < old_hi and new_lo < new_hi and old[old_lo] == new[new_lo]:
+            matches.append((old_lo, new_lo))
+            old_lo, new_lo = old_lo + 1, new_lo + 1
+        while old_lo < old_hi and new_lo < new_hi and old[old_hi - 1] == new[new_hi - 1]:
+            old_hi, new_hi = old_hi - 1, new_hi - 1
+            matches.append((old_hi, new_hi))
+        if old_lo == old_hi or new_lo == new_hi:
+            continue
+
+        old_counts = Counter(old[old_lo:old_hi])
+        new_positions: Dict[str, int] = {}
+        new_counts = Counter(new[new_lo:new_hi])
+        for j in range(new_lo, new_hi):
+            if new_counts[new[j]] == 1:
+                new_positions[new[j]] = j
+        anchors = _increasing_chain([(i, new_positions[old[i]]) for i in range(old_lo, old_hi)
+                                     if old_counts[old[i]] == 1 and old[i] in new_positions])
+
+        if not anchors:
+            if (old_hi - old_lo) * (new_hi - new_lo) <= MAX_DIFFLIB_CELLS:
+                matcher = difflib.SequenceMatcher(None, old[old_lo:old_hi], new[new_lo:new_hi], autojunk=False)
+                for block in matcher.get_matching_blocks():
+                    matches.extend((old_lo + block.a + k, new_lo + block.b + k) for k in range(block.size))
+            continue
+
+        for i, j in anchors:
+            ranges.append((old_lo, i, new_lo, j))
+            matches.append((i, j))
+            old_lo, new_lo = i + 1, j + 1
+        ranges.append((old_lo, old_hi, new_lo, new_hi))
+    return sorted(matches)
+
+
+def clause_changes(old_text: str, new_text: str) -> List[ClauseChange]:
+    """
+    Diff two documents line by line within their clauses
+
+    Lines are split again at sentence ends, so a changed amount costs one
+    sentence rather than the whole clause. Runs of changed, added or removed
+    lines come back as single changes ('' for the missing side).
+    """
+    old_lines, new_lines = _sentences(old_text), _sentences(new_text)
+    matches = _matching_lines([line for _, line in old_lines], [line for _, line in new_lines])
+
+    changes = []
+    old_next = new_next = 0
+    for i, j in matches + [(len(old_lines), len(new_lines))]:
+        if i > old_next or j > new_next:
+            section = new_lines[new_next][0] if j > new_next else old_lines[old_next][0]
+            changes.append(ClauseChange(
+                section,
+                ' '.join(line for _, line in old_lines[old_next:i]),
+                ' '.join(line for _, line in new_lines[new_next:j])
+            ))
+        old_next, new_next = i + 1, j + 1
+    return changes
+
+
+def fingerprint_changes(old_fingerprints: List[str], new_text: str) -> List[ClauseChange]:
+    """
+    Diff an indexed document, known only by its sentence fingerprints, against a new one
+
+    Like clause_changes, but the earlier side of a change is UNSTORED_WORDING, and
+    lines removed from the earlier document are placed in the section of the new
+    document where they used to be.
+    """
+    new_lines = _sentences(new_text)
+    matches = _matching_lines(old_fingerprints, [_fingerprint(line) for _, line in new_lines])
+
+    changes = []
+    old_next = new_next = 0
+    for i, j in matches + [(len(old_fingerprints), len(new_lines))]:
+        if i > old_next or j > new_next:
+            nearest = new_lines[min(new_next, len(new_lines) - 1)][0] if new_lines else ''
+            changes.append(ClauseChange(
+                nearest,
+                UNSTORED_WORDING if i > old_next else '',
+                ' '.join(line for _, line in new_lines[new_next:j])
+            ))
+        old_next, new_next = i + 1, j + 1
+    return changes
+
+
+def format_clause_changes(changes: List[ClauseChange]) -> str:
+    """Render clause changes as a numbered before/now list for a prompt"""
+    parts = []
+    for number, change in enumerate(changes, 1):
+        parts.append(f"{number}. Section: {change.section}\n"
+                     f"Before: {change.before or '(not present)'}\n"
+                     f"Now: {change.after or '(removed)'}")
+    return '\n\n'.join(parts)
+
+
+@dataclass
+class TemplateMatch:
+    """An earlier analyzed document similar to the one being analyzed"""
+    fingerprints: List[str]
+    document_type: str
+    results: Dict[str, str]
+    similarity: float
+
+
+class TemplateIndex:
+    """
+    Disk-backed MinHash/LSH index of analyzed documents
+
+    Each document is stored with its analysis, its sentence fingerprints and a
+    MinHash signature of its word shingles, split into LSH bands; its text is not
+    stored. A lookup only compares signatures of documents that share at least
+    one band, so finding a near-duplicate stays fast as the index grows.
+    Least-recently-used documents are evicted beyond max_entries.
+
+    Args:
+        path: SQLite file (defaults to TEMPLATE_INDEX_PATH)
+        similarity: Minimum estimated similarity for a match (defaults to TEMPLATE_SIMILARITY)
+        max_entries: Maximum number of documents kept
+    """
+
+    def __init__(self, path: Optional[str] = None, similarity: Optional[float] = None, max_entries: int = 1000):
+        self.path = os.path.expanduser(
+            path or os.getenv('TEMPLATE_INDEX_PATH', '~/.cache/legal_reader/templates.sqlite3')
+        )
+        self.similarity = similarity if similarity is not None else float(os.getenv('TEMPLATE_SIMILARITY', str(DEFAULT_SIMILARITY)))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Earlier versions kept document text in a 'documents' table; drop it rather than keep that text around
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents'").fetchone():
+            self._conn.execute("DROP TABLE documents")
+            self._conn.execute("DROP TABLE IF EXISTS bands")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                fingerprints TEXT NOT NULL,
+                document_type TEXT NOT NULL,
+                results TEXT NOT NULL,
+                accessed_at REAL NOT NULL,
+                UNIQUE (text_hash, model_name)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket BLOB NOT NULL,
+                document_id INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands (band, bucket)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_document ON bands (document_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_templates_accessed ON templates (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _buckets(signature: np.ndarray) -> List[bytes]:
+        return [signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes() for band in range(LSH_BANDS)]
+
+    def find(self, document_text: str, model_name: str) -> Optional[TemplateMatch]:
+        """
+        Return the most similar indexed document analyzed by the same model
+
+        Args:
+            document_text: Text of the document about to be analyzed
+            model_name: Model whose analyses may be reused
+
+        Returns:
+            TemplateMatch at or above the similarity threshold, or None
+        """
+        signature = minhash_signature(document_text)
+        with self._lock:
+            candidates = set()
+            for band, bucket in enumerate(self._buckets(signature)):
+                candidates.update(row[0] for row in self._conn.execute(
+                    "SELECT document_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+                ))
+
+            best_id, best_similarity = None, self.similarity
+            for document_id in candidates:
+                row = self._conn.execute(
+                    "SELECT signature FROM templates WHERE id = ? AND model_name = ?", (document_id, model_name)
+                ).fetchone()
+                if row is None:
+                    continue
+                similarity = signature_similarity(signature, np.frombuffer(row[0], dtype=np.uint32))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = document_id, similarity
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            fingerprints, document_type, results = self._conn.execute(
+                "SELECT fingerprints, document_type, results FROM templates WHERE id = ?", (best_id,)
+            ).fetchone()
+            self._conn.execute("UPDATE templates SET accessed_at = ? WHERE id = ?", (time.time(), best_id))
+            self._conn.commit()
+            self.hits += 1
+        return TemplateMatch(json.loads(fingerprints), document_type, json.loads(results), best_similarity)
+
+    def add(self, document_text: str, model_name: str, document_type: str, results: Dict[str, str]):
+        """Index a document's fingerprints with its complete analysis, replacing any earlier entry for the same text"""
+        signature = minhash_signature(document_text)
+        text_hash = hashlib.sha256(document_text.encode('utf-8')).hexdigest()
+        fingerprints = json.dumps(sentence_fingerprints(document_text))
+        with self._lock:
+            self._delete_where("text_hash = ? AND model_name = ?", (text_hash, model_name))
+            cursor = self._conn.execute(
+                "INSERT INTO templates (text_hash, model_name, signature, fingerprints, document_type, results, "
+                "accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (text_hash, model_name, signature.tobytes(), fingerprints, document_type, json.dumps(results),
+                 time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO bands (band, bucket, document_id) VALUES (?, ?, ?)",
+                [(band, bucket, cursor.lastrowid) for band, bucket in enumerate(self._buckets(signature))]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _delete_where(self, condition: str, params: tuple):
+        ids = [(row[0],) for row in self._conn.execute(f"SELECT id FROM templates WHERE {condition}", params)]
+        self._conn.executemany("DELETE FROM bands WHERE document_id = ?", ids)
+        self._conn.executemany("DELETE FROM templates WHERE id = ?", ids)
+
+    def _evict(self):
+        """Drop least-recently-used documents beyond max_entries"""
+        count = self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+        if count > self.max_entries:
+            self._delete_where("id IN (SELECT id FROM templates ORDER BY accessed_at ASC LIMIT ?)",
+                               (count - self.max_entries,))
+
+    def clear(self):
+        """Remove every indexed document"""
+        with self._lock:
+            self._conn.execute("DELETE FROM bands")
+            self._conn.execute("DELETE FROM templates")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the number of indexed documents"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count
+        }
+
+
+_default_index: Optional[TemplateIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_template_index() -> Optional[TemplateIndex]:
+    """Return the process-wide template index, or None unless enabled with TEMPLATE_REUSE=on"""
+    global _default_index
+    if os.getenv('TEMPLATE_REUSE', 'off').lower() not in ('on', '1', 'true'):
+        return None
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = TemplateIndex()
+        return _default_index
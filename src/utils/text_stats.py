@@ -0,0 +1,194 @@
+"""
+Encoding detection for text files and single-pass document statistics
+"""
+import codecs
+import re
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Tuple, Union
+
+from .chunking import CHARS_PER_TOKEN
+
+
+# Checked in order: the UTF-32 LE mark starts with the UTF-16 LE mark
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# Tried in order after the detected encoding; latin-1 decodes any byte sequence
+FALLBACK_ENCODINGS = ['utf-8', 'cp1252', 'latin-1']
+DETECTION_SAMPLE_BYTES = 64 * 1024
+
+# A run of clause terminators, optionally followed by closing quotes or brackets, then
+# whitespace or the end; runs containing '.', '!' or '?' also end a sentence
+CLAUSE_END = re.compile(r'[.!?;:]+(?=["\'”’)\]]*(?:\s|$))')
+SENTENCE_MARKS = frozenset('.!?')
+
+# Text is counted in slices of this many characters, so per-slice allocations stay bounded
+SLICE_CHARS = 1 << 18
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Guess the encoding of a text file from its first bytes
+
+    Byte order marks win; otherwise NUL bytes in alternating positions indicate
+    BOM-less UTF-16, and anything else is assumed to be UTF-8.
+
+    Args:
+        sample: The start of the file (a few KB is enough)
+
+    Returns:
+        A codec name usable with bytes.decode
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    sample = sample[:DETECTION_SAMPLE_BYTES]
+    if b'\x00' in sample:
+        even_nulls = sample[0::2].count(0)
+        odd_nulls = sample[1::2].count(0)
+        half = len(sample) // 2 or 1
+        if odd_nulls > half * 0.3 and odd_nulls > even_nulls:
+            return 'utf-16-le'
+        if even_nulls > half * 0.3:
+            return 'utf-16-be'
+    return 'utf-8'
+
+
+def decode_text(data: Union[bytes, bytearray, memoryview]) -> Tuple[str, str]:
+    """
+    Decode text bytes with the detected encoding, falling back to cp1252 and latin-1
+
+    Args:
+        data: Raw file content (any buffer, such as a memory map)
+
+    Returns:
+        Tuple of (decoded text, encoding used)
+    """
+    detected = detect_encoding(bytes(data[:DETECTION_SAMPLE_BYTES]))
+    candidates = [detected] + [encoding for encoding in FALLBACK_ENCODINGS if encoding != detected]
+    for encoding in candidates:
+        try:
+            return str(data, encoding), encoding
+        except UnicodeDecodeError:
+            continue
+    # Not reached: latin-1 maps every byte
+    raise UnicodeDecodeError('latin-1', bytes(data[:1]), 0, 1, "undecodable text")
+
+
+@dataclass
+class TextStats:
+    """Counts describing a document's text"""
+    characters: int = 0
+    words: int = 0
+    lines: int = 0
+    sentences: int = 0
+    clauses: int = 0
+    estimated_tokens: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def _count_segment(text: str) -> Tuple[int, int, int, bool, bool]:
+    """
+    Count a piece of text that starts and ends on token boundaries
+
+    Returns:
+        Tuple of (words, sentence ends, clause ends, whether words follow the last
+        sentence end, whether words follow the last clause end)
+    """
+    words = len(text.split())
+    sentences = clauses = 0
+    sentence_tail = clause_tail = None
+    for match in CLAUSE_END.finditer(text):
+        clauses += 1
+        clause_tail = match.end()
+        if not SENTENCE_MARKS.isdisjoint(match.group()):
+            sentences += 1
+            sentence_tail = clause_tail
+    
+    def words_after(tail):
+        # Closing quotes or brackets right after a terminator are not a new unit
+        return words > 0 if tail is None else bool(text[tail:].strip().lstrip('"\'”’)]'))
+    
+    return words, sentences, clauses, words_after(sentence_tail), words_after(clause_tail)
+
+
+class TextStatsCounter:
+    """
+    Accumulates TextStats over text fed in pieces
+
+    Pieces may split words or sentences anywhere: the tail after the last
+    whitespace is carried into the next update, so counts match a single pass
+    over the joined text. Only one piece is held at a time.
+    """
+
+    def __init__(self):
+        self.characters = 0
+        self.newlines = 0
+        self.words = 0
+        self.sentences = 0
+        self.clauses = 0
+        # Whether words follow the last sentence / clause terminator seen so far
+        self.open_sentence = False
+        self.open_clause = False
+        self._carry = ''
+
+    def _add_segment(self, text: str) -> Tuple[int, int, int, bool, bool]:
+        words, sentences, clauses, open_sentence, open_clause = _count_segment(text)
+        if not words:
+            return self.words, self.sentences, self.clauses, self.open_sentence, self.open_clause
+        return (self.words + words, self.sentences + sentences, self.clauses + clauses,
+                open_sentence, open_clause)
+
+    def update(self, text: str):
+        """Count the next piece of text"""
+        self.characters += len(text)
+        self.newlines += text.count('\n')
+
+        data = self._carry + text
+        cut = max(data.rfind(' '), data.rfind('\n'), data.rfind('\t'))
+        if cut < 0:
+            self._carry = data
+            return
+        (self.words, self.sentences, self.clauses,
+         self.open_sentence, self.open_clause) = self._add_segment(data[:cut + 1])
+        self._carry = data[cut + 1:]
+
+    def result(self) -> TextStats:
+        """Statistics for all text seen so far (more text can still be added afterwards)"""
+        words, sentences, clauses, open_sentence, open_clause = self._add_segment(self._carry)
+        return TextStats(
+            characters=self.characters,
+            words=words,
+            lines=self.newlines + 1 if self.characters else 0,
+            # A final sentence or clause without a terminator still counts
+            sentences=sentences + open_sentence,
+            clauses=clauses + open_clause,
+            estimated_tokens=(self.characters + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+        )
+
+
+def compute_text_stats(text: Union[str, Iterable[str]]) -> TextStats:
+    """
+    Compute word, character, line, sentence, clause and token counts in one pass
+
+    Args:
+        text: The document text, or an iterable of text pieces (such as pages)
+
+    Returns:
+        TextStats for the text
+    """
+    counter = TextStatsCounter()
+    if isinstance(text, str):
+        for start in range(0, len(text), SLICE_CHARS):
+            counter.update(text[start:start + SLICE_CHARS])
+    else:
+        for piece in text:
+            counter.update(piece)
+    return counter.result()
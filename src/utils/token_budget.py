@@ -0,0 +1,178 @@
+"""
+Pre-flight token accounting with per-request and per-session budgets
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from .chunking import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Gemini 2.5 Flash-Lite accepts about a million input tokens per request
+DEFAULT_MAX_PROMPT_TOKENS = 1_000_000
+# Output reserved for a call until it reports what it actually produced
+DEFAULT_OUTPUT_TOKENS = 1024
+# Estimates above this fraction of the request limit are confirmed with an exact count
+EXACT_COUNT_THRESHOLD = 0.9
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised before a model call that would exceed the request or session token budget"""
+
+
+@dataclass
+class TokenUsage:
+    """Tokens used by one model call; exact when reported by the model, otherwise estimated"""
+    input_tokens: int
+    output_tokens: int
+    exact: bool = True
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens estimated tokens"""
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+class TokenBudget:
+    """
+    Checks model calls against token limits before they are sent and tracks their cost
+
+    Each call reserves its estimated input plus expected output up front, so
+    concurrent calls cannot overshoot the session budget together, and the
+    reservation is replaced by the usage the model reports once the call ends.
+
+    Args:
+        max_prompt_tokens: Largest input a single request may send (None for no limit)
+        max_total_tokens: Input and output tokens allowed over the budget's lifetime (None for no limit)
+        output_tokens: Expected output tokens of a call that does not say otherwise
+    """
+
+    def __init__(self, max_prompt_tokens: Optional[int] = DEFAULT_MAX_PROMPT_TOKENS,
+                 max_total_tokens: Optional[int] = None, output_tokens: int = DEFAULT_OUTPUT_TOKENS):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_total_tokens = max_total_tokens
+        self.output_tokens = output_tokens
+        self.stats = {
+            'calls': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'rejected': 0,
+            # Calls whose usage was reported by the model, for comparison with the estimates
+            'exact_calls': 0,
+            'estimated_input_tokens': 0,
+            'reported_input_tokens': 0,
+        }
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def needs_exact_count(self, prompt_tokens: int) -> bool:
+        """Whether an estimate is close enough to the request limit to be worth counting exactly"""
+        return (self.max_prompt_tokens is not None
+                and prompt_tokens > self.max_prompt_tokens * EXACT_COUNT_THRESHOLD)
+
+    def reserve(self, prompt_tokens: int, output_tokens: Optional[int] = None) -> int:
+        """
+        Admit a call, or raise TokenBudgetExceeded without sending anything
+
+        Args:
+            prompt_tokens: Input tokens of the request (estimated or counted)
+            output_tokens: Expected output tokens (defaults to self.output_tokens)
+
+        Returns:
+            The number of tokens reserved, to be passed to settle
+        """
+        if self.max_prompt_tokens is not None and prompt_tokens > self.max_prompt_tokens:
+            self._count_rejected()
+            raise TokenBudgetExceeded(
+                f"the request is about {prompt_tokens:,} tokens, over the "
+                f"{self.max_prompt_tokens:,}-token limit for a single request"
+            )
+
+        amount = prompt_tokens + (self.output_tokens if output_tokens is None else output_tokens)
+        with self._lock:
+            if self.max_total_tokens is not None:
+                remaining = self.max_total_tokens - self.used - self._reserved
+                if amount > remaining:
+                    self.stats['rejected'] += 1
+                    raise TokenBudgetExceeded(
+                        f"the request needs about {amount:,} tokens but only {max(0, remaining):,} of the "
+                        f"{self.max_total_tokens:,}-token session budget are left"
+                    )
+            self._reserved += amount
+        return amount
+
+    def settle(self, reserved: int, estimated_input: int, usage: Optional[TokenUsage]):
+        """
+        Replace a reservation with what the call used
+
+        Args:
+            reserved: The value returned by reserve
+            estimated_input: Input tokens the call was admitted with
+            usage: Usage of the call, or None if it failed before using any tokens
+        """
+        with self._lock:
+            self._reserved -= reserved
+            if usage is None:
+                return
+            self.stats['calls'] += 1
+            self.stats['input_tokens'] += usage.input_tokens
+            self.stats['output_tokens'] += usage.output_tokens
+            if usage.exact:
+                self.stats['exact_calls'] += 1
+                self.stats['estimated_input_tokens'] += estimated_input
+                self.stats['reported_input_tokens'] += usage.input_tokens
+
+        if usage.exact:
+            logger.info("Model call used %d input tokens (estimated %d) and %d output tokens",
+                        usage.input_tokens, estimated_input, usage.output_tokens)
+
+    def _count_rejected(self):
+        with self._lock:
+            self.stats['rejected'] += 1
+
+    @property
+    def used(self) -> int:
+        """Input and output tokens used so far"""
+        return self.stats['input_tokens'] + self.stats['output_tokens']
+
+    def remaining(self) -> Optional[int]:
+        """Tokens left in the session budget (None if it is unlimited)"""
+        if self.max_total_tokens is None:
+            return None
+        with self._lock:
+            return max(0, self.max_total_tokens - self.used - self._reserved)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Usage counters, limits and the ratio of reported to estimated input tokens"""
+        with self._lock:
+            metrics = dict(self.stats)
+        metrics['used_tokens'] = metrics['input_tokens'] + metrics['output_tokens']
+        if metrics['estimated_input_tokens']:
+            metrics['estimate_ratio'] = metrics['reported_input_tokens'] / metrics['estimated_input_tokens']
+        if self.max_prompt_tokens is not None:
+            metrics['limit_prompt_tokens'] = self.max_prompt_tokens
+        if self.max_total_tokens is not None:
+            metrics['limit_total_tokens'] = self.max_total_tokens
+            metrics['remaining_total_tokens'] = self.remaining()
+        return metrics
+
+
+def _env_limit(name: str, default: str) -> Optional[int]:
+    value = os.getenv(name, default)
+    return int(value) if value and value != '0' else None
+
+
+def new_token_budget(session: bool = False) -> TokenBudget:
+    """
+    Create a budget configured from the environment
+
+    MAX_PROMPT_TOKENS limits every request; session budgets are also limited to
+    SESSION_TOKEN_BUDGET tokens in total (0, the default, means unlimited).
+    """
+    return TokenBudget(
+        max_prompt_tokens=_env_limit('MAX_PROMPT_TOKENS', str(DEFAULT_MAX_PROMPT_TOKENS)),
+        max_total_tokens=_env_limit('SESSION_TOKEN_BUDGET', '0') if session else None
+    )
@@ -0,0 +1,277 @@
+"""
+Lightweight tracing spans with latency histograms and Prometheus text export
+"""
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+try:
+    # Spans are also sent to OpenTelemetry when it is installed and configured
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Recent durations kept per span name for percentiles and charts
+RECENT_DURATIONS = 1024
+# Recent finished spans kept (with attributes) for inspection
+RECENT_SPANS = 200
+
+METRIC_PREFIX = 'legal_reader'
+
+
+class Span:
+    """One timed operation and its attributes"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any], otel_span: Any = None):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._otel_span = otel_span
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, value)
+
+    def set_attributes(self, **attributes: Any):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+
+class _SpanStats:
+    """Histogram, error count and recent durations for one span name"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.cache_hits = 0
+        self.recent: Deque[float] = deque(maxlen=RECENT_DURATIONS)
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+class Tracer:
+    """
+    Records spans into per-name latency histograms
+
+    Spans are cheap enough to wrap every extraction, prompt and render. Each
+    finished span updates a cumulative histogram for its name (exported in the
+    Prometheus text format) and is kept in a short ring buffer with its
+    attributes. When OpenTelemetry is installed, every span is mirrored to it.
+
+    Args:
+        enabled: Record spans (a disabled tracer still runs the traced code)
+        buckets: Histogram bucket upper bounds in seconds
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._stats: Dict[str, _SpanStats] = {}
+        self._recent_spans: Deque[Span] = deque(maxlen=RECENT_SPANS)
+        self._lock = threading.Lock()
+        self._otel_tracer = otel_trace.get_tracer(METRIC_PREFIX) if otel_trace is not None and enabled else None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Time the enclosed block as a span
+
+        Args:
+            name: Span name, such as 'process_document' or 'analyze_document.summary'
+            **attributes: Initial attributes; more can be added with span.set_attribute
+
+        Yields:
+            The Span, for adding attributes discovered while it runs
+        """
+        if not self.enabled:
+            yield Span(name, attributes)
+            return
+
+        if self._otel_tracer is not None:
+            with self._otel_tracer.start_as_current_span(name, attributes=attributes) as otel_span:
+                current = Span(name, attributes, otel_span)
+                with self._timed(current):
+                    yield current
+        else:
+            current = Span(name, attributes)
+            with self._timed(current):
+                yield current
+
+    @contextmanager
+    def _timed(self, current: Span) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            current.error = type(e).__name__
+            raise
+        finally:
+            current.duration = time.perf_counter() - started
+            self._record(current)
+
+    def _record(self, current: Span):
+        with self._lock:
+            stats = self._stats.get(current.name)
+            if stats is None:
+                stats = self._stats[current.name] = _SpanStats(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if current.duration <= bound:
+                    stats.bucket_counts[i] += 1
+            stats.count += 1
+            stats.total += current.duration
+            stats.errors += current.error is not None
+            stats.cache_hits += current.attributes.get('cache_hit') is True
+            stats.recent.append(current.duration)
+            self._recent_spans.append(current)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Count, error count, mean and p50/p95/p99 latency (in seconds) per span name"""
+        with self._lock:
+            snapshot = {name: (stats.count, stats.errors, stats.total, list(stats.recent))
+                        for name, stats in self._stats.items()}
+        return {
+            name: {
+                'count': count,
+                'errors': errors,
+                'mean': total / count,
+                'p50': _percentile(recent, 0.50),
+                'p95': _percentile(recent, 0.95),
+                'p99': _percentile(recent, 0.99),
+            }
+            for name, (count, errors, total, recent) in sorted(snapshot.items())
+        }
+
+    def recent_durations(self, name: str) -> List[float]:
+        """Latest durations (in seconds) recorded for a span name, oldest first"""
+        with self._lock:
+            stats = self._stats.get(name)
+            return list(stats.recent) if stats is not None else []
+
+    def recent_spans(self) -> List[Span]:
+        """Latest finished spans of any name, oldest first"""
+        with self._lock:
+            return list(self._recent_spans)
+
+    def prometheus_text(self) -> str:
+        """Render every span histogram in the Prometheus text exposition format"""
+        duration = f'{METRIC_PREFIX}_span_duration_seconds'
+        lines = [
+            f'# HELP {duration} Duration of traced operations.',
+            f'# TYPE {duration} histogram',
+        ]
+        errors = [
+            f'# HELP {METRIC_PREFIX}_span_errors_total Traced operations that raised an exception.',
+            f'# TYPE {METRIC_PREFIX}_span_errors_total counter',
+        ]
+        cache_hits = [
+            f'# HELP {METRIC_PREFIX}_span_cache_hits_total Traced operations served from the response cache.',
+            f'# TYPE {METRIC_PREFIX}_span_cache_hits_total counter',
+        ]
+        with self._lock:
+            for name, stats in sorted(self._stats.items()):
+                label = f'span="{_escape_label(name)}"'
+                for bound, bucket_count in zip(self.buckets, stats.bucket_counts):
+                    lines.append(f'{duration}_bucket{{{label},le="{_format_bound(bound)}"}} {bucket_count}')
+                lines.append(f'{duration}_bucket{{{label},le="+Inf"}} {stats.count}')
+                lines.append(f'{duration}_sum{{{label}}} {stats.total}')
+                lines.append(f'{duration}_count{{{label}}} {stats.count}')
+                errors.append(f'{METRIC_PREFIX}_span_errors_total{{{label}}} {stats.errors}')
+                cache_hits.append(f'{METRIC_PREFIX}_span_cache_hits_total{{{label}}} {stats.cache_hits}')
+        return '\n'.join(lines + errors + cache_hits) + '\n'
+
+    def reset(self):
+        """Forget every recorded span"""
+        with self._lock:
+            self._stats.clear()
+            self._recent_spans.clear()
+
+
+def start_metrics_server(port: int, tracer: Optional[Tracer] = None, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """
+    Serve the tracer's metrics at http://host:port/metrics from a background thread
+
+    Args:
+        port: Port to listen on
+        tracer: Tracer to export (defaults to the process-wide tracer)
+        host: Interface to bind
+
+    Returns:
+        The running server (call shutdown() to stop it)
+    """
+    tracer = tracer or get_tracer()
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = tracer.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would otherwise flood stderr
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='legal-reader-metrics', daemon=True)
+    thread.start()
+    return server
+
+
+_default_tracer: Optional[Tracer] = None
+_default_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer (recording is disabled via TRACING=off)"""
+    global _default_tracer
+    with _default_tracer_lock:
+        if _default_tracer is None:
+            _default_tracer = Tracer(enabled=os.getenv('TRACING', 'on').lower() not in ('off', '0', 'false'))
+        return _default_tracer
+
+
+def span(name: str, **attributes: Any):
+    """Time a block as a span of the process-wide tracer"""
+    return get_tracer().span(name, **attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator that times every call of a function with the process-wide tracer"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,30 @@
+"""
+Shared fixtures: every analyzer runs against the mock backend with no persistent state
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Tests must never read or write the on-disk response cache or template index
+os.environ['RESPONSE_CACHE'] = 'off'
+os.environ['TEMPLATE_REUSE'] = 'off'
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.utils.ai_analyzer import LegalDocumentAnalyzer
+from src.utils.llm_backends import MockBackend
+from src.utils.rate_limiter import QuotaRateLimiter
+from src.utils.single_flight import SingleFlight
+
+
+@pytest.fixture
+def make_analyzer():
+    """Build an analyzer over a backend with no quotas, no caches and its own single-flight group"""
+    def make(backend=None, **kwargs):
+        kwargs.setdefault('rate_limiter', QuotaRateLimiter(requests_per_minute=None, requests_per_day=None,
+                                                           tokens_per_minute=None, base_delay=0.0, max_retries=0))
+        kwargs.setdefault('single_flight', SingleFlight())
+        return LegalDocumentAnalyzer(backend=backend or MockBackend(), **kwargs)
+    return make
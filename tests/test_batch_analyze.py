@@ -0,0 +1,21 @@
+"""
+Tests for the headless batch runner
+"""
+import argparse
+
+import batch_analyze
+
+
+def test_mock_runs_never_touch_the_persistent_caches(monkeypatch, tmp_path):
+    monkeypatch.setenv('RESPONSE_CACHE', 'on')
+    monkeypatch.setenv('TEMPLATE_REUSE', 'on')
+    monkeypatch.setenv('RESPONSE_CACHE_PATH', str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setenv('TEMPLATE_INDEX_PATH', str(tmp_path / "templates.sqlite3"))
+    args = argparse.Namespace(mock=True, mock_latency=0, max_concurrency=None, analysis_mode=None)
+
+    analyzer = batch_analyze.build_analyzer(args)
+    analyzer.analyze_with_document_type("The Tenant shall pay rent of $1,200 on the first day of each month.")
+
+    assert analyzer.response_cache.path == ':memory:'
+    assert analyzer.template_index.path == ':memory:'
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,63 @@
+"""
+Tests for section-aware chunking
+"""
+import pytest
+
+from src.utils.chunking import CHARS_PER_TOKEN, DocumentChunker, estimate_tokens, split_sections
+
+AGREEMENT = "\n\n".join(
+    ["This agreement is made between the parties listed below."]
+    + [f"ARTICLE {i}\n" + f"The obligations under article {i} are set out in this paragraph. " * 12
+       for i in range(1, 9)]
+)
+
+
+def test_sections_split_on_headings_with_a_preamble():
+    sections = split_sections(AGREEMENT)
+
+    assert sections[0].heading == "Preamble"
+    assert [section.heading for section in sections[1:]] == [f"ARTICLE {i}" for i in range(1, 9)]
+    assert sections[-1].end == len(AGREEMENT)
+
+
+def test_text_without_headings_is_one_section():
+    sections = split_sections("just a sentence")
+
+    assert len(sections) == 1
+    assert (sections[0].start, sections[0].end) == (0, len("just a sentence"))
+
+
+def test_chunks_fit_the_budget_and_cover_the_document():
+    chunker = DocumentChunker(max_tokens=400, overlap_tokens=20)
+
+    chunks = chunker.chunk(AGREEMENT)
+
+    assert len(chunks) > 1
+    overlap = chunker.overlap_tokens * CHARS_PER_TOKEN
+    assert all(len(chunk.text) <= chunker.max_tokens * CHARS_PER_TOKEN + overlap for chunk in chunks)
+    assert chunks[0].start == 0 and chunks[-1].end == len(AGREEMENT)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # Consecutive chunks overlap a little and leave no gap
+        assert chunk.start < previous.end
+        assert previous.end - chunk.start <= overlap
+
+
+def test_oversized_sections_are_split_on_sentences():
+    text = "SECTION 1. RENT\n" + "The tenant pays rent monthly. " * 200
+    chunker = DocumentChunker(max_tokens=100, overlap_tokens=0)
+
+    chunks = chunker.chunk(text)
+
+    assert all(chunk.section == "SECTION 1. RENT" for chunk in chunks)
+    assert all(chunk.text.rstrip().endswith(".") for chunk in chunks)
+    assert "".join(chunk.text for chunk in chunks) == text
+
+
+def test_overlap_must_be_smaller_than_the_budget():
+    with pytest.raises(ValueError):
+        DocumentChunker(max_tokens=100, overlap_tokens=100)
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcde") == 2
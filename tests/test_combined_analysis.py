@@ -0,0 +1,74 @@
+"""
+Tests for the single-call combined analysis mode
+"""
+import json
+
+from src.utils.ai_analyzer import COMBINED_RESPONSE_SCHEMA, ResponseCache
+from src.utils.llm_backends import MockBackend
+
+DOCUMENT = ("RESIDENTIAL LEASE AGREEMENT\n\nThe Tenant shall pay the monthly rent of $1,200 on the first day of "
+            "each month. The Landlord shall keep the premises in good repair.")
+
+
+class ScriptedCombinedBackend(MockBackend):
+    """Mock backend that answers structured-output (combined) calls with a fixed response"""
+
+    def __init__(self, combined_response: str, **kwargs):
+        super().__init__(**kwargs)
+        self.combined_response = combined_response
+
+    def generate(self, prompt, handle=None, **kwargs):
+        text = super().generate(prompt, handle, **kwargs)
+        return self.combined_response if 'generation_config' in kwargs else text
+
+
+def generate_calls(backend):
+    return [call for call in backend.calls if call['kind'] == 'generate']
+
+
+def test_combined_mode_makes_a_single_call(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend, analysis_mode='combined')
+
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert len(generate_calls(backend)) == 1
+    assert doc_type.startswith("document_type: ")
+    assert set(results) == set(analyzer.prompts)
+    assert all(results[name].startswith(f"{name}: ") for name in results)
+
+
+def test_code_fenced_json_is_accepted(make_analyzer):
+    payload = {name: f"The {name}." for name in COMBINED_RESPONSE_SCHEMA['properties']}
+    backend = ScriptedCombinedBackend("```json\n" + json.dumps(payload) + "\n```")
+    analyzer = make_analyzer(backend, analysis_mode='combined')
+
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert doc_type == "The document_type."
+    assert results['risks'] == "The risks."
+    assert len(generate_calls(backend)) == 1
+
+
+def test_malformed_json_falls_back_to_sections(make_analyzer):
+    cache = ResponseCache(':memory:')
+    backend = ScriptedCombinedBackend('{"summary": "The lease runs for a year.", "risks": ')
+    analyzer = make_analyzer(backend, analysis_mode='combined', response_cache=cache)
+
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert set(results) == set(analyzer.prompts)
+    assert all(result.startswith("Mock response") for result in results.values())
+    assert len(generate_calls(backend)) >= 1 + len(analyzer.prompts)
+    # The unusable combined response is not served again
+    assert cache.get(ResponseCache.make_key(analyzer.model_name, analyzer._get_combined_prompt(), DOCUMENT)) is None
+
+
+def test_a_missing_section_falls_back_to_sections(make_analyzer):
+    payload = {name: f"The {name}." for name in COMBINED_RESPONSE_SCHEMA['properties'] if name != 'action_items'}
+    backend = ScriptedCombinedBackend(json.dumps(payload))
+    analyzer = make_analyzer(backend, analysis_mode='combined')
+
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert results['action_items'].startswith("Mock response")
@@ -0,0 +1,104 @@
+"""
+Tests for prompt compaction
+"""
+from src.utils.compaction import compact_text
+
+CLAUSE = ("The Tenant shall not sublet the premises or assign this lease to any other person or company without "
+          "the prior written consent of the Landlord, which consent may be withheld for any reason at all during "
+          "the term of this lease.")
+
+
+def test_exact_repeat_is_replaced_by_marker_quoting_the_passage():
+    compacted = compact_text("\n\n".join([CLAUSE, "Rent is due monthly.", CLAUSE]))
+
+    assert compacted.text.count(CLAUSE) == 1
+    assert '[Repeats the passage beginning "The Tenant shall not sublet the premises or"]' in compacted.text
+    assert compacted.stats.duplicate_passages == 1
+
+
+RECONCILIATION = ("Within thirty days after the end of each lease year the Landlord shall deliver a statement of the "
+                  "operating costs actually incurred for that year. If the estimated payments made by the Tenant "
+                  "exceed the actual costs, the Landlord shall pay to the Tenant the amount of the excess within "
+                  "fifteen days after delivering the statement. If the actual costs exceed the estimated payments, "
+                  "the Tenant shall pay the shortfall together with the next monthly installment of rent. Either "
+                  "party may audit the books and records on which the statement is based by giving written notice "
+                  "within ninety days after receiving it, and any audit shall be conducted during normal business "
+                  "hours at the place where those records are ordinarily kept. The cost of an audit shall be borne "
+                  "by the party requesting it unless the audit reveals an error of more than five percent in the "
+                  "statement.")
+LIABILITY = ("The Lender shall not be liable for any loss arising from a delay in funding the loan. The Borrower "
+             "may not withdraw any advance until the conditions of this section have been met in full, and the "
+             "Lender shall be entitled to rely on any notice the Borrower gives under this agreement.")
+
+
+def repeat(original: str, revised: str) -> str:
+    return compact_text("\n\n".join([original, "Rent is due monthly.", revised])).text
+
+
+def test_near_repeat_quotes_removed_words_in_context():
+    compacted = repeat(CLAUSE, CLAUSE.replace("shall not sublet", "shall sublet"))
+
+    assert 'except "shall not sublet" reads "shall sublet"]' in compacted
+
+
+def test_near_repeat_quotes_added_words_in_context():
+    compacted = repeat(CLAUSE, CLAUSE.replace("term of this lease.", "term of this lease, unless notarized."))
+
+    # "this lease" occurs twice in the clause, so the quote widens until it is unique
+    assert 'except "of this lease" reads "of this lease unless notarized"]' in compacted
+
+
+def test_swapped_parties_are_reported():
+    revised = RECONCILIATION.replace("the Landlord shall pay to the Tenant", "the Tenant shall pay to the Landlord")
+
+    compacted = repeat(RECONCILIATION, revised)
+
+    assert '"costs the Landlord shall pay" reads "costs the Tenant shall pay"' in compacted
+    assert '"the Tenant the" reads "the Landlord the"' in compacted
+
+
+def test_dropped_negation_is_reported_when_not_appears_elsewhere():
+    revised = LIABILITY.replace("shall not be liable", "shall be liable")
+
+    compacted = repeat(LIABILITY, revised)
+
+    assert 'except "shall not be" reads "shall be"]' in compacted
+
+
+def test_edits_that_cannot_be_placed_keep_the_passage():
+    # Every few words around the edit recur elsewhere in the passage, so no quote pins it down
+    words = ("pay rent " * 12 + CLAUSE).split()
+    revised_words = list(words)
+    revised_words[11] = "fee"
+    original, revised = " ".join(words), " ".join(revised_words)
+
+    compacted = compact_text("\n\n".join([original, "Rent is due monthly.", revised]))
+
+    assert revised in compacted.text
+    assert compacted.stats.duplicate_passages == 0
+
+
+def test_running_headers_and_page_numbers_are_dropped():
+    bodies = ["The tenant keeps the unit clean.", "Rent is due on the first day.", "Pets need written approval.",
+              "Parking is not included in the rent.", "Either party may end the lease with notice."]
+    pages = [f"ACME LEASE AGREEMENT\n{body}\nPage {i}" for i, body in enumerate(bodies, 1)]
+    text = "\n".join(pages)
+    page_starts = [sum(len(page) + 1 for page in pages[:i]) for i in range(len(pages))]
+
+    compacted = compact_text(text, page_starts)
+
+    assert "ACME LEASE AGREEMENT" not in compacted.text
+    assert "Page 3" not in compacted.text
+    assert all(body in compacted.text for body in bodies)
+    assert compacted.stats.boilerplate_lines == 10
+
+
+def test_offsets_map_back_to_the_original():
+    text = "Intro   line with   spaces.\n\n\n\n" + CLAUSE
+    compacted = compact_text(text)
+
+    start = compacted.text.index("Tenant")
+    original_start, original_end = compacted.original_span(start, start + len("Tenant"))
+
+    assert text[original_start:original_end] == "Tenant"
+    assert "Intro line with spaces." in compacted.text
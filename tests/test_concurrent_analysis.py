@@ -0,0 +1,59 @@
+"""
+Tests for running the section analyses concurrently
+"""
+import time
+
+from src.utils.ai_analyzer import is_analysis_error
+from src.utils.llm_backends import LatencyDistribution, MockBackend
+
+DOCUMENT = ("RESIDENTIAL LEASE AGREEMENT\n\nThe Tenant shall pay the monthly rent of $1,200 on the first day of "
+            "each month. The Landlord shall keep the premises in good repair.")
+LATENCY = 0.2
+
+
+class FailingSectionBackend(MockBackend):
+    """Mock backend whose calls fail for one section's prompt"""
+
+    def __init__(self, failing_marker: str, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_marker = failing_marker
+
+    def generate(self, prompt, handle=None, **kwargs):
+        if self.failing_marker in prompt:
+            raise ValueError("503 The model is overloaded. Please try again later.")
+        return super().generate(prompt, handle, **kwargs)
+
+
+def test_sections_run_at_the_same_time(make_analyzer):
+    backend = MockBackend(latency=LatencyDistribution.fixed(LATENCY))
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+
+    start = time.perf_counter()
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+    elapsed = time.perf_counter() - start
+
+    assert set(results) == set(analyzer.prompts)
+    assert len([call for call in backend.calls if call['kind'] == 'generate']) >= len(analyzer.prompts)
+    # Serially the five sections would take five times the latency
+    assert elapsed < 3 * LATENCY
+
+
+def test_concurrency_is_bounded(make_analyzer):
+    backend = MockBackend(latency=LatencyDistribution.fixed(LATENCY))
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+
+    start = time.perf_counter()
+    analyzer.comprehensive_analysis(DOCUMENT, max_concurrency=1)
+
+    assert time.perf_counter() - start >= len(analyzer.prompts) * LATENCY
+
+
+def test_a_failing_section_leaves_the_others_intact(make_analyzer):
+    backend = FailingSectionBackend("identify potential risks")
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+
+    doc_type, results = analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert is_analysis_error(results['risks'])
+    assert all(not is_analysis_error(result) for name, result in results.items() if name != 'risks')
+    assert doc_type
@@ -0,0 +1,46 @@
+"""
+Tests for the local document-type classifier
+"""
+from src.utils.document_classifier import DOCUMENT_TYPES, DocumentClassifier, build_model, load_examples
+
+
+def test_sample_documents_are_classified_confidently():
+    classifier = DocumentClassifier()
+    for path, label in (("data/sample_documents/sample_lease_agreement.txt", "Rental Agreement"),
+                        ("data/sample_documents/sample_loan_agreement.txt", "Loan Agreement")):
+        with open(path, encoding='utf-8') as file:
+            text = file.read()[:4000]
+
+        assert classifier.classify(text) == label
+
+
+def test_unrelated_text_is_left_to_the_model():
+    classifier = DocumentClassifier(min_confidence=0.6)
+
+    prediction = classifier.predict("Preheat the oven and whisk two eggs with the flour and sugar.")
+
+    assert prediction.confidence < 0.6
+    assert classifier.classify("Preheat the oven and whisk two eggs with the flour and sugar.") is None
+
+
+def test_every_type_has_examples_and_a_centroid():
+    classifier = DocumentClassifier()
+
+    assert set(classifier.labels) == set(DOCUMENT_TYPES.values())
+
+
+def test_models_can_be_built_from_examples():
+    examples = {
+        "Cooking": ["Whisk the eggs and bake the cake.", "Boil the pasta and add the sauce."],
+        "Lease": ["The tenant pays rent to the landlord.", "The landlord returns the tenant's deposit."],
+    }
+
+    classifier = DocumentClassifier(build_model(examples), min_confidence=0.5)
+
+    assert classifier.classify("The tenant owes rent.") == "Lease"
+    assert abs(sum(classifier.predict("The tenant owes rent.").scores.values())) > 0
+
+
+def test_shipped_model_matches_the_examples():
+    # The artifact must be rebuilt whenever data/document_types changes
+    assert DocumentClassifier(build_model(load_examples())).centroids == DocumentClassifier().centroids
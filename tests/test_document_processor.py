@@ -0,0 +1,79 @@
+"""
+Tests for document extraction
+"""
+import io
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+import pytest
+
+from benchmarks.synthetic_corpus import write_pdf
+from src.utils import document_processor
+from src.utils.document_processor import DocumentProcessor
+
+
+def blank_pdf(pages: int) -> bytes:
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class BrokenPool:
+    """Stands in for a process pool whose workers died"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_discarded_and_pages_extracted_serially(monkeypatch):
+    pool = BrokenPool()
+    monkeypatch.setitem(document_processor._pools, 2, pool)
+    processor = DocumentProcessor(pdf_workers=2, parallel_min_pages=2)
+
+    pages = list(processor.iter_pdf_pages(blank_pdf(6)))
+
+    assert [page.page_number for page in pages] == [1, 2, 3, 4, 5, 6]
+    assert 2 not in document_processor._pools
+    assert pool.shut_down
+
+
+def test_txt_pages_carry_the_detected_encoding(monkeypatch):
+    processor = DocumentProcessor()
+    monkeypatch.setattr(processor, 'build_document_info', lambda *args, **kwargs: pytest.fail("full pipeline ran"))
+    content = "Le locataire paie 1 200 € par mois, à l'échéance.".encode('cp1252')
+
+    pages = list(processor.iter_document_pages(content, "bail.txt"))
+
+    assert len(pages) == 1
+    assert pages[0].text == "Le locataire paie 1 200 € par mois, à l'échéance."
+    assert pages[0].encoding == 'cp1252'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_page_offsets_index_the_joined_text(tmp_path, workers):
+    path = tmp_path / "lease.pdf"
+    write_pdf(["", "RESIDENTIAL LEASE\nThe Tenant pays rent monthly.", "", "Pets need written approval.",
+               "Either party may end the lease with notice."], path)
+    processor = DocumentProcessor(pdf_workers=workers, parallel_min_pages=2)
+
+    pages = list(processor.iter_pdf_pages(str(path)))
+    text = processor.join_pages(pages)
+
+    assert [page.page_number for page in pages] == [1, 2, 3, 4, 5]
+    assert text == processor.extract_text_from_pdf(path.read_bytes())
+    for page in pages:
+        assert text[page.start:page.end] == page.text
+    assert pages[1].start == 0
+    assert text[pages[3].start - 1] == "\n"
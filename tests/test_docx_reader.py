@@ -0,0 +1,55 @@
+"""
+Tests for the streaming DOCX reader
+"""
+import io
+
+import docx
+
+from src.utils.docx_reader import extract_docx_text, iter_docx_lines
+
+
+def build_docx() -> io.BytesIO:
+    document = docx.Document()
+    document.add_heading("LEASE AGREEMENT", level=1)
+    document.add_paragraph("The Tenant shall pay rent monthly.")
+    paragraph = document.add_paragraph("Rent:\tdue on the 1st")
+    paragraph.add_run().add_break()
+    paragraph.add_run("Late after the 5th")
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "Item", "Amount"
+    table.cell(1, 0).text, table.cell(1, 1).text = "Deposit", "$2,400"
+    document.sections[0].header.paragraphs[0].text = "Confidential"
+    document.sections[0].footer.paragraphs[0].text = "Lease v2"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_body_paragraphs_and_tables_come_in_document_order():
+    lines = [line for line in iter_docx_lines(build_docx()) if line]
+
+    assert lines[:5] == [
+        "LEASE AGREEMENT",
+        "The Tenant shall pay rent monthly.",
+        "Rent:\tdue on the 1st\nLate after the 5th",
+        "Item | Amount",
+        "Deposit | $2,400",
+    ]
+
+
+def test_headers_and_footers_follow_the_body():
+    text = extract_docx_text(build_docx())
+
+    assert text.index("Deposit | $2,400") < text.index("Confidential") < text.index("Lease v2")
+    assert text.count("Confidential") == 1
+
+
+def test_matches_python_docx_paragraph_text():
+    buffer = build_docx()
+    expected = [paragraph.text for paragraph in docx.Document(buffer).paragraphs]
+    buffer.seek(0)
+
+    lines = list(iter_docx_lines(buffer))
+
+    assert all(text in lines for text in expected)
@@ -0,0 +1,48 @@
+"""
+Tests for detecting the document type while a document is still being extracted
+"""
+from benchmarks.synthetic_corpus import write_pdf
+from src.components.ui_components import render_extraction_progress
+from src.utils.ai_analyzer import ResponseCache, document_type_excerpt
+from src.utils.document_classifier import DocumentClassifier
+from src.utils.document_processor import DocumentProcessor
+from src.utils.llm_backends import MockBackend
+
+# Each page alone fills the detection excerpt
+PAGES = [" ".join(f"The parties agree to clause {i}.{j} of this agreement." for j in range(80)) for i in range(1, 6)]
+
+
+def test_early_detection_sends_the_prompt_the_analysis_sends(make_analyzer, tmp_path):
+    path = tmp_path / "agreement.pdf"
+    write_pdf(PAGES, path)
+    backend = MockBackend()
+    # A classifier that is never sure, so every detection asks the model
+    unsure = DocumentClassifier(min_confidence=1.1)
+    analyzer = make_analyzer(backend, response_cache=ResponseCache(':memory:'), document_classifier=unsure)
+    detected = []
+
+    def detect(text):
+        detected.append(text)
+        return analyzer.get_document_type(text)
+
+    doc_info, doc_type = render_extraction_progress(DocumentProcessor(), str(path), path.name, detect)
+    calls = len(backend.calls)
+
+    assert detected == [document_type_excerpt(doc_info['prompt_text'])]
+    assert analyzer.get_document_type(doc_info['prompt_text']) == doc_type
+    assert len(backend.calls) == calls == 1
+
+
+def test_detection_reruns_when_later_pages_change_the_opening(tmp_path):
+    # The running header is only recognized once enough pages repeat it
+    path = tmp_path / "agreement.pdf"
+    write_pdf([f"ACME MASTER AGREEMENT\n{page}" for page in PAGES], path)
+    detected = []
+
+    doc_info, doc_type = render_extraction_progress(DocumentProcessor(), str(path), path.name,
+                                                    lambda text: detected.append(text) or "Service Contract")
+
+    assert "ACME MASTER AGREEMENT" not in doc_info['prompt_text']
+    assert len(detected) == 2 and detected[0].startswith("ACME MASTER AGREEMENT")
+    assert detected[-1] == document_type_excerpt(doc_info['prompt_text'])
+    assert doc_type == "Service Contract"
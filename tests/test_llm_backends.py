@@ -0,0 +1,104 @@
+"""
+Tests for the mock model backend
+"""
+import asyncio
+import random
+import statistics
+import time
+
+import pytest
+
+from src.utils.llm_backends import LatencyDistribution, MockBackend, MockBackendError
+
+
+def test_latency_distributions_sample_within_their_parameters():
+    rng = random.Random(1)
+
+    assert LatencyDistribution.fixed(0.25).sample(rng) == 0.25
+    assert all(0.1 <= LatencyDistribution.uniform(0.1, 0.3).sample(rng) <= 0.3 for _ in range(200))
+    samples = [LatencyDistribution.lognormal(0.5, 0.3).sample(rng) for _ in range(2000)]
+    assert min(samples) > 0
+    assert statistics.median(samples) == pytest.approx(0.5, rel=0.1)
+    with pytest.raises(ValueError):
+        LatencyDistribution('normal')
+
+
+def test_latency_delays_the_response():
+    backend = MockBackend(latency=LatencyDistribution.fixed(0.1))
+
+    start = time.perf_counter()
+    backend.generate("Summarize the lease.")
+
+    assert time.perf_counter() - start >= 0.1
+
+
+def test_responses_are_deterministic_per_prompt():
+    first, second = MockBackend(), MockBackend()
+
+    assert first.generate("Summarize the lease.") == second.generate("Summarize the lease.")
+    assert first.generate("Summarize the lease.") != first.generate("List the risks.")
+    assert "".join(first.generate_stream("Summarize the lease.")) == first.generate("Summarize the lease.")
+
+
+def test_every_call_is_recorded():
+    backend = MockBackend()
+    handle = backend.pin_document("The Tenant shall pay rent monthly.")
+
+    backend.generate("Summarize the lease.")
+    list(backend.generate_stream("List the risks.", handle))
+    asyncio.run(backend.generate_async("Explain it simply."))
+
+    assert [call['kind'] for call in backend.calls] == ['pin', 'generate', 'stream', 'generate_async']
+    assert backend.calls[2]['handle'] == handle.name
+    assert backend.calls[1]['input_characters'] == len("Summarize the lease.")
+    assert backend.input_characters == sum(len(text) for text in (
+        "The Tenant shall pay rent monthly.", "Summarize the lease.", "List the risks.", "Explain it simply."))
+
+
+def test_injected_failures_follow_the_error_rate():
+    always = MockBackend(error_rate=1.0, error_messages=["429 Resource has been exhausted"])
+    with pytest.raises(MockBackendError, match="429"):
+        always.generate("Summarize the lease.")
+    assert always.calls[0]['error'] == "429 Resource has been exhausted"
+
+    sometimes = MockBackend(error_rate=0.3, seed=7)
+    failures = 0
+    for i in range(200):
+        try:
+            sometimes.generate(f"prompt {i}")
+        except MockBackendError:
+            failures += 1
+    assert 30 <= failures <= 90
+
+    with pytest.raises(ValueError):
+        MockBackend(error_rate=1.5)
+
+
+def test_stream_failures_surface_midway():
+    backend = MockBackend(error_rate=1.0)
+    received = []
+
+    with pytest.raises(MockBackendError):
+        for chunk in backend.generate_stream("Summarize the lease."):
+            received.append(chunk)
+
+    assert received
+
+
+def test_released_handles_are_rejected():
+    backend = MockBackend()
+    handle = backend.pin_document("The Tenant shall pay rent monthly.")
+    backend.release_document(handle)
+
+    with pytest.raises(ValueError):
+        backend.generate("Summarize the lease.", handle)
+
+
+def test_json_schemas_are_honoured_in_property_order():
+    backend = MockBackend()
+    schema = {'type': 'object', 'properties': {'summary': {'type': 'string'}, 'risks': {'type': 'string'}}}
+
+    response = backend.generate("Analyze the lease.", generation_config={'response_schema': schema})
+
+    assert response.startswith('{"summary": "summary: ')
+    assert '"risks": "risks: ' in response
@@ -0,0 +1,91 @@
+"""
+Tests for the chunked map-reduce over long documents
+"""
+from src.utils.ai_analyzer import is_analysis_error
+from src.utils.chunking import estimate_tokens
+from src.utils.llm_backends import MockBackend
+from src.utils.token_budget import TokenBudget
+from src.utils.tracing import get_tracer
+
+
+def long_document(sections: int = 40) -> str:
+    return "\n\n".join(
+        f"SECTION {i}. OBLIGATIONS\nThe Tenant shall pay the monthly rent of ${1000 + i} on the first day "
+        f"of each month, and the Landlord shall keep the premises in good repair. " * 4
+        for i in range(1, sections + 1)
+    )
+
+
+class FailingPartBackend(MockBackend):
+    """Mock backend whose calls fail for one part of the document"""
+
+    def __init__(self, failing_marker: str, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_marker = failing_marker
+
+    def generate(self, prompt, handle=None, **kwargs):
+        if self.failing_marker in prompt:
+            raise ValueError("400 Request contains an invalid argument.")
+        return super().generate(prompt, handle, **kwargs)
+
+
+def test_chunks_long_documents_and_merges_partials(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend, chunk_tokens=300, chunk_overlap_tokens=20, long_document_tokens=500)
+    chunks = analyzer.chunker.chunk(long_document())
+    assert len(chunks) > 1
+
+    results = analyzer.long_document_analysis(long_document(), ['summary'])
+
+    assert set(results) == {'summary'}
+    assert results['summary'] and not is_analysis_error(results['summary'])
+    # Every chunk is mapped, then at least one reduce merges them
+    assert len(backend.calls) > len(chunks)
+
+
+def test_reduce_terminates_when_partials_exceed_half_the_budget(make_analyzer):
+    # Every response is larger than the whole chunk budget, so no two untrimmed partials fit together
+    backend = MockBackend(output_tokens=600)
+    analyzer = make_analyzer(backend, chunk_tokens=300, chunk_overlap_tokens=20, long_document_tokens=500)
+
+    partials = [backend.generate(f"partial {i}") for i in range(25)]
+    assert all(estimate_tokens(partial) > analyzer.chunker.max_tokens for partial in partials)
+
+    merged = analyzer._collapse_partials('summary', partials)
+
+    assert estimate_tokens(merged) <= analyzer.chunker.max_tokens
+    assert analyzer.long_document_analysis(long_document(), ['summary'])['summary']
+
+
+def test_failed_chunks_are_reported_not_dropped(make_analyzer):
+    backend = FailingPartBackend("[Part 2 of ")
+    analyzer = make_analyzer(backend, chunk_tokens=300, chunk_overlap_tokens=20, long_document_tokens=500)
+    total = len(analyzer.chunker.chunk(long_document()))
+    get_tracer().reset()
+
+    result = analyzer.long_document_analysis(long_document(), ['summary'])['summary']
+
+    assert result.startswith(f"Incomplete analysis: 1 of {total} parts of the document could not be analyzed")
+    assert is_analysis_error(result)
+    map_spans = [current for current in get_tracer().recent_spans() if current.name == 'map_chunks']
+    assert map_spans and map_spans[-1].attributes['failed_chunks'] == 1
+
+
+def test_stream_reports_failed_chunks_first(make_analyzer):
+    backend = FailingPartBackend("[Part 2 of ")
+    analyzer = make_analyzer(backend, chunk_tokens=300, chunk_overlap_tokens=20, long_document_tokens=500)
+
+    streamed = "".join(analyzer.analyze_document_stream(long_document(), 'summary'))
+
+    assert streamed.startswith("Incomplete analysis: 1 of ")
+
+
+def test_small_prompt_budgets_shrink_chunks_and_overlap_together(make_analyzer):
+    budget = TokenBudget(max_prompt_tokens=1200)
+    analyzer = make_analyzer(MockBackend(), chunk_tokens=8000, chunk_overlap_tokens=600, token_budget=budget)
+
+    assert 0 <= analyzer.chunker.overlap_tokens < analyzer.chunker.max_tokens
+    chunks = analyzer.chunker.chunk(long_document())
+    template_tokens = max(estimate_tokens(template) for template in analyzer.prompts.values())
+    assert all(chunk.token_estimate + template_tokens <= budget.max_prompt_tokens for chunk in chunks)
+    assert analyzer.long_document_analysis(long_document(), ['summary'])['summary']
@@ -0,0 +1,113 @@
+"""
+Tests for pinning documents in the backend's context
+"""
+import time
+
+from src.utils.llm_backends import PINNED_DOCUMENT_REFERENCE, MockBackend
+
+DOCUMENT = "\n\n".join(
+    f"SECTION {i}. PAYMENT\nThe Tenant shall pay the monthly rent of ${1000 + i} on the first day of each month "
+    f"and keep the premises in good repair." for i in range(1, 30)
+) + "\n\nSECTION 30. PETS\nNo pets may be kept on the premises without the Landlord's written consent."
+
+
+class RecordingBackend(MockBackend):
+    """Mock backend that also keeps every prompt and released handle"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompts = []
+        self.released = []
+
+    def generate(self, prompt, handle=None, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate(prompt, handle, **kwargs)
+
+    def generate_stream(self, prompt, handle=None, **kwargs):
+        self.prompts.append(prompt)
+        return super().generate_stream(prompt, handle, **kwargs)
+
+    def release_document(self, handle):
+        self.released.append(handle.name)
+        super().release_document(handle)
+
+
+def pinning_analyzer(make_analyzer, backend, **kwargs):
+    analyzer = make_analyzer(backend, **kwargs)
+    analyzer.pin_documents = True
+    analyzer.pin_min_tokens = 50
+    return analyzer
+
+
+def pins(backend):
+    return [call for call in backend.calls if call['kind'] == 'pin']
+
+
+def test_sections_mode_pins_the_document_once(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend, analysis_mode='sections')
+
+    analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert len(pins(backend)) == 1
+    assert all(call['handle'] for call in backend.calls if call['kind'] == 'generate')
+
+
+def test_combined_mode_sends_the_document_inline(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend, analysis_mode='combined')
+
+    analyzer.analyze_with_document_type(DOCUMENT)
+
+    assert not pins(backend)
+    assert any("No pets may be kept" in prompt for prompt in backend.prompts)
+
+
+def test_chat_on_a_pinned_document_still_quotes_the_retrieved_clauses(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend)
+
+    analyzer.answer_question(DOCUMENT, "Can I keep pets?", analyzer.build_clause_index(DOCUMENT))
+
+    prompt = backend.prompts[-1]
+    assert PINNED_DOCUMENT_REFERENCE in prompt
+    assert "No pets may be kept" in prompt
+    assert backend.calls[-1]['handle']
+
+
+def test_expired_handles_are_released(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend)
+    handle = analyzer.pin_document(DOCUMENT)
+    handle.expires_at = time.time()
+
+    renewed = analyzer.pin_document(DOCUMENT)
+
+    assert backend.released == [handle.name]
+    assert renewed is not handle and not renewed.expired
+
+
+def test_least_recently_used_handles_beyond_the_cap_are_released(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend)
+    analyzer.pin_max_documents = 2
+    documents = [DOCUMENT + f"\n\nSECTION {31 + i}. NOTICES\nNotice {i}." for i in range(3)]
+
+    handles = [analyzer.pin_document(document) for document in documents]
+
+    assert backend.released == [handles[0].name]
+    assert len(analyzer._handles) == 2
+
+
+def test_released_documents_wait_for_requests_in_flight(make_analyzer):
+    backend = RecordingBackend()
+    analyzer = pinning_analyzer(make_analyzer, backend, analysis_mode='sections')
+    stream = analyzer.analyze_document_stream(DOCUMENT, 'summary')
+    first = next(stream)
+
+    analyzer.release_document(DOCUMENT)
+    assert not backend.released
+    rest = "".join(stream)
+
+    assert first and rest
+    assert len(backend.released) == 1
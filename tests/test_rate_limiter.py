@@ -0,0 +1,84 @@
+"""
+Tests for the quota rate limiter
+"""
+import pytest
+
+from src.utils.rate_limiter import QuotaExhaustedError, QuotaRateLimiter, TokenBucket
+
+
+def unlimited(**kwargs) -> QuotaRateLimiter:
+    kwargs.setdefault('base_delay', 0.0)
+    return QuotaRateLimiter(requests_per_minute=None, requests_per_day=None, tokens_per_minute=None, **kwargs)
+
+
+def test_bucket_waits_for_refill_once_empty():
+    bucket = TokenBucket(2, 60)
+
+    assert bucket.wait_time(2) == 0
+    bucket.consume(2)
+
+    assert bucket.wait_time(1) == pytest.approx(30, abs=0.1)
+
+
+def test_requests_beyond_the_budget_are_rejected_after_max_wait():
+    limiter = QuotaRateLimiter(requests_per_minute=1, requests_per_day=None, tokens_per_minute=None, max_wait=0.05)
+    limiter.acquire()
+
+    with pytest.raises(QuotaExhaustedError):
+        limiter.acquire()
+    assert limiter.metrics()['rejected'] == 1
+
+
+def test_token_budget_limits_large_requests():
+    limiter = QuotaRateLimiter(requests_per_minute=None, requests_per_day=None, tokens_per_minute=1000, max_wait=0.05)
+    limiter.acquire(tokens=900)
+
+    with pytest.raises(QuotaExhaustedError):
+        limiter.acquire(tokens=500)
+
+
+def test_rate_limit_errors_are_retried():
+    limiter = unlimited(max_retries=3)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+        return "ok"
+
+    assert limiter.call(call) == "ok"
+    assert limiter.metrics()['retries'] == 2
+    assert limiter.metrics()['rate_limit_errors'] == 2
+
+
+def test_other_errors_are_not_retried():
+    limiter = unlimited(max_retries=3)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ValueError("400 Request contains an invalid argument.")
+
+    with pytest.raises(ValueError):
+        limiter.call(call)
+    assert len(attempts) == 1
+
+
+def test_retries_stop_after_max_retries():
+    limiter = unlimited(max_retries=2)
+
+    def call():
+        raise RuntimeError("503 The model is overloaded. Please try again later.")
+
+    with pytest.raises(RuntimeError):
+        limiter.call(call)
+    assert limiter.metrics()['transient_errors'] == 3
+
+
+def test_backoff_honours_the_server_retry_delay():
+    limiter = unlimited(base_delay=0.01, max_delay=60)
+
+    delay = limiter.backoff_delay(0, RuntimeError("429 Quota exceeded. Please retry in 7.5s."))
+
+    assert delay == pytest.approx(7.5)
@@ -0,0 +1,124 @@
+"""
+Tests for the response cache
+"""
+import pytest
+
+from src.utils import ai_analyzer
+from src.utils.ai_analyzer import ResponseCache, is_analysis_error
+from src.utils.llm_backends import MockBackend
+
+
+class Clock:
+    """Stands in for the time module so entries age on demand"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ai_analyzer, 'time', clock)
+    return clock
+
+
+def test_keys_depend_on_every_part_of_the_request():
+    key = ResponseCache.make_key("model", "template", "document", "question")
+
+    assert key == ResponseCache.make_key("model", "template", "document", "question")
+    assert key != ResponseCache.make_key("other-model", "template", "document", "question")
+    assert key != ResponseCache.make_key("model", "other template", "document", "question")
+    assert key != ResponseCache.make_key("model", "template", "other document", "question")
+    assert key != ResponseCache.make_key("model", "template", "document", "other question")
+    # Moving text between parts must not produce the same key
+    assert ResponseCache.make_key("model", "ab", "c") != ResponseCache.make_key("model", "a", "bc")
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = ResponseCache(':memory:', max_entries=2)
+    cache.put("a", "first")
+    clock.now += 1
+    cache.put("b", "second")
+    clock.now += 1
+    assert cache.get("a") == "first"
+    clock.now += 1
+
+    cache.put("c", "third")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "first" and cache.get("c") == "third"
+
+
+def test_size_cap_evicts_and_skips_oversized_values(clock):
+    cache = ResponseCache(':memory:', max_bytes=10)
+    cache.put("a", "123456")
+    clock.now += 1
+    cache.put("b", "abcdef")
+    cache.put("huge", "x" * 11)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "abcdef"
+    assert cache.get("huge") is None
+    assert cache.stats()['bytes'] == 6
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(':memory:', ttl_seconds=60)
+    cache.put("a", "fresh")
+    clock.now += 59
+    assert cache.get("a") == "fresh"
+
+    clock.now += 2
+
+    assert cache.get("a") is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_hits_and_misses_are_counted():
+    cache = ResponseCache(':memory:')
+    cache.put("a", "value")
+
+    cache.get("a")
+    cache.get("missing")
+
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_repeated_requests_are_served_from_the_cache(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend, response_cache=ResponseCache(':memory:'))
+
+    first = analyzer.analyze_document("The Tenant shall pay rent monthly.", 'summary')
+    second = analyzer.analyze_document("The Tenant shall pay rent monthly.", 'summary')
+
+    assert first == second
+    assert len(backend.calls) == 1
+
+
+def test_error_responses_are_not_cached(make_analyzer):
+    cache = ResponseCache(':memory:')
+    failing = make_analyzer(MockBackend(error_rate=1.0), response_cache=cache)
+
+    result = failing.analyze_document("The Tenant shall pay rent monthly.", 'summary')
+
+    assert is_analysis_error(result)
+    assert cache.stats()['entries'] == 0
+    healthy = MockBackend()
+    recovered = make_analyzer(healthy, response_cache=cache)
+    assert not is_analysis_error(recovered.analyze_document("The Tenant shall pay rent monthly.", 'summary'))
+    assert len(healthy.calls) == 1
+
+
+def test_empty_responses_are_not_cached(make_analyzer):
+    class EmptyBackend(MockBackend):
+        def generate(self, prompt, handle=None, **kwargs):
+            super().generate(prompt, handle, **kwargs)
+            return ""
+
+    cache = ResponseCache(':memory:')
+    make_analyzer(EmptyBackend(), response_cache=cache).analyze_document("The Tenant shall pay rent.", 'summary')
+
+    assert cache.stats()['entries'] == 0
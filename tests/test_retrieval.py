@@ -0,0 +1,69 @@
+"""
+Tests for clause-level BM25 retrieval
+"""
+from src.utils.retrieval import ClauseIndex, split_clauses, tokenize
+
+LEASE = """RESIDENTIAL LEASE AGREEMENT
+
+This lease is made between the Landlord and the Tenant.
+
+1. RENT
+The Tenant shall pay rent of $1,200 on the first day of each month.
+
+2. SECURITY DEPOSIT
+A security deposit of $2,400 is due before the Tenant moves in. The deposit is returned within 30 days of move-out.
+
+3. PETS
+No pets are allowed without written consent of the Landlord.
+
+4. TERMINATION
+Either party may terminate this lease with 60 days written notice.
+"""
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Tenant shall pay THE rent") == ["tenant", "pay", "rent"]
+
+
+def test_clauses_keep_their_section():
+    clauses = split_clauses(LEASE)
+
+    deposit = next(clause for clause in clauses if "security deposit of" in clause.text)
+    assert deposit.section == "2. SECURITY DEPOSIT"
+    assert LEASE[deposit.start:deposit.end].strip() == deposit.text
+
+
+def test_long_paragraphs_are_split_between_sentences():
+    paragraph = "The tenant pays rent on time. " * 100
+
+    clauses = split_clauses(paragraph, max_chars=200)
+
+    assert len(clauses) > 1
+    assert all(len(clause.text) <= 200 and clause.text.endswith(".") for clause in clauses)
+
+
+def test_search_ranks_the_relevant_clause_first():
+    index = ClauseIndex(LEASE)
+
+    results = index.search("When do I get my deposit back?", top_k=3)
+
+    assert results[0][0].section == "2. SECURITY DEPOSIT"
+    assert all(score > 0 for _, score in results)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_omits_clauses_without_overlap():
+    assert ClauseIndex(LEASE).search("zebra") == []
+
+
+def test_context_falls_back_to_the_opening_clauses():
+    context = ClauseIndex(LEASE).build_context("zebra", top_k=2)
+
+    assert context.startswith("[Section: RESIDENTIAL LEASE AGREEMENT]")
+    assert "No pets" not in context
+
+
+def test_context_lists_matches_in_document_order():
+    context = ClauseIndex(LEASE).build_context("terminate lease pets", top_k=2)
+
+    assert context.index("No pets") < context.index("terminate this lease")
@@ -0,0 +1,100 @@
+"""
+Tests for re-analyzing a revised document from its changes
+"""
+from src.utils.llm_backends import MockBackend
+from src.utils.template_index import ClauseChange
+
+LEASE = """RESIDENTIAL LEASE AGREEMENT
+
+1. RENT
+The Tenant shall pay the monthly rent of $1,200 on the first day of each month.
+A late fee of $50 is charged for rent paid after the fifth day of the month.
+
+2. DEPOSIT
+The Tenant shall pay a security deposit of $1,200 before moving in.
+The deposit is returned within thirty days after the lease ends.
+
+3. MAINTENANCE
+The Landlord shall keep the roof, plumbing and heating in good repair.
+The Tenant shall keep the premises clean and report damage promptly.
+
+4. TERMINATION
+Either party may end this lease with sixty days of written notice."""
+
+PREVIOUS_RESULTS = {name: f"Earlier {name}." for name in ('summary', 'key_terms', 'risks', 'plain_english',
+                                                          'action_items')}
+
+
+class FailingPatchBackend(MockBackend):
+    """Mock backend whose patch calls fail"""
+
+    def generate(self, prompt, handle=None, **kwargs):
+        if "Earlier analysis and changed lines:" in prompt:
+            raise ValueError("503 The model is overloaded. Please try again later.")
+        return super().generate(prompt, handle, **kwargs)
+
+
+def generate_calls(backend):
+    return [call for call in backend.calls if call['kind'] == 'generate']
+
+
+def test_unchanged_documents_reuse_the_analysis_without_calls(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend)
+
+    revision = analyzer.revision_analysis(LEASE, "Rental Agreement", PREVIOUS_RESULTS, LEASE)
+
+    assert revision.changes == []
+    assert revision.doc_type == "Rental Agreement" and revision.results == PREVIOUS_RESULTS
+    assert not backend.calls
+
+
+def test_small_revisions_are_patched_with_one_call(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend)
+    revised = LEASE.replace("A late fee of $50", "A late fee of $500")
+
+    revision = analyzer.revision_analysis(LEASE, "Rental Agreement", PREVIOUS_RESULTS, revised)
+
+    assert revision.incremental
+    assert revision.changes == [ClauseChange(
+        "1. RENT",
+        "A late fee of $50 is charged for rent paid after the fifth day of the month.",
+        "A late fee of $500 is charged for rent paid after the fifth day of the month."
+    )]
+    assert len(generate_calls(backend)) == 1
+    assert revision.what_changed.startswith("what_changed: ")
+    assert set(revision.results) == set(PREVIOUS_RESULTS)
+
+
+def test_patchable_changes_gives_up_on_large_rewrites(make_analyzer):
+    analyzer = make_analyzer(MockBackend())
+    rewritten = "\n".join(line[::-1] for line in LEASE.splitlines())
+
+    assert analyzer.patchable_changes(LEASE, LEASE) == []
+    assert analyzer.patchable_changes(LEASE, rewritten) is None
+
+
+def test_large_rewrites_are_analyzed_in_full(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+    rewritten = "\n".join(line[::-1] for line in LEASE.splitlines())
+
+    revision = analyzer.revision_analysis(LEASE, "Rental Agreement", PREVIOUS_RESULTS, rewritten)
+
+    assert not revision.incremental
+    assert revision.changes
+    assert len(generate_calls(backend)) >= len(PREVIOUS_RESULTS)
+    assert all(result.startswith("Mock response") for result in revision.results.values())
+
+
+def test_a_failed_patch_falls_back_to_a_full_analysis(make_analyzer):
+    backend = FailingPatchBackend()
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+    revised = LEASE.replace("A late fee of $50", "A late fee of $500")
+
+    revision = analyzer.revision_analysis(LEASE, "Rental Agreement", PREVIOUS_RESULTS, revised)
+
+    assert not revision.incremental
+    assert len(revision.changes) == 1
+    assert all(result.startswith("Mock response") for result in revision.results.values())
@@ -0,0 +1,58 @@
+"""
+Tests for the local red-flag scan
+"""
+from src.utils.risk_scanner import RISK_PATTERNS, SEVERITIES, scan_red_flags, scan_risks
+
+
+def flag_names(text: str):
+    return [flag.name for flag in scan_red_flags(text)]
+
+
+def test_finds_risky_clauses_in_the_sample_loan():
+    with open("data/sample_documents/sample_loan_agreement.txt", encoding='utf-8') as file:
+        names = set(flag_names(file.read()))
+
+    assert {'late_fee', 'acceleration', 'fee_shifting'} <= names
+
+
+def test_flags_are_ordered_by_severity():
+    flags = scan_red_flags("A late fee applies. The Borrower shall indemnify the Lender. "
+                           "Attorney's fees are payable. A second late fee applies.")
+
+    assert [flag.name for flag in flags] == ['indemnification', 'late_fee', 'fee_shifting']
+    assert [SEVERITIES.index(flag.severity) for flag in flags] == sorted(SEVERITIES.index(flag.severity)
+                                                                         for flag in flags)
+    assert flags[1].count == 2
+
+
+def test_phrases_only_match_at_word_starts():
+    assert flag_names("The template fee is waived.") == []
+    assert flag_names("Any late fee is waived.") == ['late_fee']
+
+
+def test_matching_ignores_case_and_reports_original_offsets():
+    text = "Notice. THE TENANT WAIVES A JURY TRIAL."
+
+    hits = scan_risks(text)
+
+    assert [hit.name for hit in hits] == ['jury_waiver']
+    assert text[hits[0].start:hits[0].end] == "WAIVES A JURY TRIAL"
+
+
+def test_offsets_stay_valid_when_lowercasing_changes_length():
+    # "İ" lowercases to two characters
+    text = "İİİ The agreement renews automatically each year."
+
+    hits = scan_risks(text)
+
+    assert text[hits[0].start:hits[0].end] == "renews automatically"
+
+
+def test_excerpts_show_the_surrounding_sentence():
+    flags = scan_red_flags("Rent is due monthly. This lease renews automatically unless cancelled. Pets are allowed.")
+
+    assert flags[0].excerpts == ["This lease renews automatically unless cancelled."]
+
+
+def test_every_pattern_has_a_known_severity():
+    assert all(pattern.severity in SEVERITIES and pattern.phrases for pattern in RISK_PATTERNS)
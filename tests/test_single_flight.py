@@ -0,0 +1,87 @@
+"""
+Tests for single-flight coalescing
+"""
+import threading
+import time
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def run_together(group: SingleFlight, key: str, func, callers: int = 4):
+    """Call group.do from several threads while the first call is still running"""
+    results, errors = [], []
+
+    def caller():
+        try:
+            results.append(group.do(key, func))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_identical_calls_run_once():
+    group = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "analysis"
+
+    threads, results, errors = run_together(group, "doc", work)
+    while group.stats['calls'] + group.stats['shared'] < len(threads):
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["analysis"] * len(threads)
+    assert not errors
+    assert len(calls) == 1
+    assert group.stats == {'calls': 1, 'shared': len(threads) - 1}
+    assert group.in_flight() == 0
+
+
+def test_errors_reach_every_waiting_caller():
+    group = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(5)
+        raise RuntimeError("model unavailable")
+
+    threads, results, errors = run_together(group, "doc", work)
+    while group.stats['calls'] + group.stats['shared'] < len(threads):
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not results
+    assert len(errors) == len(threads)
+
+
+def test_finished_calls_are_not_reused():
+    group = SingleFlight()
+    calls = []
+
+    group.do("doc", lambda: calls.append(1))
+    group.do("doc", lambda: calls.append(1))
+
+    assert len(calls) == 2
+
+
+def test_different_keys_do_not_share():
+    group = SingleFlight()
+
+    assert group.do("a", lambda: 1) == 1
+    assert group.do("b", lambda: 2) == 2
+    with pytest.raises(KeyError):
+        group.do("c", lambda: {}["missing"])
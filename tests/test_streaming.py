@@ -0,0 +1,66 @@
+"""
+Tests for streaming analyses and chat answers
+"""
+import time
+
+from src.utils.ai_analyzer import is_analysis_error
+from src.utils.llm_backends import LatencyDistribution, MockBackend
+
+DOCUMENT = ("RESIDENTIAL LEASE AGREEMENT\n\nThe Tenant shall pay the monthly rent of $1,200 on the first day of "
+            "each month. The Landlord shall keep the premises in good repair.")
+
+
+def test_first_chunk_arrives_before_the_section_completes(make_analyzer):
+    backend = MockBackend(latency=LatencyDistribution.fixed(0.1), tokens_per_second=200, output_tokens=80)
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+
+    start = time.perf_counter()
+    doc_type_stream, section_streams = analyzer.stream_analysis_with_document_type(DOCUMENT)
+    summary = section_streams['summary']
+    first = next(summary)
+    first_chunk = time.perf_counter() - start
+    rest = "".join(summary)
+    completed = time.perf_counter() - start
+
+    assert first and rest
+    assert first_chunk < completed / 2
+
+
+def test_streamed_sections_match_the_full_analysis(make_analyzer):
+    analyzer = make_analyzer(MockBackend(), analysis_mode='sections')
+
+    doc_type_stream, section_streams = analyzer.stream_analysis_with_document_type(DOCUMENT)
+    streamed = {name: "".join(stream) for name, stream in section_streams.items()}
+
+    assert streamed == analyzer.comprehensive_analysis(DOCUMENT)
+    assert "".join(doc_type_stream) == analyzer.get_document_type(DOCUMENT)
+
+
+def test_sections_stream_at_the_same_time(make_analyzer):
+    backend = MockBackend(latency=LatencyDistribution.fixed(0.2))
+    analyzer = make_analyzer(backend, analysis_mode='sections')
+
+    start = time.perf_counter()
+    doc_type_stream, section_streams = analyzer.stream_analysis_with_document_type(DOCUMENT)
+    for stream in section_streams.values():
+        "".join(stream)
+
+    assert time.perf_counter() - start < 3 * 0.2
+
+
+def test_a_failed_stream_keeps_its_partial_output(make_analyzer):
+    analyzer = make_analyzer(MockBackend(error_rate=1.0, error_messages=["429 Resource has been exhausted"]))
+
+    chunks = list(analyzer.analyze_document_stream(DOCUMENT, 'summary'))
+
+    assert len(chunks) > 1
+    assert chunks[-1].startswith("\n\n") and is_analysis_error(chunks[-1].lstrip())
+
+
+def test_chat_answers_stream(make_analyzer):
+    analyzer = make_analyzer(MockBackend())
+
+    chunks = list(analyzer.answer_question_stream(DOCUMENT, "When is rent due?"))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == analyzer.answer_question(DOCUMENT, "When is rent due?")
@@ -0,0 +1,93 @@
+"""
+Tests for the MinHash template index and the patience diff
+"""
+import sqlite3
+
+from src.utils.template_index import (
+    DEFAULT_SIMILARITY, UNSTORED_WORDING, TemplateIndex, clause_changes, fingerprint_changes,
+    minhash_signature, sentence_fingerprints, signature_similarity
+)
+
+LEASE = "\n\n".join([
+    "1. PARTIES\nThis lease is made between Jane Smith (Landlord) and John Doe (Tenant).",
+    "2. RENT\nThe Tenant shall pay rent of $1,200 per month. Rent is due on the first day of each month.",
+    "3. DEPOSIT\nThe Tenant shall pay a security deposit of $2,400 before moving in.",
+    "4. PETS\nNo pets are allowed on the premises without the written consent of the Landlord.",
+    "5. TERM\nThe lease begins on March 1, 2024 and ends on February 28, 2025.",
+    "6. REPAIRS\nThe Landlord shall keep the roof, plumbing and heating in good repair at all times.",
+    "7. UTILITIES\nThe Tenant shall pay for electricity, gas, water and internet service during the term.",
+    "8. NOTICES\nAll notices under this lease must be in writing and delivered by hand or by mail.",
+] * 3)
+
+
+def test_similar_documents_have_similar_signatures():
+    variant = LEASE.replace("$1,200", "$1,350")
+    unrelated = "The purchaser agrees to buy the vehicle described below for the agreed price. " * 20
+
+    assert signature_similarity(minhash_signature(LEASE), minhash_signature(LEASE)) == 1.0
+    assert signature_similarity(minhash_signature(LEASE), minhash_signature(variant)) >= DEFAULT_SIMILARITY
+    assert signature_similarity(minhash_signature(LEASE), minhash_signature(unrelated)) < 0.2
+
+
+def test_clause_changes_find_changed_sentences_only():
+    revised = LEASE.replace("rent of $1,200 per month", "rent of $1,350 per month", 1)
+
+    changes = clause_changes(LEASE, revised)
+
+    assert len(changes) == 1
+    assert changes[0].section.startswith("2. RENT")
+    assert changes[0].before == "The Tenant shall pay rent of $1,200 per month."
+    assert changes[0].after == "The Tenant shall pay rent of $1,350 per month."
+
+
+def test_clause_changes_report_additions_and_removals():
+    added = LEASE + "\n\n9. PARKING\nOne parking space is included."
+    removed = LEASE.replace("No pets are allowed on the premises without the written consent of the Landlord.", "", 1)
+
+    assert [change.before for change in clause_changes(LEASE, added)] == ['']
+    assert [change.after for change in clause_changes(LEASE, removed)] == ['']
+
+
+def test_fingerprint_changes_never_need_the_earlier_text():
+    revised = LEASE.replace("rent of $1,200 per month", "rent of $1,350 per month", 1)
+
+    changes = fingerprint_changes(sentence_fingerprints(LEASE), revised)
+
+    assert len(changes) == 1
+    assert changes[0].before == UNSTORED_WORDING
+    assert changes[0].after == "The Tenant shall pay rent of $1,350 per month."
+
+
+def test_index_finds_near_duplicates_without_storing_text(tmp_path):
+    path = str(tmp_path / "templates.sqlite3")
+    index = TemplateIndex(path)
+    index.add(LEASE, "mock-model", "Rental Agreement", {'summary': "A lease."})
+
+    match = index.find(LEASE.replace("$2,400", "$2,500"), "mock-model")
+
+    assert match is not None and match.results == {'summary': "A lease."}
+    assert match.fingerprints == sentence_fingerprints(LEASE)
+    assert index.find(LEASE, "other-model") is None
+    with sqlite3.connect(path) as conn:
+        stored = b"".join(str(value).encode() for row in conn.execute("SELECT * FROM templates") for value in row)
+    assert b"Jane Smith" not in stored
+
+
+def test_index_drops_text_stored_by_earlier_versions(tmp_path):
+    path = str(tmp_path / "templates.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE documents (id INTEGER PRIMARY KEY, document_text TEXT)")
+        conn.execute("INSERT INTO documents (document_text) VALUES ('Jane Smith lease')")
+
+    TemplateIndex(path)
+
+    with sqlite3.connect(path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'documents' not in tables
+
+
+def test_template_reuse_is_opt_in(monkeypatch):
+    from src.utils import template_index
+
+    monkeypatch.delenv('TEMPLATE_REUSE', raising=False)
+    assert template_index.get_default_template_index() is None
@@ -0,0 +1,52 @@
+"""
+Tests for encoding detection and document statistics
+"""
+import codecs
+
+from src.utils.text_stats import compute_text_stats, decode_text, detect_encoding
+
+TEXT = "Le loyer de 1 200 € est dû le 1er du mois."
+
+
+def test_byte_order_marks_win():
+    assert detect_encoding(codecs.BOM_UTF8 + b"rent") == 'utf-8-sig'
+    assert detect_encoding(codecs.BOM_UTF16_LE + "rent".encode('utf-16-le')) == 'utf-16'
+    assert detect_encoding(codecs.BOM_UTF32_LE + "rent".encode('utf-32-le')) == 'utf-32'
+
+
+def test_utf16_without_a_bom_is_detected_from_nul_bytes():
+    assert detect_encoding("The tenant pays rent.".encode('utf-16-le')) == 'utf-16-le'
+    assert detect_encoding("The tenant pays rent.".encode('utf-16-be')) == 'utf-16-be'
+
+
+def test_decoding_falls_back_from_utf8_to_cp1252():
+    assert decode_text(TEXT.encode('utf-8')) == (TEXT, 'utf-8')
+    assert decode_text(TEXT.encode('cp1252')) == (TEXT, 'cp1252')
+
+
+def test_decoding_never_fails():
+    text, encoding = decode_text(bytes([0x81, 0x8d, 0x8f]))
+
+    assert encoding == 'latin-1'
+    assert len(text) == 3
+
+
+def test_decodes_memoryviews():
+    assert decode_text(memoryview(TEXT.encode('utf-8')))[0] == TEXT
+
+
+def test_stats_count_words_sentences_and_clauses():
+    stats = compute_text_stats("The tenant pays rent. The landlord: repairs the roof; and the heating!\nEnd")
+
+    assert stats.words == 13
+    assert stats.lines == 2
+    assert stats.sentences == 3
+    assert stats.clauses == 5
+
+
+def test_stats_are_the_same_for_streamed_text():
+    text = "The tenant pays rent. " * 50 + "Done"
+
+    streamed = compute_text_stats(text[i:i + 7] for i in range(0, len(text), 7))
+
+    assert streamed == compute_text_stats(text)
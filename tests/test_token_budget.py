@@ -0,0 +1,76 @@
+"""
+Tests for pre-flight token budgets
+"""
+import pytest
+
+from src.utils.ai_analyzer import is_analysis_error
+from src.utils.llm_backends import MockBackend
+from src.utils.token_budget import TokenBudget, TokenBudgetExceeded, TokenUsage, truncate_to_tokens
+
+
+def test_requests_over_the_prompt_limit_are_refused():
+    budget = TokenBudget(max_prompt_tokens=100)
+
+    with pytest.raises(TokenBudgetExceeded, match="single request"):
+        budget.reserve(101)
+
+    assert budget.metrics()['rejected'] == 1
+
+
+def test_reservations_hold_back_tokens_until_settled():
+    budget = TokenBudget(max_prompt_tokens=None, max_total_tokens=1000, output_tokens=100)
+
+    first = budget.reserve(400)
+    assert budget.remaining() == 500
+    # Concurrent calls cannot overshoot the session budget together
+    with pytest.raises(TokenBudgetExceeded, match="session budget"):
+        budget.reserve(450)
+
+    budget.settle(first, 400, TokenUsage(380, 60))
+
+    assert budget.used == 440
+    assert budget.remaining() == 560
+    assert budget.reserve(450) == 550
+
+
+def test_failed_calls_release_their_reservation_without_charging():
+    budget = TokenBudget(max_prompt_tokens=None, max_total_tokens=1000)
+
+    budget.settle(budget.reserve(500, output_tokens=0), 500, None)
+
+    assert budget.used == 0 and budget.remaining() == 1000
+    assert budget.metrics()['calls'] == 0
+
+
+def test_metrics_compare_reported_with_estimated_input():
+    budget = TokenBudget()
+    budget.settle(budget.reserve(100), 100, TokenUsage(110, 20))
+    budget.settle(budget.reserve(100), 100, TokenUsage(90, 20, exact=False))
+
+    metrics = budget.metrics()
+
+    assert metrics['calls'] == 2 and metrics['exact_calls'] == 1
+    assert metrics['estimate_ratio'] == pytest.approx(1.1)
+    assert metrics['used_tokens'] == 240
+
+
+def test_exact_counts_are_only_needed_near_the_limit():
+    budget = TokenBudget(max_prompt_tokens=1000)
+
+    assert not budget.needs_exact_count(800)
+    assert budget.needs_exact_count(950)
+    assert not TokenBudget(max_prompt_tokens=None).needs_exact_count(10 ** 9)
+
+
+def test_truncate_to_tokens_keeps_the_opening():
+    assert truncate_to_tokens("abcdefghij", 2) == "abcdefgh"
+
+
+def test_analysis_over_the_session_budget_is_refused_before_sending(make_analyzer):
+    backend = MockBackend()
+    analyzer = make_analyzer(backend, token_budget=TokenBudget(max_total_tokens=50))
+
+    result = analyzer.analyze_document("The Tenant shall pay rent monthly. " * 20, 'summary')
+
+    assert is_analysis_error(result) and result.startswith("Token budget exceeded:")
+    assert not backend.calls
@@ -0,0 +1,90 @@
+"""
+Tests for tracing spans and the Prometheus export
+"""
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.utils.tracing import Tracer, start_metrics_server
+
+
+def test_nested_spans_are_each_recorded_inside_their_parent():
+    tracer = Tracer(buckets=(0.01, 1.0))
+
+    with tracer.span('analyze', mode='sections') as outer:
+        with tracer.span('model_call') as inner:
+            inner.set_attribute('cache_hit', False)
+            time.sleep(0.02)
+        outer.set_attribute('sections', 5)
+
+    recorded = tracer.recent_spans()
+    assert [current.name for current in recorded] == ['model_call', 'analyze']
+    assert recorded[0].start >= recorded[1].start
+    assert recorded[1].duration >= recorded[0].duration >= 0.02
+    assert recorded[1].attributes == {'mode': 'sections', 'sections': 5}
+
+
+def test_errors_are_recorded_and_reraised():
+    tracer = Tracer()
+
+    with pytest.raises(ValueError):
+        with tracer.span('process_document'):
+            raise ValueError("bad file")
+
+    assert tracer.recent_spans()[-1].error == 'ValueError'
+    assert tracer.summary()['process_document']['errors'] == 1
+
+
+def test_prometheus_histograms_are_cumulative():
+    tracer = Tracer(buckets=(0.01, 1.0))
+    with tracer.span('model_call', cache_hit=True):
+        pass
+    with tracer.span('model_call'):
+        time.sleep(0.02)
+
+    text = tracer.prometheus_text()
+
+    assert '# TYPE legal_reader_span_duration_seconds histogram' in text
+    assert 'legal_reader_span_duration_seconds_bucket{span="model_call",le="0.01"} 1' in text
+    assert 'legal_reader_span_duration_seconds_bucket{span="model_call",le="1.0"} 2' in text
+    assert 'legal_reader_span_duration_seconds_bucket{span="model_call",le="+Inf"} 2' in text
+    assert 'legal_reader_span_duration_seconds_count{span="model_call"} 2' in text
+    assert 'legal_reader_span_errors_total{span="model_call"} 0' in text
+    assert 'legal_reader_span_cache_hits_total{span="model_call"} 1' in text
+
+
+def test_label_values_are_escaped():
+    tracer = Tracer()
+    with tracer.span('say "hi"\n'):
+        pass
+
+    assert 'span="say \\"hi\\"\\n"' in tracer.prometheus_text()
+
+
+def test_disabled_tracer_still_runs_the_block():
+    tracer = Tracer(enabled=False)
+
+    with tracer.span('extract') as current:
+        current.set_attribute('pages', 3)
+
+    assert current.attributes == {'pages': 3}
+    assert tracer.recent_spans() == [] and tracer.summary() == {}
+
+
+def test_metrics_server_serves_the_export():
+    tracer = Tracer()
+    with tracer.span('render'):
+        pass
+    server = start_metrics_server(0, tracer, host='127.0.0.1')
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode('utf-8') == tracer.prometheus_text()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.shutdown()
+        server.server_close()